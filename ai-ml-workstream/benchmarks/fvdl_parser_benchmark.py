@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the streaming FVDL parser (layers/fvdl_parser) against parsing the whole
+tree, as the Lambdas did before, on a large synthetic FVDL file.
+
+Reports the time and peak Python memory of each, and checks that they extract the same
+vulnerabilities. Requires defusedxml (pip install defusedxml==0.7.1).
+
+Example:
+    python3 benchmarks/fvdl_parser_benchmark.py --vulnerabilities 100000
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import defusedxml.ElementTree as ET
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FVDL_PARSER_DIR = os.path.join(BENCHMARKS_DIR, "..", "layers", "fvdl_parser", "python")
+sys.path.insert(0, FVDL_PARSER_DIR)
+
+from fvdl_parser import iter_vulnerabilities  # noqa: E402
+from fvdl_parser import parse_build  # noqa: E402
+from fvdl_parser import parse_vulnerability  # noqa: E402
+
+NAMESPACE = "xmlns://www.fortifysoftware.com/schema/fvdl"
+KINGDOMS = [
+    "Input Validation and Representation",
+    "API Abuse",
+    "Security Features",
+    "Code Quality",
+]
+TYPES = [
+    "Buffer Overflow",
+    "Format String",
+    "Unchecked Return Value",
+    "Memory Leak",
+    "Null Dereference",
+]
+
+VULNERABILITY = """    <Vulnerability>
+      <ClassInfo>
+        <ClassID>{class_id}</ClassID>
+        <Kingdom>{kingdom}</Kingdom>
+        <Type>{type}</Type>
+        <Subtype>Format String</Subtype>
+        <AnalyzerName>dataflow</AnalyzerName>
+        <DefaultSeverity>{default_severity}</DefaultSeverity>
+      </ClassInfo>
+      <InstanceInfo>
+        <InstanceID>{instance_id}</InstanceID>
+        <InstanceSeverity>{severity}</InstanceSeverity>
+        <Confidence>{confidence}</Confidence>
+      </InstanceInfo>
+      <AnalysisInfo>
+        <Unified>
+          <Context>
+            <Function name="{function}" namespace="" enclosingClass=""/>
+            <FunctionDeclarationSourceLocation path="src/{file}" line="{line}"
+              lineEnd="{line_end}" colStart="0" colEnd="0"/>
+          </Context>
+          <ReplacementDefinitions>
+            <Def key="PrimaryLocation.file" value="{file}"/>
+            <Def key="PrimaryLocation.line" value="{primary_line}"/>
+            <Def key="PrimaryCall.name" value="memcpy()"/>
+          </ReplacementDefinitions>
+          <Trace>
+            <Primary>
+{entries}            </Primary>
+          </Trace>
+        </Unified>
+      </AnalysisInfo>
+    </Vulnerability>
+"""
+ENTRY = """              <Entry>
+                <Node isDefault="true">
+                  <SourceLocation path="src/{file}" line="{line}" lineEnd="{line}"
+                    colStart="4" colEnd="0" contextId="{context_id}"
+                    snippet="{snippet}#{line}:{line}"/>
+                  <Action type="InCall">memcpy(0)</Action>
+                  <Reason>
+                    <Rule ruleID="{class_id}"/>
+                  </Reason>
+                </Node>
+              </Entry>
+"""
+SNIPPET = """    <Snippet id="{snippet}#{line}:{line}">
+      <File>src/{file}</File>
+      <StartLine>{start_line}</StartLine>
+      <EndLine>{end_line}</EndLine>
+      <Text><![CDATA[{text}]]></Text>
+    </Snippet>
+"""
+
+
+def write_fvdl(f, vulnerabilities, trace_entries, seed):
+    """
+    Writes a synthetic FVDL file with the sections of a real one: Build, Vulnerabilities
+    with their traces, and the snippets of the trace entries
+    """
+    rng = random.Random(seed)  # nosec B311
+    f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+    f.write(f'<FVDL xmlns="{NAMESPACE}" version="23.1">\n')
+    f.write('  <CreatedTS date="2024-06-01" time="12:00:00"/>\n')
+    f.write("  <Build>\n    <BuildID>synthetic</BuildID>\n")
+    f.write(f"    <NumberFiles>{vulnerabilities // 10 + 1}</NumberFiles>\n")
+    f.write("    <SourceBasePath>/home/builder/project</SourceBasePath>\n")
+    f.write('    <ScanTime value="3600"/>\n  </Build>\n')
+
+    f.write("  <Vulnerabilities>\n")
+    snippets = []
+    for i in range(vulnerabilities):
+        file = f"module{i % 97}/file{i % 1009}.c"
+        line = rng.randint(1, 5000)
+        entries = ""
+        for j in range(trace_entries):
+            snippet = f"{i:08X}{j:04X}"
+            entries += ENTRY.format(
+                file=file,
+                line=line + j,
+                context_id=j,
+                snippet=snippet,
+                class_id=f"{i % 50:032X}",
+            )
+            snippets.append((snippet, file, line + j))
+        f.write(
+            VULNERABILITY.format(
+                class_id=f"{i % 50:032X}",
+                kingdom=rng.choice(KINGDOMS),
+                type=rng.choice(TYPES),
+                default_severity=f"{rng.randint(1, 5)}.0",
+                instance_id=f"{rng.getrandbits(128):032X}",
+                severity=f"{rng.randint(1, 5)}.0",
+                confidence=f"{rng.randint(1, 5)}.0",
+                function=f"function_{i % 5003}",
+                file=file,
+                line=line,
+                line_end=line + 40,
+                primary_line=line + 3,
+                entries=entries,
+            ),
+        )
+    f.write("  </Vulnerabilities>\n")
+
+    f.write("  <Snippets>\n")
+    for snippet, file, line in snippets:
+        text = "\n".join(
+            f"    memcpy(buffer, input, length); /* line {n} */"
+            for n in range(line - 2, line + 3)
+        )
+        f.write(
+            SNIPPET.format(
+                snippet=snippet,
+                file=file,
+                line=line,
+                start_line=line - 2,
+                end_line=line + 2,
+                text=text,
+            ),
+        )
+    f.write("  </Snippets>\n</FVDL>\n")
+
+
+def parse_tree(file_path):
+    """
+    Parses the whole tree, then extracts the vulnerabilities from it.
+    Returns a digest of the vulnerabilities, their count and the Build information.
+    """
+    root = ET.parse(file_path).getroot()
+    namespace = root.tag[: root.tag.index("}") + 1] if "}" in root.tag else ""
+    build_elem = root.find(f".//{namespace}Build")
+    build_info = parse_build(build_elem, namespace) if build_elem is not None else {}
+    vuln_elems = root.findall(f".//{namespace}Vulnerabilities/{namespace}Vulnerability")
+    return (
+        digest(parse_vulnerability(elem, namespace) for elem in vuln_elems),
+        build_info,
+    )
+
+
+def parse_stream(file_path):
+    """
+    Consumes the vulnerabilities one at a time, as the Lambdas do.
+    Returns a digest of the vulnerabilities, their count and the Build information.
+    """
+    build_info = {}
+    return digest(iter_vulnerabilities(file_path, build_info)), build_info
+
+
+def digest(vulnerabilities):
+    sha256 = hashlib.sha256()
+    count = 0
+    for vuln_data in vulnerabilities:
+        sha256.update(json.dumps(vuln_data, sort_keys=True).encode())
+        count += 1
+    return sha256.hexdigest(), count
+
+
+def measure(parse, file_path):
+    """
+    Returns the result, time in seconds and peak Python memory in bytes of the parse.
+    The memory is traced in a second parse, as tracing slows it down.
+    """
+    started = time.perf_counter()
+    result = parse(file_path)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    parse(file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the streaming FVDL parser against whole-tree parsing",
+    )
+    parser.add_argument(
+        "--vulnerabilities",
+        type=int,
+        default=20000,
+        help="Number of vulnerabilities in the synthetic FVDL (default: 20000)",
+    )
+    parser.add_argument(
+        "--trace-entries",
+        type=int,
+        default=5,
+        help="Trace entries, and snippets, per vulnerability (default: 5)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file_path = os.path.join(tmpdir, "synthetic.fvdl")
+        with open(file_path, "w", encoding="utf-8") as f:
+            write_fvdl(f, args.vulnerabilities, args.trace_entries, args.seed)
+        size = os.path.getsize(file_path)
+        print(
+            f"Synthetic FVDL: {args.vulnerabilities} vulnerabilities, "
+            f"{size / 1024 / 1024:.1f} MiB",
+        )
+
+        (tree_digest, tree_build), tree_time, tree_peak = measure(parse_tree, file_path)
+        (stream_digest, stream_build), stream_time, stream_peak = measure(
+            parse_stream,
+            file_path,
+        )
+
+    print(f"{'Parser':<8} {'Time (s)':>10} {'Peak memory (MiB)':>18}")
+    print(f"{'tree':<8} {tree_time:>10.2f} {tree_peak / 1024 / 1024:>18.1f}")
+    print(f"{'stream':<8} {stream_time:>10.2f} {stream_peak / 1024 / 1024:>18.1f}")
+
+    if tree_digest != stream_digest or tree_build != stream_build:
+        print("❌ The parsers extracted different vulnerabilities")
+        return False
+    print(f"✅ Both parsers extracted the same {stream_digest[1]} vulnerabilities")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
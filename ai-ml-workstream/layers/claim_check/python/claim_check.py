@@ -0,0 +1,129 @@
+"""
+Claim-check for the payloads of the remediation state machine.
+
+Step Functions limits the data passed between states to 256 KB, which a source
+file, the findings of a project or an LLM response can exceed on its own. Large
+fields of a Lambda result are written to S3 and replaced by a reference, which
+the state machine passes along as is, and the Lambdas that receive a reference
+resolve it back to the value.
+
+A reference is a dict with a single 'claimCheck' key:
+    {"claimCheck": {"bucket": "...", "key": "claim-check/<sha256>.json", "size": 1234}}
+
+Objects are content-addressed, so identical values (e.g. codeBody and fixed_code)
+share an object, and expire with the lifecycle rule of the bucket.
+"""
+
+import functools
+import hashlib
+import json
+import os
+
+import boto3
+
+REFERENCE_KEY = "claimCheck"
+KEY_PREFIX = "claim-check/"
+# Unset where the claim-check is not deployed: results are then returned as they are
+BUCKET = os.environ.get("CLAIM_CHECK_BUCKET")
+# Fields whose JSON is larger than this many bytes are offloaded
+THRESHOLD = int(os.environ.get("CLAIM_CHECK_THRESHOLD", 32 * 1024))
+
+S3_CLIENT = boto3.client("s3")
+
+
+def handler(offload=None):
+    """
+    Decorator of a Lambda handler, which resolves the references of its event and
+    offloads the `offload` fields of its result, given as dotted paths
+    (e.g. 'comparison_results.new_findings'), that are larger than THRESHOLD.
+    """
+
+    def decorator(lambda_handler):
+        @functools.wraps(lambda_handler)
+        def wrapper(event, context):
+            result = lambda_handler(resolve(event), context)
+            if offload:
+                result = offload_fields(result, offload)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def resolve(value):
+    """
+    Returns the value with its references, at any depth, replaced by what they refer to
+    """
+    if is_reference(value):
+        return resolve(get(value))
+    if isinstance(value, dict):
+        return {k: resolve(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve(v) for v in value]
+    return value
+
+
+def offload_fields(result, fields, threshold=None):
+    """
+    Replaces the fields of the result, given as dotted paths, by references if their
+    JSON is larger than `threshold` bytes. Missing fields are ignored.
+    """
+    if not BUCKET or not isinstance(result, dict):
+        return result
+    if threshold is None:
+        threshold = THRESHOLD
+
+    for field in fields:
+        *parents, name = field.split(".")
+        container = result
+        for parent in parents:
+            container = container.get(parent) if isinstance(container, dict) else None
+        if (
+            not isinstance(container, dict)
+            or name not in container
+            or is_reference(container[name])
+        ):
+            continue
+
+        body = json.dumps(container[name]).encode("utf-8")
+        if len(body) > threshold:
+            container[name] = put(body)
+            key = container[name][REFERENCE_KEY]["key"]
+            print(f"Offloaded {field} ({len(body)} bytes) to s3://{BUCKET}/{key}")
+    return result
+
+
+def put(body):
+    """
+    Writes the JSON body to the bucket and returns its reference. Writing an existing
+    object again restarts its expiry, as its content is the same.
+    """
+    key = f"{KEY_PREFIX}{hashlib.sha256(body).hexdigest()}.json"
+    S3_CLIENT.put_object(
+        Bucket=BUCKET,
+        Key=key,
+        Body=body,
+        ContentType="application/json",
+    )
+    return {REFERENCE_KEY: {"bucket": BUCKET, "key": key, "size": len(body)}}
+
+
+def get(reference):
+    location = reference[REFERENCE_KEY]
+    response = S3_CLIENT.get_object(Bucket=location["bucket"], Key=location["key"])
+    body = response["Body"].read()
+    if location["key"] != f"{KEY_PREFIX}{hashlib.sha256(body).hexdigest()}.json":
+        raise ValueError(
+            f"Content of s3://{location['bucket']}/{location['key']} "
+            "does not match its key",
+        )
+    return json.loads(body)
+
+
+def is_reference(value):
+    return (
+        isinstance(value, dict)
+        and len(value) == 1
+        and isinstance(value.get(REFERENCE_KEY), dict)
+    )
@@ -0,0 +1,151 @@
+"""
+Streaming parser for Fortify FVDL files, shared by the Lambdas that read scan results.
+
+FVDL files of large codebases run to hundreds of MB, most of it snippets and the
+unified node pool, so the file is parsed incrementally: each Vulnerability is
+yielded as soon as it has been read, and every element is dropped from the tree
+once it has been processed.
+"""
+
+import defusedxml.ElementTree as ET
+
+# Fields of each section of a Vulnerability, by FVDL element name
+CLASS_INFO_FIELDS = ["ClassID", "Kingdom", "Type", "Subtype", "DefaultSeverity"]
+INSTANCE_INFO_FIELDS = ["InstanceID", "InstanceSeverity", "Confidence"]
+
+# ReplacementDefinitions keys, and the field their value is stored in
+REPLACEMENT_FIELDS = {
+    "PrimaryLocation.file": "PrimaryFile",
+    "PrimaryLocation.line": "PrimaryLine",
+    "PrimaryCall.name": "PrimaryCall",
+}
+INT_FIELDS = {"Line", "PrimaryLine", "NumberFiles"}
+
+ParseError = ET.ParseError
+
+
+def iter_vulnerabilities(source, build_info=None):
+    """
+    Yields the fields of each Vulnerability in the FVDL `source`, a file path or
+    a file object, in document order.
+    If `build_info` is a dict, it is filled in with the fields of the Build
+    element as soon as it has been read, which is before the first Vulnerability.
+    """
+    namespace = ""
+    stack = []
+    # Number of open elements that are kept until they end: Build and Vulnerability
+    kept = 0
+
+    for event, elem in ET.iterparse(source, events=("start", "end"), forbid_dtd=True):
+        if event == "start":
+            if not stack and "}" in elem.tag:
+                namespace = elem.tag[: elem.tag.index("}") + 1]
+            if kept or is_kept(elem, stack, namespace):
+                kept += 1
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if kept:
+            kept -= 1
+            if not kept:
+                if elem.tag == f"{namespace}Build":
+                    if build_info is not None:
+                        build_info.update(parse_build(elem, namespace))
+                else:
+                    yield parse_vulnerability(elem, namespace)
+            else:
+                # Part of a Build or Vulnerability, which is parsed as a whole
+                continue
+
+        # The element has been processed: remove it from its parent, whose last child
+        # it is
+        if stack:
+            del stack[-1][-1]
+
+
+def is_kept(elem, stack, namespace):
+    """
+    Returns True for the elements that are parsed once they end
+    """
+    if elem.tag == f"{namespace}Build":
+        return True
+    return (
+        elem.tag == f"{namespace}Vulnerability"
+        and bool(stack)
+        and stack[-1].tag == f"{namespace}Vulnerabilities"
+    )
+
+
+def parse_build(build_elem, namespace=""):
+    """
+    Returns the fields of the Build element
+    """
+    build_info = {}
+    for field in ["BuildID", "NumberFiles", "SourceBasePath"]:
+        set_field(build_info, field, build_elem.findtext(f"./{namespace}{field}"))
+
+    # Extract scan time if available
+    scan_time_elem = build_elem.find(f"./{namespace}ScanTime")
+    if scan_time_elem is not None and scan_time_elem.get("value"):
+        build_info["ScanTime"] = scan_time_elem.get("value")
+
+    return build_info
+
+
+def parse_vulnerability(vuln_elem, namespace=""):
+    """
+    Returns the fields of a Vulnerability element
+    """
+    vuln_data = {}
+
+    class_info = vuln_elem.find(f"./{namespace}ClassInfo")
+    if class_info is not None:
+        for field in CLASS_INFO_FIELDS:
+            set_field(vuln_data, field, class_info.findtext(f"./{namespace}{field}"))
+
+    instance_info = vuln_elem.find(f"./{namespace}InstanceInfo")
+    if instance_info is not None:
+        for field in INSTANCE_INFO_FIELDS:
+            set_field(vuln_data, field, instance_info.findtext(f"./{namespace}{field}"))
+
+    unified = vuln_elem.find(f"./{namespace}AnalysisInfo/{namespace}Unified")
+    if unified is None:
+        return vuln_data
+
+    # Get function information and source location
+    context = unified.find(f"./{namespace}Context")
+    if context is not None:
+        function_elem = context.find(f"./{namespace}Function")
+        if function_elem is not None:
+            set_field(vuln_data, "Function", function_elem.get("name"))
+
+        src_loc = context.find(f"./{namespace}FunctionDeclarationSourceLocation")
+        if src_loc is not None:
+            set_field(vuln_data, "SourceFile", src_loc.get("path"))
+            set_field(vuln_data, "Line", src_loc.get("line"))
+
+    # Get primary location from ReplacementDefinitions
+    for def_elem in unified.iterfind(
+        f"./{namespace}ReplacementDefinitions/{namespace}Def",
+    ):
+        field = REPLACEMENT_FIELDS.get(def_elem.get("key"))
+        if field:
+            set_field(vuln_data, field, def_elem.get("value"))
+
+    return vuln_data
+
+
+def set_field(data, field, value):
+    """
+    Sets the field if the value is not empty, as an int for the numeric fields.
+    Severities and confidences are kept as strings to avoid float issues with DynamoDB.
+    """
+    if not value:
+        return
+    if field in INT_FIELDS:
+        try:
+            value = int(value)
+        except ValueError:
+            return
+    data[field] = value
@@ -0,0 +1,261 @@
+"""
+Gitea API client shared by the Lambdas that call Gitea.
+
+The session and the tokens are module-level, so a warm container reuses its
+connections and only reads the token secret again once it has expired, or when
+Gitea rejects it. GETs are conditional on the ETag of the last response to the
+same request, and rate-limited requests are retried after the delay Gitea asks for.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+import boto3
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT = (10, 15)  # 10s for connect, 15s for read
+
+# Connections kept alive per host, enough for the concurrent downloads of
+# parse_fortify_findings
+POOL_SIZE = 10
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE))
+SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE))
+
+# Tokens are read from Secrets Manager again after this many seconds
+TOKEN_TTL = 300
+SECRETS_CLIENT = boto3.client("secretsmanager")
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+# Retries of rate-limited and unavailable responses
+MAX_ATTEMPTS = 5
+BASE_BACKOFF = 0.5  # seconds
+MAX_BACKOFF = 8  # seconds
+# Longer Retry-After delays are not waited for: the response is returned
+MAX_RETRY_AFTER = 60  # seconds
+RETRY_STATUSES = {429, 502, 503, 504}
+# Methods retried on any of RETRY_STATUSES and connection errors. The others are only
+# retried on 429, as a rate-limited request has not been processed.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
+# Responses to GETs, by request, kept for conditional GETs
+MAX_CACHED_RESPONSES = 128
+MAX_CACHED_SIZE = 1024 * 1024
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+
+
+def get_token(secret_name, refresh=False):
+    """
+    Returns the Gitea token of the secret, or None if it cannot be read.
+    The token is cached for TOKEN_TTL seconds, unless `refresh` is set.
+    """
+    with _tokens_lock:
+        token, expires = _tokens.get(secret_name, (None, 0))
+        if token and not refresh and time.monotonic() < expires:
+            return token
+
+        try:
+            get_secret_value_response = SECRETS_CLIENT.get_secret_value(
+                SecretId=secret_name,
+            )
+            secret = json.loads(get_secret_value_response["SecretString"])
+            token = (
+                secret.get("token")
+                or secret.get("GITEA_TOKEN")
+                or secret.get("giteaToken")
+            )
+        except Exception as e:
+            print(f"Error retrieving secret {secret_name}: {str(e)}")
+            return None
+
+        if token:
+            _tokens[secret_name] = (token, time.monotonic() + TOKEN_TTL)
+        else:
+            print(f"Token not found in secret {secret_name}")
+            _tokens.pop(secret_name, None)
+        return token
+
+
+def request(method, url, secret_name=None, headers=None, **kwargs):
+    """
+    Sends a request to the Gitea API and returns the requests.Response, as
+    requests.request does. With `secret_name`, the request is authenticated with the
+    token of the secret, which is read again once if Gitea rejects it. GETs that are
+    not streamed are conditional: if Gitea answers 304 Not Modified, the previous
+    response is returned.
+    """
+    method = method.upper()
+    headers = dict(headers or {})
+    kwargs.setdefault("timeout", TIMEOUT)
+
+    token = None
+    if secret_name:
+        token = get_token(secret_name)
+        if token:
+            headers["Authorization"] = f"token {token}"
+
+    cache_key = None
+    cached = None
+    if method == "GET" and not kwargs.get("stream"):
+        cache_key = get_cache_key(url, secret_name, headers, kwargs.get("params"))
+        with _responses_lock:
+            cached = _responses.get(cache_key)
+        if cached is not None:
+            headers["If-None-Match"] = cached.headers["ETag"]
+
+    token_refreshed = False
+    attempt = 1
+    while True:
+        try:
+            response = SESSION.request(method, url, headers=headers, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            if method not in IDEMPOTENT_METHODS or attempt >= MAX_ATTEMPTS:
+                raise
+            delay = get_backoff(attempt)
+            print(f"{method} {url} failed: {str(e)}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if response.status_code == 401 and token and not token_refreshed:
+            # The token may have been rotated since it was cached
+            token_refreshed = True
+            new_token = get_token(secret_name, refresh=True)
+            if new_token and new_token != token:
+                print(
+                    f"Gitea rejected the cached token of {secret_name}, "
+                    "retrying with the current one",
+                )
+                response.close()
+                token = new_token
+                headers["Authorization"] = f"token {token}"
+                continue
+
+        if response.status_code == 304 and cached is not None:
+            print(f"Not modified: {url}")
+            response.close()
+            with _responses_lock:
+                _responses.move_to_end(cache_key)
+            return cached
+
+        delay = get_retry_delay(method, response, attempt)
+        if delay is None:
+            break
+        print(
+            f"{method} {url} returned {response.status_code}. Retrying in {delay:.1f}s",
+        )
+        response.close()
+        time.sleep(delay)
+        attempt += 1
+
+    if cache_key and response.status_code == 200 and response.headers.get("ETag"):
+        cache_response(cache_key, response)
+    return response
+
+
+def get(url, secret_name=None, **kwargs):
+    return request("GET", url, secret_name, **kwargs)
+
+
+def post(url, secret_name=None, **kwargs):
+    return request("POST", url, secret_name, **kwargs)
+
+
+def put(url, secret_name=None, **kwargs):
+    return request("PUT", url, secret_name, **kwargs)
+
+
+def patch(url, secret_name=None, **kwargs):
+    return request("PATCH", url, secret_name, **kwargs)
+
+
+def delete(url, secret_name=None, **kwargs):
+    return request("DELETE", url, secret_name, **kwargs)
+
+
+def get_retry_delay(method, response, attempt):
+    """
+    Returns the seconds to wait before the request is retried, or None if it is not
+    retried. Rate-limited responses are retried after their Retry-After or
+    X-RateLimit-Reset delay.
+    """
+    rate_limited = response.status_code == 429 or (
+        response.status_code == 403
+        and response.headers.get("X-RateLimit-Remaining") == "0"
+    )
+    if attempt >= MAX_ATTEMPTS:
+        return None
+    if not rate_limited and (
+        response.status_code not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS
+    ):
+        return None
+
+    delay = get_retry_after(response.headers)
+    if delay is None:
+        return get_backoff(attempt)
+    if delay > MAX_RETRY_AFTER:
+        print(f"Not retrying, Gitea asked to wait {delay:.0f}s")
+        return None
+    # Spread the retries of concurrent requests
+    return delay + random.uniform(0, BASE_BACKOFF)  # nosec B311
+
+
+def get_retry_after(headers):
+    """
+    Returns the delay in seconds of the Retry-After (seconds or HTTP date) or
+    X-RateLimit-Reset (epoch seconds) header, or None
+    """
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            pass
+
+    reset = headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            return max(float(reset) - time.time(), 0)
+        except ValueError:
+            pass
+    return None
+
+
+def get_backoff(attempt):
+    """
+    Exponential backoff with full jitter
+    """
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2**attempt))  # nosec B311
+
+
+def get_cache_key(url, secret_name, headers, params):
+    """
+    Responses depend on the URL and parameters, and on the token and Accept header
+    """
+    return (
+        url,
+        secret_name,
+        headers.get("Accept"),
+        json.dumps(params, sort_keys=True, default=str),
+    )
+
+
+def cache_response(cache_key, response):
+    if len(response.content) > MAX_CACHED_SIZE:
+        return
+    with _responses_lock:
+        _responses[cache_key] = response
+        _responses.move_to_end(cache_key)
+        while len(_responses) > MAX_CACHED_RESPONSES:
+            _responses.popitem(last=False)
@@ -3,7 +3,10 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_iam as iam,
     aws_ec2 as ec2,
+    aws_s3 as s3,
+    aws_dynamodb as dynamodb,
     Duration,
+    RemovalPolicy,
     BundlingOptions,
 )
 from constructs import Construct
@@ -72,6 +75,80 @@ class LambdaStack(Stack):
             description="Layer containing requests package"
         )
 
+        # Create Lambda layer with the streaming FVDL parser shared by the Lambdas that read scan results
+        fvdl_parser_layer = _lambda.LayerVersion(
+            self,
+            f"{config.namespace}-{config.version}-FvdlParserLayer",
+            code=_lambda.Code.from_asset("layers/fvdl_parser"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+            description="Layer containing the streaming FVDL parser"
+        )
+        fvdl_parser_functions = {
+            config.lambda_functions.parse_fortify_findings,
+            config.lambda_functions.verify_findings_resolved
+        }
+
+        # Create Lambda layer with the Gitea API client shared by the Lambdas that call Gitea
+        gitea_client_layer = _lambda.LayerVersion(
+            self,
+            f"{config.namespace}-{config.version}-GiteaClientLayer",
+            code=_lambda.Code.from_asset("layers/gitea_client"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+            description="Layer containing the pooled Gitea API client"
+        )
+        gitea_client_functions = {
+            config.lambda_functions.git_branch_crud,
+            config.lambda_functions.git_issues_crud,
+            config.lambda_functions.git_code_merge_and_push,
+            config.lambda_functions.git_file_crud,
+            config.lambda_functions.git_pr_crud,
+            config.lambda_functions.parse_fortify_findings
+        }
+
+        # Create the claim-check bucket and layer: the remediation Lambdas write large payloads
+        # to the bucket and pass references through the state machine instead
+        claim_check_bucket = s3.Bucket(
+            self,
+            f"{config.namespace}-{config.version}-ClaimCheckBucket",
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            lifecycle_rules=[
+                # Payloads are only needed while the executions that reference them run
+                s3.LifecycleRule(prefix="claim-check/", expiration=Duration.days(7))
+            ]
+        )
+        claim_check_bucket.grant_read_write(lambda_role)
+
+        claim_check_layer = _lambda.LayerVersion(
+            self,
+            f"{config.namespace}-{config.version}-ClaimCheckLayer",
+            code=_lambda.Code.from_asset("layers/claim_check"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+            description="Layer containing the claim-check of large state machine payloads"
+        )
+        claim_check_functions = {
+            config.lambda_functions.git_branch_crud,
+            config.lambda_functions.git_issues_crud,
+            config.lambda_functions.git_code_merge_and_push,
+            config.lambda_functions.git_file_crud,
+            config.lambda_functions.git_pr_crud,
+            config.lambda_functions.dynamodb_table_scan,
+            config.lambda_functions.bedrock_llm_call,
+            config.lambda_functions.verify_findings_resolved
+        }
+
+        # Create the cache of the LLM responses of the Bedrock function, expired by DynamoDB TTL.
+        # The Lambda role has access to all DynamoDB tables.
+        response_cache_table = dynamodb.Table(
+            self,
+            f"{config.namespace}-{config.version}-ResponseCacheTable",
+            partition_key=dynamodb.Attribute(name="cacheKey", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expiresAt",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
         # Lookup VPC and networking resources once
         vpc = ec2.Vpc.from_lookup(self, "VPC", vpc_id=config.networking.vpc_id)
         subnets = [
@@ -102,6 +179,17 @@ class LambdaStack(Stack):
             # Add model ID for bedrock function
             if func_name == config.lambda_functions.bedrock_llm_call:
                 environment_vars['BEDROCK_MODEL_ID'] = config.bedrock.model_id
+                environment_vars['RESPONSE_CACHE_TABLE'] = response_cache_table.table_name
+                environment_vars['METRICS_NAMESPACE'] = f"{config.namespace}-{config.version}"
+
+            layers = [requests_layer]
+            if func_name in fvdl_parser_functions:
+                layers.append(fvdl_parser_layer)
+            if func_name in gitea_client_functions:
+                layers.append(gitea_client_layer)
+            if func_name in claim_check_functions:
+                layers.append(claim_check_layer)
+                environment_vars['CLAIM_CHECK_BUCKET'] = claim_check_bucket.bucket_name
 
      
             _lambda.Function(
@@ -113,7 +201,7 @@ class LambdaStack(Stack):
                 function_name=f"{config.namespace}-{config.version}-{func_name}",
                 role=lambda_role,
                 timeout=Duration.minutes(15),
-                layers=[requests_layer],
+                layers=layers,
                 vpc=vpc,
                 vpc_subnets=ec2.SubnetSelection(subnets=subnets),
                 security_groups=[security_group],
@@ -0,0 +1,439 @@
+"""
+Extraction of the code sent to the LLM for a finding.
+
+Small files are sent whole. For larger ones, only the function enclosing the
+finding is sent, located by a lightweight C/C++ scanner (braces, comments,
+strings and preprocessor lines, no parsing), along with the includes, the type
+definitions it uses and the signatures of the functions it calls. Functions too
+large to send, and code outside any function, fall back to a window of lines
+around the finding. The lines keep their original numbers, and the prompt size
+is bounded whatever the size of the file.
+"""
+
+import re
+
+# Files with at most this many lines, and MAX_SCOPE_CHARS characters, are sent whole
+MAX_FULL_FILE_LINES = 200
+# Bounds of the code to fix: the enclosing function, or else a window around the finding
+MAX_SCOPE_LINES = 300
+MAX_SCOPE_CHARS = 40000
+WINDOW_LINES = 40  # on each side of the finding
+# Bounds of the context lines (includes, type definitions, callee signatures)
+MAX_CONTEXT_LINES = 80
+MAX_CONTEXT_LINE_LENGTH = 300
+
+# Headers of blocks whose content is scanned for functions, e.g. member functions of
+# a class
+SCOPE_HEADER = re.compile(
+    r"^(?:template\s*<.*>\s*)?"
+    r'(?:namespace\b|extern\s*"C(?:\+\+)?"'
+    r"|(?:typedef\s+)?(?:struct|union|class)\b[^=(]*$)",
+    re.DOTALL,
+)
+# Headers of function definitions: a parameter list, then only qualifiers
+FUNCTION_HEADER = re.compile(
+    r"\)\s*(?:(?:const|volatile|noexcept|override|final|throw\s*\([^)]*\))\s*"
+    r"|->\s*[\w:<>,\s*&]+)*$",
+)
+ATTRIBUTE = re.compile(
+    r"__attribute__\s*\(\((?:[^()]|\([^()]*\))*\)\)|__declspec\s*\([^()]*\)",
+)
+CALL = re.compile(r"\b([A-Za-z_]\w*)\s*\(")
+IDENTIFIER = re.compile(r"\b[A-Za-z_]\w*\b")
+INCLUDE = re.compile(r"^\s*#\s*include\b")
+KEYWORDS = {
+    "if",
+    "for",
+    "while",
+    "switch",
+    "return",
+    "sizeof",
+    "do",
+    "else",
+    "case",
+    "alignof",
+    "_Alignof",
+    "defined",
+    "catch",
+    "static_assert",
+    "_Static_assert",
+    "decltype",
+    "typeof",
+}
+
+
+def extract_context(code, target_line):
+    """
+    Returns the code context of the finding at `target_line`:
+    {
+        "numbered_code": "...",   # Numbered lines sent to the LLM, target marked →
+        "scope": "file",          # file, function or window
+        "start_line": 1,          # Lines to fix, replaced by the fixed code of the LLM
+        "end_line": 120,
+        "function": "parse_header"  # Enclosing function, for the function scope
+    }
+    """
+    lines = code.split("\n")
+    target_line = min(max(target_line, 1), len(lines))
+
+    if len(lines) <= MAX_FULL_FILE_LINES and len(code) <= MAX_SCOPE_CHARS:
+        return {
+            "numbered_code": number_lines(
+                lines,
+                {n: lines[n - 1] for n in range(1, len(lines) + 1)},
+                target_line,
+            ),
+            "scope": "file",
+            "start_line": 1,
+            "end_line": len(lines),
+            "function": None,
+        }
+
+    scan = scan_code(lines)
+    function = find_enclosing_function(scan["functions"], target_line)
+    if function and fits_scope(lines, function["start"], function["end"]):
+        scope, start_line, end_line = "function", function["start"], function["end"]
+    else:
+        if function:
+            size = function["end"] - function["start"] + 1
+            print(
+                f"Function {function['name']} ({size} lines) is too large, "
+                f"sending a window around line {target_line}",
+            )
+        scope = "window"
+        start_line, end_line = get_window(lines, target_line, function)
+
+    selected = {n: lines[n - 1] for n in range(start_line, end_line + 1)}
+    add_context_lines(
+        selected,
+        lines,
+        scan,
+        start_line,
+        end_line,
+        function if scope == "function" else None,
+    )
+    return {
+        "numbered_code": number_lines(lines, selected, target_line),
+        "scope": scope,
+        "start_line": start_line,
+        "end_line": end_line,
+        "function": function["name"] if function else None,
+    }
+
+
+def splice(code, start_line, end_line, fixed_code):
+    """
+    Returns the code with lines start_line-end_line replaced by the fixed code. The
+    indentation of the first line, which the LLM response parsing strips, is restored.
+    """
+    lines = code.split("\n")
+    fixed_lines = fixed_code.split("\n")
+    indentation = re.match(r"[ \t]*", lines[start_line - 1]).group(0)
+    if fixed_lines and indentation and not fixed_lines[0][:1].isspace():
+        fixed_lines[0] = indentation + fixed_lines[0]
+    return "\n".join(lines[: start_line - 1] + fixed_lines + lines[end_line:])
+
+
+def scan_code(lines):
+    """
+    Scans the code for its top-level declarations:
+    - functions: definitions, with the lines of their header and body
+    - prototypes: function declarations ending with ;
+    - types: typedefs and struct, union and enum definitions
+    - includes: #include lines
+    Lines are numbered from 1.
+    """
+    functions, prototypes, types, includes = [], [], [], []
+    # Kinds of the open braces: scope (scanned for functions), function, or block
+    stack = []
+    header, header_start = [], None
+    type_start = None
+    state = "code"
+
+    for line_no, line in enumerate(lines, 1):
+        if state == "preprocessor":
+            state = "preprocessor" if line.endswith("\\") else "code"
+            continue
+        if state == "code" and line.lstrip().startswith("#"):
+            if INCLUDE.match(line) and not stack:
+                includes.append(line_no)
+            state = "preprocessor" if line.endswith("\\") else "code"
+            continue
+        # Declarations are only tracked outside functions and data blocks
+        tracking = all(kind == "scope" for kind in stack)
+
+        i = 0
+        while i < len(line):
+            char = line[i]
+            if state == "comment":
+                end = line.find("*/", i)
+                if end < 0:
+                    break
+                state, i = "code", end + 2
+                continue
+            if state in ('"', "'"):
+                if char == "\\":
+                    i += 2
+                    continue
+                if char == state:
+                    state = "code"
+                i += 1
+                continue
+
+            if line.startswith("//", i):
+                break
+            if line.startswith("/*", i):
+                state, i = "comment", i + 2
+                continue
+            if char in ('"', "'"):
+                state = char
+                if tracking:
+                    header.append('""')
+                i += 1
+                continue
+
+            if char == "{":
+                text = "".join(header).strip()
+                if not tracking:
+                    kind = "block"
+                elif SCOPE_HEADER.match(text) or re.match(
+                    r"(?:typedef\s+)?enum\b",
+                    text,
+                ):
+                    kind = "scope"
+                    if (
+                        re.match(r"typedef\b|(?:struct|union|enum)\b", text)
+                        and not stack
+                    ):
+                        type_start = header_start
+                elif "(" in text and FUNCTION_HEADER.search(text):
+                    kind = "function"
+                    functions.append(
+                        {
+                            "name": get_function_name(text),
+                            "start": header_start or line_no,
+                            "open": line_no,
+                            "end": None,
+                        },
+                    )
+                else:
+                    kind = "block"
+                stack.append(kind)
+                header, header_start = [], None
+                tracking = all(kind == "scope" for kind in stack)
+            elif char == "}":
+                kind = stack.pop() if stack else "block"
+                if kind == "function" and all(k == "scope" for k in stack):
+                    functions[-1]["end"] = line_no
+                tracking = all(kind == "scope" for kind in stack)
+                if tracking and type_start is not None and not stack:
+                    # The declarators of the type definition follow, up to the ;
+                    header = ["}"]
+                elif tracking:
+                    header, header_start = [], None
+            elif char == ";":
+                if tracking:
+                    text = "".join(header).strip()
+                    if type_start is not None and not stack:
+                        types.append(
+                            {
+                                "start": type_start,
+                                "end": line_no,
+                                "names": get_type_names(
+                                    get_lines(lines, type_start, line_no),
+                                ),
+                            },
+                        )
+                        type_start = None
+                    elif text.startswith("typedef"):
+                        types.append(
+                            {
+                                "start": header_start or line_no,
+                                "end": line_no,
+                                "names": get_type_names(
+                                    get_lines(
+                                        lines,
+                                        header_start or line_no,
+                                        line_no,
+                                    ),
+                                ),
+                            },
+                        )
+                    elif (
+                        type_start is None
+                        and "(" in text
+                        and "=" not in text.split("(")[0]
+                    ):
+                        name = get_function_name(text)
+                        if name:
+                            prototypes.append(
+                                {
+                                    "name": name,
+                                    "start": header_start or line_no,
+                                    "end": line_no,
+                                },
+                            )
+                    header, header_start = [], None
+            elif tracking:
+                if header_start is None and not char.isspace():
+                    header_start = line_no
+                header.append(char)
+            i += 1
+
+        if state in ('"', "'"):
+            # Unterminated literal, e.g. an apostrophe in an #if 0 block
+            state = "code"
+        if tracking and header:
+            header.append(" ")
+
+    # Functions left open by unbalanced braces (e.g. braces in #ifdef branches) end
+    # with the file
+    for function in functions:
+        if function["end"] is None:
+            function["end"] = len(lines)
+    return {
+        "functions": functions,
+        "prototypes": prototypes,
+        "types": types,
+        "includes": includes,
+    }
+
+
+def get_function_name(header):
+    """
+    Returns the name of the function declared by the header: the identifier
+    before its parameter list, with its class for C++ member functions
+    """
+    header = ATTRIBUTE.sub("", header)
+    match = re.search(
+        r"([A-Za-z_~][\w:~]*)\s*\((?:[^()]|\([^()]*\))*\)\s*(?:[\w\s:<>,*&()-]*)$",
+        header,
+    )
+    return match.group(1) if match else None
+
+
+def get_type_names(type_lines):
+    """
+    Returns the names declared by a type definition: its tag, typedef
+    names and function pointer typedef names
+    """
+    text = "\n".join(type_lines)
+    names = set(re.findall(r"\b(?:struct|union|enum)\s+([A-Za-z_]\w*)", text))
+    names.update(re.findall(r"\(\s*\*\s*([A-Za-z_]\w*)\s*\)", text))
+    match = re.search(r"([A-Za-z_]\w*)\s*(?:\[[^\]]*\]\s*)*;\s*$", text)
+    if match:
+        names.add(match.group(1))
+    return names
+
+
+def find_enclosing_function(functions, target_line):
+    """
+    Returns the innermost function whose header or body contains the line,
+    e.g. the member function rather than a function enclosing its class
+    """
+    enclosing = [f for f in functions if f["start"] <= target_line <= f["end"]]
+    return min(enclosing, key=lambda f: f["end"] - f["start"], default=None)
+
+
+def fits_scope(lines, start_line, end_line):
+    return (
+        end_line - start_line + 1 <= MAX_SCOPE_LINES
+        and sum(len(line) + 1 for line in get_lines(lines, start_line, end_line))
+        <= MAX_SCOPE_CHARS
+    )
+
+
+def get_lines(lines, start_line, end_line):
+    """
+    Returns the lines from `start_line` to `end_line`, numbered from 1
+    """
+    first = start_line - 1
+    return lines[first:end_line]
+
+
+def get_window(lines, target_line, function=None):
+    """
+    Returns the first and last lines of the window around the target line, within the
+    function if any, bounded by WINDOW_LINES on each side and MAX_SCOPE_CHARS in total
+    """
+    low, high = (function["start"], function["end"]) if function else (1, len(lines))
+    start_line = end_line = target_line
+    size = len(lines[target_line - 1]) + 1
+    for offset in range(1, WINDOW_LINES + 1):
+        grown = False
+        for line_no in (target_line - offset, target_line + offset):
+            if (
+                low <= line_no <= high
+                and size + len(lines[line_no - 1]) + 1 <= MAX_SCOPE_CHARS
+            ):
+                size += len(lines[line_no - 1]) + 1
+                start_line, end_line = min(start_line, line_no), max(end_line, line_no)
+                grown = True
+        if not grown:
+            break
+    return start_line, end_line
+
+
+def add_context_lines(selected, lines, scan, start_line, end_line, function=None):
+    """
+    Adds to the selected lines the includes, then the type definitions used by the
+    code to fix, then the signatures of the functions it calls, up to
+    MAX_CONTEXT_LINES lines
+    """
+    code = "\n".join(get_lines(lines, start_line, end_line))
+    identifiers = set(IDENTIFIER.findall(code))
+    callees = {name for name in CALL.findall(code) if name not in KEYWORDS}
+    if function:
+        callees.discard(function["name"])
+
+    ranges = [(line_no, line_no) for line_no in scan["includes"]]
+    ranges += [
+        (t["start"], t["end"]) for t in scan["types"] if t["names"] & identifiers
+    ]
+    signatures = {}
+    for declaration in scan["prototypes"] + [
+        {"name": f["name"], "start": f["start"], "end": f["open"]}
+        for f in scan["functions"]
+    ]:
+        name = (declaration["name"] or "").split("::")[-1]
+        if name in callees and name not in signatures:
+            signatures[name] = (declaration["start"], declaration["end"])
+    ranges += sorted(signatures.values())
+
+    budget = MAX_CONTEXT_LINES
+    for first, last in ranges:
+        if start_line <= first and last <= end_line:
+            continue
+        new_lines = [n for n in range(first, last + 1) if n not in selected]
+        if len(new_lines) > budget:
+            continue
+        for n in new_lines:
+            line = lines[n - 1]
+            selected[n] = (
+                line
+                if len(line) <= MAX_CONTEXT_LINE_LENGTH
+                else line[:MAX_CONTEXT_LINE_LENGTH] + " ..."
+            )
+        budget -= len(new_lines)
+
+
+def number_lines(lines, selected, target_line):
+    """
+    Numbers the selected lines with their line numbers in the file, marks the target
+    line, and marks the lines left out between them with ...
+    """
+    numbered_lines = []
+    previous = 0
+    for line_no in sorted(selected):
+        if line_no > previous + 1:
+            numbered_lines.append("  ...")
+        prefix = f"{line_no}: "
+        if line_no == target_line:
+            # Highlight the target line
+            numbered_lines.append(f"→ {prefix}{selected[line_no]}")
+        else:
+            numbered_lines.append(f"  {prefix}{selected[line_no]}")
+        previous = line_no
+    if previous < len(lines):
+        numbered_lines.append("  ...")
+    return "\n".join(numbered_lines)
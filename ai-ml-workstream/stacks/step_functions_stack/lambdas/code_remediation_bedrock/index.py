@@ -1,9 +1,36 @@
+import hashlib
 import json
 import re
 import os
+import time
 import uuid
 import boto3
-
+import claim_check
+import code_context
+import response_cache
+
+DEFAULT_MODEL_ID = 'anthropic.claude-3-5-sonnet-20240620-v1:0'
+# Version of the prompt template, part of the response cache key: increment it when the prompt changes
+PROMPT_VERSION = 2
+
+# Text fields of the output, offloaded to S3 when large. The branch name, titles, labels, commit
+# message and false_positive are read by the state machine itself, and always stay inline.
+OFFLOADED_FIELDS = [
+    'issueBody',
+    'codeBody',
+    'prDescription',
+    'analysis',
+    'solution_approach',
+    'fixed_code',
+    'verification_steps',
+    'parsed_sections.analysis',
+    'parsed_sections.solution_approach',
+    'parsed_sections.fixed_code',
+    'parsed_sections.verification_steps',
+    'parsed_sections.raw_response'
+]
+
+@claim_check.handler(offload=OFFLOADED_FIELDS)
 def lambda_handler(event, context):
     """
     Lambda function that processes Fortify scan results, sends the code to an LLM for fixing,
@@ -26,7 +53,7 @@ def lambda_handler(event, context):
         
         # Extract necessary details from fortify_result
         source_file = fortify_result.get('sourceFile', '')
-        line_number = fortify_result.get('primaryLine', 0)
+        line_number = int(fortify_result.get('primaryLine') or 0)
         issue_type = fortify_result.get('type', '')
         subtype = fortify_result.get('subtype', '')
         function_name = fortify_result.get('function', '')
@@ -34,14 +61,34 @@ def lambda_handler(event, context):
         
         # Create category and prepare code for LLM
         category = f"{issue_type}: {subtype}" if subtype else issue_type
-        numbered_code = add_line_numbers(file_content, line_number)
-        
+        if file_content:
+            # Large files are reduced to the function of the finding and its context
+            excerpt = code_context.extract_context(file_content, line_number)
+            numbered_code = excerpt['numbered_code']
+            print(f"Sending lines {excerpt['start_line']}-{excerpt['end_line']} ({excerpt['scope']}) of {source_file}")
+        else:
+            excerpt = None
+            numbered_code = add_line_numbers(file_content, line_number)
+
+        if excerpt and excerpt['scope'] != 'file':
+            scope = f"function {excerpt['function']}" if excerpt['scope'] == 'function' else "around the issue"
+            code_description = f"""Excerpt of the source file, with its original line numbers. Lines {excerpt['start_line']}-{excerpt['end_line']}
+            ({scope}) are the code to fix.
+            The other lines are context from the rest of the file (includes, type definitions and signatures
+            of the functions called), separated by ... where lines are left out."""
+            fixed_code_description = f"Complete fixed code of lines {excerpt['start_line']}-{excerpt['end_line']} only, without line numbers"
+            usable_as = f"a replacement of lines {excerpt['start_line']}-{excerpt['end_line']} of the source file"
+        else:
+            code_description = "Original Code:"
+            fixed_code_description = "Complete fixed source code without line numbers"
+            usable_as = "a source file"
+
         # Prepare the prompt for the LLM
         # Base prompt components
         base_intro = f"""You are a senior C programming expert specialized in code analysis and bug fixing.
             CODE CONTEXT:
             Source File: {source_file}
-            Original Code:
+            {code_description}
             {numbered_code}
 
             ISSUE DETAILS:
@@ -64,12 +111,12 @@ def lambda_handler(event, context):
             [TRUE / FALSE]
 
             FIXED_CODE:
-            [Complete fixed source code without line numbers]
+            [{fixed_code_description}]
 
             VERIFICATION_STEPS:
             [List of recommended tests/checks to validate the fix]
 
-            The fixed code must be immediately usable as a source file with no additional formatting needed.
+            The fixed code must be immediately usable as {usable_as} with no additional formatting needed.
             """
 
         # Default requirements for initial prompt
@@ -155,23 +202,53 @@ def lambda_handler(event, context):
         requirements = requirements.format(category=category, line_number=line_number)
         formatted_response = response_format.format(
             analysis_points=analysis_points,
-            solution_approach_points=solution_points
+            solution_approach_points=solution_points,
+            fixed_code_description=fixed_code_description,
+            usable_as=usable_as
         )
 
         # Assemble the complete prompt
         human_prompt = f"{base_intro}{error_section}{requirements}\n\n{instructions}\n{formatted_response}"
 
-        # Add previous chat if available
+        # A retry means the previous fix failed: it is not returned from the cache again
+        if isinstance(previous_chat, dict) and previous_chat.get('responseCacheKey'):
+            response_cache.delete(previous_chat['responseCacheKey'])
+
+        # Add previous chat if available: the previous response of the LLM, rather than the
+        # whole previous output, which repeats the fixed code in several fields
+        if isinstance(previous_chat, dict):
+            previous_chat = previous_chat.get('parsed_sections', {}).get('raw_response') or previous_chat
         if previous_chat:
             prompt = f"Human: {human_prompt}\n\nAssistant:{previous_chat}"
         else:
             prompt = f"Human: {human_prompt}\n\nAssistant:"
 
-        # Call the LLM for a fix
-        llm_response = call_bedrock(prompt)
-        
-        # Parse the LLM response
-        parsed_sections = parse_llm_sections(llm_response)
+        # The same finding category on the same code, at the same attempt, reuses the cached response
+        model_id = get_model_id()
+        attempt_context = {
+            'previous_chat': hashlib.sha256(str(previous_chat).encode('utf-8')).hexdigest() if previous_chat else None,
+            'compile_error': compile_error,
+            'new_findings': new_findings,
+            'finding_not_resolved': bool(finding_not_resolved)
+        }
+        cache_key = response_cache.get_cache_key(model_id, PROMPT_VERSION, category, numbered_code, attempt_context)
+        parsed_sections = response_cache.get(cache_key)
+
+        if parsed_sections is None:
+            # Call the LLM for a fix
+            started = time.monotonic()
+            llm_response = call_bedrock(prompt)
+            latency_ms = int((time.monotonic() - started) * 1000)
+
+            # Parse the LLM response
+            parsed_sections = parse_llm_sections(llm_response)
+            if parsed_sections.get('fixed_code') or parsed_sections.get('false_positive'):
+                response_cache.put(cache_key, parsed_sections, latency_ms, model_id, category)
+
+        # The fixed code of an excerpt replaces its lines in the source file
+        modified_code = parsed_sections.get('fixed_code', '')
+        if modified_code and excerpt and excerpt['scope'] != 'file':
+            modified_code = code_context.splice(file_content, excerpt['start_line'], excerpt['end_line'], modified_code)
         
         # Format the output for GitHub
         output = format_github_output(
@@ -183,7 +260,7 @@ def lambda_handler(event, context):
             parsed_sections.get('analysis', ''),
             parsed_sections.get('solution_approach', ''),
             
-            parsed_sections.get('fixed_code', ''), 
+            modified_code,
             parsed_sections.get('verification_steps', ''),
             project_name,
             parsed_sections.get('false_positive', '')
@@ -191,6 +268,7 @@ def lambda_handler(event, context):
         
         # Include the parsed sections in the output
         output['parsed_sections'] = parsed_sections
+        output['responseCacheKey'] = cache_key
         
         return output
         
@@ -221,9 +299,11 @@ def add_line_numbers(code_content, target_line):
     
     return '\n'.join(numbered_lines)
         
+def get_model_id():
+    return os.environ.get('BEDROCK_MODEL_ID', DEFAULT_MODEL_ID)
+
 def call_bedrock(prompt):
     """Call AWS Bedrock to get a code fix with retry logic for timeouts"""
-    import time
     from botocore.exceptions import ClientError
     
     max_retries = 3
@@ -232,7 +312,7 @@ def call_bedrock(prompt):
     for attempt in range(1, max_retries + 1):
         try:
             bedrock = boto3.client('bedrock-runtime')
-            model_id = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-5-sonnet-20240620-v1:0')
+            model_id = get_model_id()
             
             # Check if using Claude 3 or newer models (which use Messages API)
             if 'claude-3' in model_id:
@@ -0,0 +1,174 @@
+"""
+Cache of the parsed LLM responses, so that the same finding category on the same code
+(vendored files, copy-pasted helpers, re-runs of failed executions) does not call
+Bedrock again.
+
+Responses are keyed by the model, the version of the prompt template, the category of
+the finding, a hash of the code sent with the line numbers left out, and the context of
+the attempt (previous response, compile error, new findings). They are stored in the
+RESPONSE_CACHE_TABLE DynamoDB table, which expires them with its TTL attribute, or in
+memory when the table is not configured (local runs).
+
+Every lookup emits CloudWatch metrics in the embedded metric format: CacheHit (1 or
+0, its average is the hit rate) and, on hits, SavedLatency, the duration of the
+Bedrock call that produced the cached response.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+TABLE_NAME = os.environ.get("RESPONSE_CACHE_TABLE")
+TTL_DAYS = int(os.environ.get("RESPONSE_CACHE_TTL_DAYS", 30))
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CodeRemediation")
+# Larger responses are not cached, as DynamoDB items are limited to 400 KB
+MAX_ITEM_SIZE = 350 * 1024
+
+DYNAMODB_CLIENT = boto3.client("dynamodb") if TABLE_NAME else None
+# Stand-in for the table, for the lifetime of the container
+_local_cache = {}
+
+# Line numbers and the target marker of code_context.number_lines
+LINE_NUMBER = re.compile(r"^(→| ) ?\d+: ", re.MULTILINE)
+
+
+def get_cache_key(model_id, prompt_version, category, numbered_code, attempt_context):
+    """
+    Returns the cache key of a prompt. The code is normalized: line numbers are left
+    out, as the same code may be at other lines of another file, but the marker of the
+    target line is kept, and whitespace runs are collapsed.
+    """
+    code = LINE_NUMBER.sub(
+        lambda match: "→ " if match.group(1) == "→" else "",
+        numbered_code,
+    )
+    code = "\n".join(" ".join(line.split()) for line in code.split("\n"))
+    code_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    key = json.dumps(
+        [model_id, prompt_version, category, code_hash, attempt_context],
+        sort_keys=True,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def get(cache_key):
+    """
+    Returns the cached parsed sections of the key, or None, and emits the cache metrics
+    """
+    entry = None
+    if TABLE_NAME:
+        try:
+            response = DYNAMODB_CLIENT.get_item(
+                TableName=TABLE_NAME,
+                Key={"cacheKey": {"S": cache_key}},
+            )
+            item = response.get("Item")
+            # Expired items are only deleted eventually by DynamoDB
+            if item and int(item["expiresAt"]["N"]) > time.time():
+                entry = {
+                    "parsed_sections": json.loads(item["parsedSections"]["S"]),
+                    "latency_ms": int(item["latencyMs"]["N"]),
+                }
+        except ClientError as e:
+            # The cache is an optimization, Bedrock is called instead
+            print(f"Error reading the response cache: {str(e)}")
+    else:
+        local_entry = _local_cache.get(cache_key)
+        if local_entry and local_entry["expires_at"] > time.time():
+            entry = {
+                "parsed_sections": json.loads(local_entry["body"]),
+                "latency_ms": local_entry["latency_ms"],
+            }
+
+    if entry:
+        print(f"Response cache hit: {cache_key}")
+        put_metrics(
+            CacheHit=(1, "Count"),
+            SavedLatency=(entry["latency_ms"], "Milliseconds"),
+        )
+        return entry["parsed_sections"]
+    put_metrics(CacheHit=(0, "Count"))
+    return None
+
+
+def put(cache_key, parsed_sections, latency_ms, model_id, category):
+    """
+    Caches the parsed sections of the response, with the latency of the Bedrock call
+    """
+    expires_at = int(time.time()) + TTL_DAYS * 24 * 3600
+    # Stored as JSON, so that later changes to the sections do not change the cache
+    body = json.dumps(parsed_sections)
+    if not TABLE_NAME:
+        _local_cache[cache_key] = {
+            "body": body,
+            "latency_ms": latency_ms,
+            "expires_at": expires_at,
+        }
+        return
+
+    if len(body.encode("utf-8")) > MAX_ITEM_SIZE:
+        print(f"Response of {len(body)} characters not cached")
+        return
+    try:
+        DYNAMODB_CLIENT.put_item(
+            TableName=TABLE_NAME,
+            Item={
+                "cacheKey": {"S": cache_key},
+                "parsedSections": {"S": body},
+                "latencyMs": {"N": str(latency_ms)},
+                "modelId": {"S": model_id},
+                "category": {"S": category},
+                "createdAt": {"N": str(int(time.time()))},
+                "expiresAt": {"N": str(expires_at)},
+            },
+        )
+    except ClientError as e:
+        print(f"Error writing the response cache: {str(e)}")
+
+
+def delete(cache_key):
+    """
+    Removes a response, e.g. one whose fix failed, so that it is not returned again
+    """
+    if not TABLE_NAME:
+        _local_cache.pop(cache_key, None)
+        return
+    try:
+        DYNAMODB_CLIENT.delete_item(
+            TableName=TABLE_NAME,
+            Key={"cacheKey": {"S": cache_key}},
+        )
+    except ClientError as e:
+        print(f"Error deleting from the response cache: {str(e)}")
+
+
+def put_metrics(**metrics):
+    """
+    Prints the metrics, given as name=(value, unit), in the CloudWatch embedded
+    metric format
+    """
+    print(
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": METRICS_NAMESPACE,
+                            "Dimensions": [[]],
+                            "Metrics": [
+                                {"Name": name, "Unit": unit}
+                                for name, (value, unit) in metrics.items()
+                            ],
+                        },
+                    ],
+                },
+                **{name: value for name, (value, unit) in metrics.items()},
+            },
+        ),
+    )
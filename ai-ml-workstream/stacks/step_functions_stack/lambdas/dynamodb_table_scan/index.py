@@ -1,12 +1,66 @@
-import json
+import base64
 import boto3
+from boto3.dynamodb.types import Binary, TypeDeserializer
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import claim_check
 
+# The table is scanned in parallel segments, each on its own thread
+DEFAULT_SEGMENTS = 4
+MAX_SEGMENTS = 16
+
+# Attributes of the findings used by the state machines, returned unless the event lists its own fields
+FINDING_FIELDS = [
+    'InstanceID',
+    'projectName',
+    'scanTimestamp',
+    'classID',
+    'kingdom',
+    'type',
+    'subtype',
+    'defaultSeverity',
+    'severity',
+    'confidence',
+    'function',
+    'sourceFile',
+    'sourceFileRelative',
+    'line',
+    'primaryFile',
+    'primaryFileRelative',
+    'primaryLine',
+    'primaryCall'
+]
+
+# Latest scan pointer items (see parse_fortify_findings_dynamodb), and the index of the findings
+# of each project by scan: projectName, scanKey (scanTimestamp#InstanceID)
+LATEST_SCAN_PREFIX = 'LATEST_SCAN#'
+SCAN_PENDING = 'PENDING'
+PROJECT_SCAN_INDEX = 'ProjectScanIndex'
+# Maximum operands of the IN comparator
+MAX_IN_OPERANDS = 100
+
+DYNAMODB_CLIENT = boto3.client('dynamodb')
+DESERIALIZER = TypeDeserializer()
+
+@claim_check.handler()
 def lambda_handler(event, context):
+    """
+    Returns the findings of the table, with a severity of at least minSeverity.
+    With projectName, only the findings of the latest scan of the project are returned,
+    which are queried from the project scan index rather than scanned.
+
+    Expected event input:
+    {
+        "tableName": "findings-table",
+        "projectName": "my-project",               # Optional, queries the latest scan of the project
+        "minSeverity": 3,                          # Optional, defaults to 0
+        "fields": ["InstanceID", "severity"],      # Optional, defaults to FINDING_FIELDS
+        "segments": 4,                             # Optional, parallel scan segments
+        "claimCheck": true                         # Optional, items may be returned as a claim-check reference
+    }
+    """
     try:
-        # Initialize DynamoDB client
-        dynamodb = boto3.client('dynamodb')
-        
         # Use default 0 as minimum severity
         min_severity = 0
         # Extract minSeverity value from event
@@ -21,48 +75,164 @@ def lambda_handler(event, context):
         # Extract table name from event
         if 'tableName' not in event:
             raise ValueError("Table name not provided in event")
-            
+
         table_name = event['tableName']
-        
-        # Perform DynamoDB scan
+        fields = event.get('fields') or FINDING_FIELDS
         try:
-            response = dynamodb.scan(TableName=table_name)
-        except ClientError as e:
-            raise Exception(f"DynamoDB scan failed: {str(e)}")
-            
-        # Convert DynamoDB items to simplified JSON
-        simplified_items = []
-        
-        for item in response.get('Items', []):
-            simplified_item = {}
-            for key, value in item.items():
-                # Extract the actual value from DynamoDB format
-                if 'S' in value:  # String
-                    simplified_item[key] = value['S']
-                elif 'N' in value:  # Number
-                    simplified_item[key] = float(value['N'])
-                elif 'BOOL' in value:  # Boolean
-                    simplified_item[key] = value['BOOL']
-                elif 'L' in value:  # List
-                    simplified_item[key] = [
-                        list_item.get('S', list_item.get('N', list_item.get('BOOL'))) 
-                        for list_item in value['L']
-                    ]
-                elif 'M' in value:  # Map
-                    simplified_item[key] = value['M']
-                elif 'NULL' in value:  # Null
-                    simplified_item[key] = None
-            # filter out items with lower than specified minimum severity        
-            if 'severity' in simplified_item and simplified_item['severity'] < min_severity:
-                continue
-            simplified_items.append(simplified_item)
-            
-        return {
-            'items': simplified_items,
-            'count': len(simplified_items)
+            segments = int(event.get('segments', DEFAULT_SEGMENTS))
+        except (TypeError, ValueError):
+            raise ValueError(f"segments '{event['segments']}' cannot be successfully converted into a valid integer.")
+        if not 1 <= segments <= MAX_SEGMENTS:
+            raise ValueError(f"segments must be between 1 and {MAX_SEGMENTS}")
+
+        project_name = event.get('projectName')
+        items = None
+        if project_name:
+            items = query_latest_scan(table_name, project_name, fields, min_severity)
+
+        # Perform DynamoDB scan
+        if items is None:
+            try:
+                items = scan_table(table_name, fields, min_severity, segments)
+            except ClientError as e:
+                raise Exception(f"DynamoDB scan failed: {str(e)}")
+            print(f"Scanned {len(items)} item(s) from {table_name} in {segments} segment(s)")
+        result = {
+            'items': items,
+            'count': len(items)
         }
-        
+        # Only for callers that resolve the reference: a Map state iterates over the items themselves
+        if event.get('claimCheck'):
+            result = claim_check.offload_fields(result, ['items'])
+        return result
+
     except ValueError as e:
         raise ValueError(str(e))
     except Exception as e:
-        raise Exception(f"Error processing DynamoDB scan: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error processing DynamoDB scan: {str(e)}")
+
+def scan_table(table_name, fields, min_severity=0, segments=1):
+    """
+    Scans the whole table, following LastEvaluatedKey, in `segments` parallel segments.
+    Only the `fields` attributes are read, and items with a severity less than
+    `min_severity` are filtered out by DynamoDB. Returns the items as plain JSON values.
+    """
+    scan_kwargs = get_scan_kwargs(table_name, fields, min_severity)
+    if segments == 1:
+        return scan_segment(scan_kwargs)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [
+            executor.submit(scan_segment, {**scan_kwargs, 'Segment': segment, 'TotalSegments': segments})
+            for segment in range(segments)
+        ]
+        return [item for future in futures for item in future.result()]
+
+def query_latest_scan(table_name, project_name, fields, min_severity=0):
+    """
+    Queries the findings of the latest scan of the project from the project scan index:
+    for each FVDL file of the scan, the items written with its fvdlPath at its scanTimestamp.
+    Returns None if the project has no latest scan pointer, its latest scan is still pending
+    (its findings are being written, or the run failed), or the table has no index, for the
+    table to be scanned instead.
+    """
+    response = DYNAMODB_CLIENT.get_item(
+        TableName=table_name,
+        Key={'InstanceID': {'S': f"{LATEST_SCAN_PREFIX}{project_name}"}},
+        ConsistentRead=True
+    )
+    if 'Item' not in response:
+        print(f"No latest scan of {project_name} in {table_name}, scanning the table")
+        return None
+    if response['Item'].get('scanStatus', {}).get('S') == SCAN_PENDING:
+        print(f"The latest scan of {project_name} is pending, scanning the table")
+        return None
+    files = DESERIALIZER.deserialize(response['Item'].get('files', {'M': {}}))
+
+    # Files processed by the same run share its scanTimestamp
+    paths_by_scan = {}
+    for path, file in files.items():
+        paths_by_scan.setdefault(file['scanTimestamp'], []).append(path)
+
+    items = []
+    try:
+        for scan_timestamp, paths in sorted(paths_by_scan.items()):
+            for i in range(0, len(paths), MAX_IN_OPERANDS):
+                query_kwargs = get_query_kwargs(table_name, project_name, scan_timestamp, paths[i:i + MAX_IN_OPERANDS], fields, min_severity)
+                paginator = DYNAMODB_CLIENT.get_paginator('query')
+                for page in paginator.paginate(**query_kwargs):
+                    items.extend(deserialize_item(item) for item in page.get('Items', []))
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ValidationException':
+            raise Exception(f"DynamoDB query failed: {str(e)}")
+        # Tables created before the index was added
+        print(f"Cannot query {PROJECT_SCAN_INDEX} of {table_name}, scanning the table: {str(e)}")
+        return None
+
+    print(f"Queried {len(items)} item(s) of {len(paths_by_scan)} scan(s) of {project_name} from {table_name}")
+    return items
+
+def get_query_kwargs(table_name, project_name, scan_timestamp, paths, fields, min_severity):
+    query_kwargs = get_scan_kwargs(table_name, fields, min_severity)
+    names = query_kwargs['ExpressionAttributeNames']
+    values = query_kwargs.setdefault('ExpressionAttributeValues', {})
+    names.update({'#projectName': 'projectName', '#scanKey': 'scanKey', '#fvdlPath': 'fvdlPath'})
+    values[':project_name'] = {'S': project_name}
+    values[':scan'] = {'S': f"{scan_timestamp}#"}
+    path_values = {f':p{i}': {'S': path} for i, path in enumerate(paths)}
+    values.update(path_values)
+
+    query_kwargs['IndexName'] = PROJECT_SCAN_INDEX
+    query_kwargs['KeyConditionExpression'] = '#projectName = :project_name AND begins_with(#scanKey, :scan)'
+    query_kwargs['FilterExpression'] = f"({query_kwargs['FilterExpression']}) AND #fvdlPath IN ({', '.join(path_values)})"
+    return query_kwargs
+
+def get_scan_kwargs(table_name, fields, min_severity):
+    """
+    Returns the scan parameters. Attribute names go through placeholders, as several
+    of them (e.g. type, function, line) are reserved words. Latest scan pointer items,
+    which have a recordType, are filtered out.
+    """
+    names = {f'#f{i}': field for i, field in enumerate(fields)}
+    names['#recordType'] = 'recordType'
+    scan_kwargs = {
+        'TableName': table_name,
+        'ProjectionExpression': ', '.join(name for name in names if name.startswith('#f')),
+        'ExpressionAttributeNames': names,
+        'FilterExpression': 'attribute_not_exists(#recordType)'
+    }
+
+    if min_severity > 0:
+        # Items without a severity are kept, as they were before filtering moved to DynamoDB
+        names['#severity'] = 'severity'
+        scan_kwargs['FilterExpression'] += ' AND (attribute_not_exists(#severity) OR #severity >= :min_severity)'
+        scan_kwargs['ExpressionAttributeValues'] = {':min_severity': {'N': str(min_severity)}}
+
+    return scan_kwargs
+
+def scan_segment(scan_kwargs):
+    items = []
+    paginator = DYNAMODB_CLIENT.get_paginator('scan')
+    for page in paginator.paginate(**scan_kwargs):
+        items.extend(deserialize_item(item) for item in page.get('Items', []))
+    return items
+
+def deserialize_item(item):
+    return {key: to_json_value(DESERIALIZER.deserialize(value)) for key, value in item.items()}
+
+def to_json_value(value):
+    """
+    Converts the deserialized values that json cannot serialize: numbers are returned as
+    int or float, sets as lists and binary values base64-encoded
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return [to_json_value(v) for v in value]
+    if isinstance(value, list):
+        return [to_json_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_json_value(v) for k, v in value.items()}
+    if isinstance(value, Binary):
+        return base64.b64encode(value.value).decode('ascii')
+    return value
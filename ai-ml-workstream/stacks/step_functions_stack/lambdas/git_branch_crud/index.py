@@ -1,9 +1,8 @@
-import boto3
 import json
 import urllib.parse
 import requests
-
-TIMEOUT = (10, 15) # 10s for connect, 15s for read
+import gitea_client
+import claim_check
 
 class GiteaError(Exception):
     """Custom exception for Gitea-related errors"""
@@ -13,6 +12,7 @@ class ValidationError(Exception):
     """Custom exception for input validation errors"""
     pass
 
+@claim_check.handler()
 def lambda_handler(event, context):
     """
     Lambda function to perform CRUD operations on Git branches in a Gitea repository.
@@ -95,9 +95,8 @@ def process_single_operation(event, context):
         # Build base API URL
         api_base = f"{parsed_url.scheme}://{parsed_url.netloc}/api/v1"
         
-        # Get authentication token
-        auth_token = get_gitea_token_from_secrets(secret_name)
-        if not auth_token:
+        # Check that the token can be read, it is cached for the requests to Gitea
+        if not gitea_client.get_token(secret_name):
             raise GiteaError(f"Failed to retrieve Gitea token from secret: {secret_name}")
         
         # Create API client context
@@ -105,7 +104,7 @@ def process_single_operation(event, context):
             'api_base': api_base,
             'owner': owner,
             'repo_name': repo_name,
-            'auth_token': auth_token
+            'secret_name': secret_name
         }
         
         # Execute the requested operation
@@ -154,7 +153,6 @@ def create_branch(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -182,7 +180,7 @@ def create_branch(event, api_context):
     print(f"Creating branch with payload: {json.dumps(payload)}")
     print(f"Using URL: {branch_url}")
     
-    response = requests.post(branch_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.post(branch_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -215,15 +213,10 @@ def get_branch(event, api_context):
     
     print(f"Getting information for branch {branch_name} in {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # Get branch information using the API
     branch_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/branches/{branch_name}"
     
-    response = requests.get(branch_url, headers=headers, timeout=TIMEOUT)
+    response = gitea_client.get(branch_url, api_context['secret_name'])
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -254,15 +247,10 @@ def list_branches(event, api_context):
     """List all branches in a repository"""
     print(f"Listing branches in {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # List branches using the API
     branches_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/branches"
     
-    response = requests.get(branches_url, headers=headers, timeout=TIMEOUT)
+    response = gitea_client.get(branches_url, api_context['secret_name'])
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -298,7 +286,6 @@ def update_branch(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -308,7 +295,7 @@ def update_branch(event, api_context):
     
     # First, get the SHA of the old branch
     branch_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/branches/{branch_name}"
-    response = requests.get(branch_url, headers=headers, timeout=TIMEOUT)
+    response = gitea_client.get(branch_url, api_context['secret_name'], headers=headers)
     
     if response.status_code != 200:
         raise GiteaError(f"Failed to get branch information: {response.text}")
@@ -323,14 +310,14 @@ def update_branch(event, api_context):
         "old_branch_name": branch_name
     }
     
-    create_response = requests.post(create_url, headers=headers, json=create_payload, timeout=TIMEOUT)
+    create_response = gitea_client.post(create_url, api_context['secret_name'], headers=headers, json=create_payload)
     
     if create_response.status_code != 201:
         raise GiteaError(f"Failed to create new branch: {create_response.text}")
     
     # Delete the old branch
     delete_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/branches/{branch_name}"
-    delete_response = requests.delete(delete_url, headers=headers, timeout=TIMEOUT)
+    delete_response = gitea_client.delete(delete_url, api_context['secret_name'], headers=headers)
     
     if delete_response.status_code not in (200, 204):
         # If deletion fails, we should report but not fail the whole operation
@@ -357,15 +344,10 @@ def delete_branch(event, api_context):
     
     print(f"Deleting branch {branch_name} from {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # Delete the branch using the API
     branch_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/branches/{branch_name}"
     
-    response = requests.delete(branch_url, headers=headers, timeout=TIMEOUT) 
+    response = gitea_client.delete(branch_url, api_context['secret_name'])
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -382,27 +364,3 @@ def delete_branch(event, api_context):
             "name": api_context['repo_name']
         }
     }
-
-def get_gitea_token_from_secrets(secret_name):
-    """
-    Retrieve Gitea token from AWS Secrets Manager.
-    """
-    if not secret_name:
-        raise ValidationError("No secret name provided")
-        
-    session = boto3.session.Session()
-    secrets_client = session.client(service_name='secretsmanager')
-    
-    try:
-        get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            secret = json.loads(get_secret_value_response['SecretString'])
-            token = secret.get('token') or secret.get('GITEA_TOKEN') or secret.get('giteaToken')
-            if not token:
-                raise ValidationError("Token not found in secret")
-            return token
-    except Exception as e:
-        print(f"Error retrieving secret {secret_name}: {str(e)}")
-        raise GiteaError(f"Failed to retrieve secret: {str(e)}")
-    
-    raise GiteaError("Failed to retrieve token from secret")
\ No newline at end of file
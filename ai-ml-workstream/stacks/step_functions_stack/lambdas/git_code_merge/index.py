@@ -1,11 +1,10 @@
-import boto3
 import json
 import urllib.parse
 import requests
+import gitea_client
+import claim_check
 import base64
 
-TIMEOUT = (10, 15) # 10s for connect, 15s for read
-
 class GiteaError(Exception):
     """Custom exception for Gitea-related errors"""
     pass
@@ -14,6 +13,7 @@ class ValidationError(Exception):
     """Custom exception for input validation errors"""
     pass
 
+@claim_check.handler()
 def lambda_handler(event, context):
     """
     Lambda function to update a file in a specific branch in a Gitea repository.
@@ -62,9 +62,8 @@ def lambda_handler(event, context):
         # Build base API URL
         api_base = f"{parsed_url.scheme}://{parsed_url.netloc}/api/v1"
         
-        # Get authentication token
-        auth_token = get_gitea_token_from_secrets(secret_name)
-        if not auth_token:
+        # Check that the token can be read, it is cached for the requests to Gitea
+        if not gitea_client.get_token(secret_name):
             raise GiteaError(f"Failed to retrieve Gitea token from secret: {secret_name}")
         
         # Create API client context
@@ -72,7 +71,7 @@ def lambda_handler(event, context):
             'api_base': api_base,
             'owner': owner,
             'repo_name': repo_name,
-            'auth_token': auth_token
+            'secret_name': secret_name
         }
         
         # Update the file in the repository
@@ -99,13 +98,12 @@ def update_file(file_path, content, commit_message, branch_name, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
     # First, check if the file exists and get its SHA if it does
     get_file_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/contents/{file_path}?ref={branch_name}"
-    get_response = requests.get(get_file_url, headers=headers, timeout=TIMEOUT)
+    get_response = gitea_client.get(get_file_url, api_context['secret_name'], headers=headers)
     
     sha = None
     if get_response.status_code == 200:
@@ -134,7 +132,7 @@ def update_file(file_path, content, commit_message, branch_name, api_context):
     
     print(f"Updating file with payload: {json.dumps({**payload, 'content': '(content in base64)'})}") 
     
-    response = requests.put(update_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.put(update_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -158,27 +156,3 @@ def update_file(file_path, content, commit_message, branch_name, api_context):
             "name": api_context['repo_name']
         }
     }
-
-def get_gitea_token_from_secrets(secret_name):
-    """
-    Retrieve Gitea token from AWS Secrets Manager.
-    """
-    if not secret_name:
-        raise ValidationError("No secret name provided")
-        
-    session = boto3.session.Session()
-    secrets_client = session.client(service_name='secretsmanager')
-    
-    try:
-        get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            secret = json.loads(get_secret_value_response['SecretString'])
-            token = secret.get('token') or secret.get('GITEA_TOKEN') or secret.get('giteaToken')
-            if not token:
-                raise ValidationError("Token not found in secret")
-            return token
-    except Exception as e:
-        print(f"Error retrieving secret {secret_name}: {str(e)}")
-        raise GiteaError(f"Failed to retrieve secret: {str(e)}")
-    
-    raise GiteaError("Failed to retrieve token from secret")
\ No newline at end of file
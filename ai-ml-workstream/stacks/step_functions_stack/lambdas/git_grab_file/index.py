@@ -1,11 +1,9 @@
-import boto3
-import json
 import urllib.parse
 import requests
+import gitea_client
+import claim_check
 import base64
 
-TIMEOUT = (10, 15) # 10s for connect, 15s for read
-
 class GiteaError(Exception):
     """Custom exception for Gitea-related errors"""
     pass
@@ -14,6 +12,7 @@ class ValidationError(Exception):
     """Custom exception for input validation errors"""
     pass
 
+@claim_check.handler(offload=['content'])
 def lambda_handler(event, context):
     """
     Lambda function to get the contents of a file from a Gitea repository.
@@ -56,13 +55,12 @@ def lambda_handler(event, context):
         # Build base API URL
         api_base = f"{parsed_url.scheme}://{parsed_url.netloc}/api/v1"
         
-        # Get authentication token
-        auth_token = get_gitea_token_from_secrets(secret_name)
-        if not auth_token:
+        # Check that the token can be read, it is cached for the requests to Gitea
+        if not gitea_client.get_token(secret_name):
             raise GiteaError(f"Failed to retrieve Gitea token from secret: {secret_name}")
         
         # Fetch file content
-        file_content, file_info = get_file_content(api_base, owner, repo_name, file_path, branch, auth_token)
+        file_content, file_info = get_file_content(api_base, owner, repo_name, file_path, branch, secret_name)
         
         return {
             "success": True,
@@ -95,13 +93,12 @@ def lambda_handler(event, context):
         traceback.print_exc()
         raise
 
-def get_file_content(api_base, owner, repo_name, file_path, branch, auth_token):
+def get_file_content(api_base, owner, repo_name, file_path, branch, secret_name):
     """Get content of a file from a Git repository"""
     print(f"Getting content for file {file_path} from {owner}/{repo_name}, branch {branch or 'default'}")
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {auth_token}',
         'Accept': 'application/json'
     }
     
@@ -114,7 +111,7 @@ def get_file_content(api_base, owner, repo_name, file_path, branch, auth_token):
         params['ref'] = branch
     
     # Make the API request
-    response = requests.get(contents_url, headers=headers, params=params, timeout=TIMEOUT)
+    response = gitea_client.get(contents_url, secret_name, headers=headers, params=params)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -152,27 +149,3 @@ def get_file_content(api_base, owner, repo_name, file_path, branch, auth_token):
     }
     
     return file_content, file_info
-
-def get_gitea_token_from_secrets(secret_name):
-    """
-    Retrieve Gitea token from AWS Secrets Manager.
-    """
-    if not secret_name:
-        raise ValidationError("No secret name provided")
-        
-    session = boto3.session.Session()
-    secrets_client = session.client(service_name='secretsmanager')
-    
-    try:
-        get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            secret = json.loads(get_secret_value_response['SecretString'])
-            token = secret.get('token') or secret.get('GITEA_TOKEN') or secret.get('giteaToken')
-            if not token:
-                raise ValidationError("Token not found in secret")
-            return token
-    except Exception as e:
-        print(f"Error retrieving secret {secret_name}: {str(e)}")
-        raise GiteaError(f"Failed to retrieve secret: {str(e)}")
-    
-    raise GiteaError("Failed to retrieve token from secret")
\ No newline at end of file
@@ -1,9 +1,8 @@
-import boto3
 import json
 import urllib.parse
 import requests
-
-TIMEOUT = (10, 15) # 10s for connect, 15s for read
+import gitea_client
+import claim_check
 
 class GiteaError(Exception):
     """Custom exception for Gitea-related errors"""
@@ -13,6 +12,7 @@ class ValidationError(Exception):
     """Custom exception for input validation errors"""
     pass
 
+@claim_check.handler()
 def lambda_handler(event, context):
     """
     Lambda function to perform CRUD operations on Git issues in a Gitea repository.
@@ -58,9 +58,8 @@ def lambda_handler(event, context):
         # Build base API URL
         api_base = f"{parsed_url.scheme}://{parsed_url.netloc}/api/v1"
         
-        # Get authentication token
-        auth_token = get_gitea_token_from_secrets(secret_name)
-        if not auth_token:
+        # Check that the token can be read, it is cached for the requests to Gitea
+        if not gitea_client.get_token(secret_name):
             raise GiteaError(f"Failed to retrieve Gitea token from secret: {secret_name}")
         
         # Create API client context
@@ -68,7 +67,7 @@ def lambda_handler(event, context):
             'api_base': api_base,
             'owner': owner,
             'repo_name': repo_name,
-            'auth_token': auth_token
+            'secret_name': secret_name
         }
         
         # Execute the requested operation
@@ -117,7 +116,6 @@ def create_issue(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -155,7 +153,7 @@ def create_issue(event, api_context):
     print(f"Creating issue with payload: {json.dumps(payload)}")
     print(f"Using URL: {issue_url}")
     
-    response = requests.post(issue_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.post(issue_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -178,7 +176,7 @@ def create_issue(event, api_context):
             
             # Get SHA of the branch
             branch_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/branches/{branch}"
-            branch_response = requests.get(branch_url, headers=headers, timeout=TIMEOUT)
+            branch_response = gitea_client.get(branch_url, api_context['secret_name'], headers=headers)
             
             if branch_response.status_code != 200:
                 print(f"Warning: Unable to find branch '{branch}'. Status: {branch_response.status_code}")
@@ -194,13 +192,13 @@ def create_issue(event, api_context):
                         "branch": branch
                     }
                     
-                    ref_response = requests.post(ref_url, headers=headers, json=ref_payload, timeout=TIMEOUT)
+                    ref_response = gitea_client.post(ref_url, api_context['secret_name'], headers=headers, json=ref_payload)
                     print(f"Branch attachment response: {ref_response.status_code}")
                     
                     # Method 3: Create a Git reference (this might be more for PRs)
                     # Some Gitea instances might support this format
                     gitref_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/git/refs/heads/{branch}"
-                    gitref_response = requests.get(gitref_url, headers=headers, timeout=TIMEOUT)
+                    gitref_response = gitea_client.get(gitref_url, api_context['secret_name'], headers=headers)
                     print(f"Git ref response: {gitref_response.status_code}")
         except Exception as e:
             print(f"Warning: Failed to link branch to issue: {str(e)}")
@@ -226,15 +224,10 @@ def get_issue(event, api_context):
     
     print(f"Getting information for issue {issue_id} in {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # Get issue information using the API
     issue_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/issues/{issue_id}"
     
-    response = requests.get(issue_url, headers=headers, timeout=TIMEOUT)
+    response = gitea_client.get(issue_url, api_context['secret_name'])
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -284,11 +277,6 @@ def list_issues(event, api_context):
     
     print(f"Listing issues in {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # List issues using the API
     issues_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/issues"
     
@@ -301,7 +289,7 @@ def list_issues(event, api_context):
     if milestone:
         params['milestone'] = milestone
     
-    response = requests.get(issues_url, headers=headers, params=params, timeout=TIMEOUT)
+    response = gitea_client.get(issues_url, api_context['secret_name'], params=params)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -355,13 +343,12 @@ def update_issue(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
     # First get current issue details
     get_issue_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/issues/{issue_id}"
-    get_response = requests.get(get_issue_url, headers=headers, timeout=TIMEOUT)
+    get_response = gitea_client.get(get_issue_url, api_context['secret_name'], headers=headers)
     
     if get_response.status_code != 200:
         raise GiteaError(f"Failed to get issue information: {get_response.text}")
@@ -423,7 +410,7 @@ def update_issue(event, api_context):
     
     # Update the issue using the API
     issue_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/issues/{issue_id}"
-    response = requests.patch(issue_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.patch(issue_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -442,7 +429,7 @@ def update_issue(event, api_context):
     
     # If we didn't get JSON data back but the status was successful, fetch the issue again
     if not issue_data and 200 <= response.status_code < 300:
-        get_response = requests.get(get_issue_url, headers=headers, timeout=TIMEOUT)
+        get_response = gitea_client.get(get_issue_url, api_context['secret_name'], headers=headers)
         if get_response.status_code == 200:
             issue_data = get_response.json()
         else:
@@ -482,17 +469,12 @@ def delete_issue(event, api_context):
     
     print(f"Deleting issue {issue_id} from {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # NOTE: Gitea might not support direct issue deletion through API
     # A common approach is to close the issue instead
     issue_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/issues/{issue_id}"
     
     # Try to delete, but if not supported, close the issue instead
-    response = requests.delete(issue_url, headers=headers, timeout=TIMEOUT)
+    response = gitea_client.delete(issue_url, api_context['secret_name'])
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -508,11 +490,11 @@ def delete_issue(event, api_context):
         # If direct deletion is not supported, try closing the issue
         print("Direct deletion not supported, attempting to close the issue instead")
         close_payload = {"state": "closed"}
-        close_response = requests.patch(
+        close_response = gitea_client.patch(
             issue_url, 
-            headers={**headers, 'Content-Type': 'application/json'}, 
-            json=close_payload,
-            timeout=TIMEOUT
+            api_context['secret_name'],
+            headers={'Content-Type': 'application/json'},
+            json=close_payload
         )
         
         if close_response.status_code != 200:
@@ -537,27 +519,3 @@ def delete_issue(event, api_context):
             "name": api_context['repo_name']
         }
     }
-
-def get_gitea_token_from_secrets(secret_name):
-    """
-    Retrieve Gitea token from AWS Secrets Manager.
-    """
-    if not secret_name:
-        raise ValidationError("No secret name provided")
-        
-    session = boto3.session.Session()
-    secrets_client = session.client(service_name='secretsmanager')
-    
-    try:
-        get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            secret = json.loads(get_secret_value_response['SecretString'])
-            token = secret.get('token') or secret.get('GITEA_TOKEN') or secret.get('giteaToken')
-            if not token:
-                raise ValidationError("Token not found in secret")
-            return token
-    except Exception as e:
-        print(f"Error retrieving secret {secret_name}: {str(e)}")
-        raise GiteaError(f"Failed to retrieve secret: {str(e)}")
-    
-    raise GiteaError("Failed to retrieve token from secret")
\ No newline at end of file
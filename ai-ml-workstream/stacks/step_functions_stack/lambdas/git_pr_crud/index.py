@@ -1,9 +1,8 @@
-import boto3
 import json
 import urllib.parse
 import requests
-
-TIMEOUT = (10, 15) # 10s for connect, 15s for read
+import gitea_client
+import claim_check
 
 class GiteaError(Exception):
     """Custom exception for Gitea-related errors"""
@@ -13,6 +12,7 @@ class ValidationError(Exception):
     """Custom exception for input validation errors"""
     pass
 
+@claim_check.handler()
 def lambda_handler(event, context):
     """
     Lambda function to perform CRUD operations on pull requests in a Gitea repository.
@@ -70,9 +70,8 @@ def lambda_handler(event, context):
         # Build base API URL
         api_base = f"{parsed_url.scheme}://{parsed_url.netloc}/api/v1"
         
-        # Get authentication token
-        auth_token = get_gitea_token_from_secrets(secret_name)
-        if not auth_token:
+        # Check that the token can be read, it is cached for the requests to Gitea
+        if not gitea_client.get_token(secret_name):
             raise GiteaError(f"Failed to retrieve Gitea token from secret: {secret_name}")
         
         # Create API client context
@@ -80,7 +79,7 @@ def lambda_handler(event, context):
             'api_base': api_base,
             'owner': owner,
             'repo_name': repo_name,
-            'auth_token': auth_token
+            'secret_name': secret_name
         }
         
         # Execute the requested operation
@@ -136,7 +135,6 @@ def create_pull_request(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -154,7 +152,7 @@ def create_pull_request(event, api_context):
     print(f"Creating PR with payload: {json.dumps(payload)}")
     
     # Create the PR
-    response = requests.post(pr_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.post(pr_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -200,15 +198,10 @@ def get_pull_request(event, api_context):
     
     print(f"Getting PR #{pr_number} in {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # Get the pull request using the API
     pr_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/pulls/{pr_number}"
     
-    response = requests.get(pr_url, headers=headers, timeout=TIMEOUT)
+    response = gitea_client.get(pr_url, api_context['secret_name'])
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -244,11 +237,6 @@ def list_pull_requests(event, api_context):
     
     print(f"Listing {state} PRs in {api_context['owner']}/{api_context['repo_name']}")
     
-    # Set up headers for API requests
-    headers = {
-        'Authorization': f'token {api_context["auth_token"]}'
-    }
-    
     # Build query parameters
     params = {'state': state}
     if sort:
@@ -259,7 +247,7 @@ def list_pull_requests(event, api_context):
     # List pull requests using the API
     pr_url = f"{api_context['api_base']}/repos/{api_context['owner']}/{api_context['repo_name']}/pulls"
     
-    response = requests.get(pr_url, headers=headers, params=params, timeout=TIMEOUT)
+    response = gitea_client.get(pr_url, api_context['secret_name'], params=params)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -298,7 +286,6 @@ def update_pull_request(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -317,7 +304,7 @@ def update_pull_request(event, api_context):
     print(f"Updating PR with payload: {json.dumps(payload)}")
     
     # Update the PR
-    response = requests.patch(pr_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.patch(pr_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -380,7 +367,6 @@ def close_pull_request(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -393,7 +379,7 @@ def close_pull_request(event, api_context):
     }
     
     # Close the PR
-    response = requests.patch(pr_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.patch(pr_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -460,7 +446,6 @@ def merge_pull_request(event, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -478,7 +463,7 @@ def merge_pull_request(event, api_context):
     print(f"Merging PR with payload: {json.dumps(payload)}")
     
     # Merge the PR
-    response = requests.post(merge_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.post(merge_url, api_context['secret_name'], headers=headers, json=payload)
     
     # Log response details
     print(f"Response status code: {response.status_code}")
@@ -536,7 +521,6 @@ def add_labels_to_pr(pr_number, labels, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -546,7 +530,7 @@ def add_labels_to_pr(pr_number, labels, api_context):
     payload = labels
     
     # Add the labels
-    response = requests.post(labels_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.post(labels_url, api_context['secret_name'], headers=headers, json=payload)
     
     if response.status_code not in (200, 201):
         print(f"Warning: Failed to add labels to PR #{pr_number}: {response.text}")
@@ -560,7 +544,6 @@ def add_assignees_to_pr(pr_number, assignees, api_context):
     
     # Set up headers for API requests
     headers = {
-        'Authorization': f'token {api_context["auth_token"]}',
         'Content-Type': 'application/json'
     }
     
@@ -572,31 +555,7 @@ def add_assignees_to_pr(pr_number, assignees, api_context):
     }
     
     # Add the assignees
-    response = requests.post(assignees_url, headers=headers, json=payload, timeout=TIMEOUT)
+    response = gitea_client.post(assignees_url, api_context['secret_name'], headers=headers, json=payload)
     
     if response.status_code not in (200, 201):
         print(f"Warning: Failed to add assignees to PR #{pr_number}: {response.text}")
-
-def get_gitea_token_from_secrets(secret_name):
-    """
-    Retrieve Gitea token from AWS Secrets Manager.
-    """
-    if not secret_name:
-        raise ValidationError("No secret name provided")
-        
-    session = boto3.session.Session()
-    secrets_client = session.client(service_name='secretsmanager')
-    
-    try:
-        get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            secret = json.loads(get_secret_value_response['SecretString'])
-            token = secret.get('token') or secret.get('GITEA_TOKEN') or secret.get('giteaToken')
-            if not token:
-                raise ValidationError("Token not found in secret")
-            return token
-    except Exception as e:
-        print(f"Error retrieving secret {secret_name}: {str(e)}")
-        raise GiteaError(f"Failed to retrieve secret: {str(e)}")
-    
-    raise GiteaError("Failed to retrieve token from secret")
\ No newline at end of file
@@ -1,14 +1,57 @@
 import json
 import os
+import random
+import time
 import boto3
-import defusedxml.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-import requests
 import uuid
 import urllib.parse
 from decimal import Decimal
+from fvdl_parser import iter_vulnerabilities
+import gitea_client
 
-TIMEOUT = (10, 15) # 10s for connect, 15s for read
+# Scan result files are downloaded concurrently over the pooled session of gitea_client
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# XML files are scan results if <FVDL appears in their first bytes
+SNIFF_SIZE = 1000
+TREE_PAGE_SIZE = 1000
+
+# Each project has a latest scan pointer item in the findings table, with the blob SHA and
+# scan timestamp of its FVDL files. It is not a finding, so it has no scanKey, which keeps it
+# out of the project scan index. It is written as pending before the findings of a scan, and
+# as complete once they are all written.
+LATEST_SCAN_PREFIX = 'LATEST_SCAN#'
+LATEST_SCAN_RECORD_TYPE = 'latestScan'
+SCAN_PENDING = 'PENDING'
+SCAN_COMPLETE = 'COMPLETE'
+
+# BatchWriteItem accepts up to 25 items per request
+BATCH_SIZE = 25
+MAX_BATCH_ATTEMPTS = 8
+BASE_BACKOFF = 0.05  # seconds
+MAX_BACKOFF = 5  # seconds
+MAX_WRITE_WORKERS = 4
+
+# Vulnerability fields, and the item attributes they are saved as - extended to include relative paths
+FIELDS_TO_COPY = [
+    ('ClassID', 'classID'),
+    ('Kingdom', 'kingdom'),
+    ('Type', 'type'),
+    ('Subtype', 'subtype'),
+    ('DefaultSeverity', 'defaultSeverity'),
+    ('InstanceSeverity', 'severity'),
+    ('Confidence', 'confidence'),
+    ('Function', 'function'),
+    ('SourceFile', 'sourceFile'),
+    ('SourceFileRelative', 'sourceFileRelative'),  # Added relative path
+    ('Line', 'line'),
+    ('PrimaryFile', 'primaryFile'),
+    ('PrimaryFileRelative', 'primaryFileRelative'),  # Added relative path
+    ('PrimaryLine', 'primaryLine'),
+    ('PrimaryCall', 'primaryCall')
+]
 
 def get_relative_path(base_path, absolute_path):
     """
@@ -32,27 +75,15 @@ def get_relative_path(base_path, absolute_path):
     # If not a subfolder, return the absolute path
     return absolute_path
 
-def get_gitea_token_from_secrets(secret_name):
-    """
-    Retrieve Gitea token from AWS Secrets Manager.
-    """
-    session = boto3.session.Session()
-    secrets_client = session.client(service_name='secretsmanager')
-    
-    try:
-        get_secret_value_response = secrets_client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            secret = json.loads(get_secret_value_response['SecretString'])
-            return secret.get('token') or secret.get('GITEA_TOKEN') or secret.get('giteaToken')
-    except Exception as e:
-        print(f"Error retrieving secret {secret_name}: {str(e)}")
-    
-    return None
-
-def download_files_from_gitea(repo_url, branch, secret_name=None):
+def download_files_from_gitea(repo_url, branch, secret_name=None, processed_blobs=None):
     """
-    Downloads files from Gitea repository using HTTP requests.
-    Returns a list of downloaded file paths.
+    Downloads the FVDL files from Gitea repository using HTTP requests.
+    The whole tree is listed with one (paged) call to the git trees API, and the candidate files are
+    downloaded concurrently. If the FVDL files are exactly those of `processed_blobs` ({path: sha}),
+    with the same blob SHAs, they are all skipped. Otherwise they are all downloaded, as a finding
+    found in several files is saved with the path of only one of them, which may be unchanged.
+    Returns the downloaded files, as dicts with the local 'file', repository 'path' and blob 'sha',
+    and the paths of the files skipped.
     """
     # Parse repository URL
     parsed_url = urllib.parse.urlparse(repo_url)
@@ -64,119 +95,159 @@ def download_files_from_gitea(repo_url, branch, secret_name=None):
     
     # Build base API URL
     api_base = f"{parsed_url.scheme}://{parsed_url.netloc}/api/v1"
-    api_url = f"{api_base}/repos/{owner}/{repo_name}/contents"
+    repo_api_url = f"{api_base}/repos/{owner}/{repo_name}"
     
-    # Get authentication token from Secrets Manager if provided
-    auth_token = None
-    if secret_name:
-        auth_token = get_gitea_token_from_secrets(secret_name)
-        print(f"Retrieved token from Secrets Manager: {secret_name}")
+    # Requests are authenticated with the token of the secret, if provided
+    if secret_name and not gitea_client.get_token(secret_name):
+        print(f"Failed to retrieve Gitea token from secret: {secret_name}")
     
-    # Set up headers for API requests
-    headers = {}
-    if auth_token:
-        headers['Authorization'] = f'token {auth_token}'
+    ref = branch or get_default_branch(repo_api_url, secret_name)
+    candidates = []
+    for entry in list_tree(repo_api_url, ref, secret_name):
+        # Check if it's an XML or FVDL file
+        if entry['type'] != 'blob' or not entry['path'].lower().endswith(('.xml', '.fvdl')):
+            continue
+        candidates.append(entry)
+
+    if processed_blobs and processed_blobs == {entry['path']: entry['sha'] for entry in candidates}:
+        print(f"Skipping {len(candidates)} unchanged file(s)")
+        return [], [entry['path'] for entry in candidates]
     
-    # List of downloaded files
-    downloaded_files = []
+    print(f"Downloading {len(candidates)} candidate file(s)")
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        futures = [
+            executor.submit(download_fvdl_file, repo_api_url, ref, entry, secret_name)
+            for entry in candidates
+        ]
+        downloaded_files = [future.result() for future in futures]
     
-    # Function to recursively fetch files
-    def fetch_directory_contents(path=""):
-        nonlocal downloaded_files
-        
-        url = f"{api_url}/{path}" if path else api_url
-        params = {'ref': branch} if branch else {}
-        
+    return [f for f in downloaded_files if f], []
+
+def get_default_branch(repo_api_url, secret_name):
+    response = gitea_client.get(repo_api_url, secret_name)
+    response.raise_for_status()
+    return response.json()['default_branch']
+
+def list_tree(repo_api_url, ref, secret_name):
+    """
+    Yields the entries of the whole tree of `ref`, a branch, tag or commit.
+    Gitea truncates the tree to a page, so the pages are requested until it is complete.
+    """
+    page = 1
+    while True:
+        url = f"{repo_api_url}/git/trees/{urllib.parse.quote(ref, safe='')}"
+        params = {'recursive': 'true', 'page': page, 'per_page': TREE_PAGE_SIZE}
         print(f"Fetching: {url} with params {params}")
-        response = requests.get(url, headers=headers, params=params, timeout=TIMEOUT)
+        response = gitea_client.get(url, secret_name, params=params)
+        response.raise_for_status()
+        tree = response.json()
         
-        if response.status_code != 200:
-            print(f"Error fetching directory {path}: {response.status_code} {response.text}")
+        entries = tree.get('tree') or []
+        yield from entries
+        if not tree.get('truncated') or not entries:
             return
+        page += 1
+
+def download_fvdl_file(repo_api_url, ref, entry, secret_name):
+    """
+    Streams the file to /tmp. XML files are only written if their first chunk contains
+    FVDL content. Returns the downloaded file, or None.
+    """
+    url = f"{repo_api_url}/raw/{urllib.parse.quote(entry['path'])}"
+    with gitea_client.get(url, secret_name, params={'ref': ref}, stream=True) as response:
+        if response.status_code != 200:
+            print(f"Error downloading {entry['path']}: {response.status_code} {response.text}")
+            return None
         
-        contents = response.json()
+        chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+        head = b''
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= SNIFF_SIZE:
+                break
         
-        # Process each item
-        for item in contents:
-            if item['type'] == 'file':
-                # Check if it's an XML or FVDL file
-                if item['name'].lower().endswith(('.xml', '.fvdl')):
-                    # Download the file
-                    download_url = item['download_url']
-                    file_response = requests.get(download_url, headers=headers, timeout=TIMEOUT)
-                    
-                    if file_response.status_code == 200:
-                        # Save to a temporary file
-                        temp_file = os.path.join('/tmp', f"{uuid.uuid4().hex}_{item['name']}")
-                        with open(temp_file, 'wb') as f:
-                            f.write(file_response.content)
-                        
-                        # For XML files, check if it contains FVDL content
-                        if item['name'].lower().endswith('.xml'):
-                            try:
-                                with open(temp_file, 'r', encoding="utf-8") as f:
-                                    content = f.read(1000)  # Just read the beginning
-                                    if '<FVDL' in content:
-                                        downloaded_files.append(temp_file)
-                                        print(f"Found FVDL file: {item['name']}")
-                                    else:
-                                        os.remove(temp_file)
-                            except:
-                                os.remove(temp_file)
-                        else:
-                            downloaded_files.append(temp_file)
-                            print(f"Downloaded FVDL file: {item['name']}")
-            
-            elif item['type'] == 'dir':
-                # Recursively explore directories
-                subdir_path = f"{path}/{item['name']}" if path else item['name']
-                fetch_directory_contents(subdir_path)
-    
-    # Start recursive fetch
-    fetch_directory_contents()
+        # For XML files, check if it contains FVDL content, before anything is written
+        if entry['path'].lower().endswith('.xml') and b'<FVDL' not in head[:SNIFF_SIZE]:
+            return None
+
+        file_name = os.path.basename(entry['path'])
+        temp_file = os.path.join('/tmp', f"{uuid.uuid4().hex}_{file_name}")
+        with open(temp_file, 'wb') as f:
+            f.write(head)
+            for chunk in chunks:
+                f.write(chunk)
     
-    return downloaded_files
+    print(f"Downloaded FVDL file: {entry['path']}")
+    return {'file': temp_file, 'path': entry['path'], 'sha': entry['sha']}
 
-def parse_fvdl(file_path, base_path=''):
+def get_latest_scan(table_name, project_name):
     """
-    Simplified parser for FVDL XML file to extract vulnerabilities.
+    Returns the FVDL files of the latest scan of the project ({path: {'sha', 'scanTimestamp'}}),
+    or an empty dict if the project has not been scanned into this table, or its latest scan
+    did not complete
+    """
+    table = boto3.resource('dynamodb').Table(table_name)
+    try:
+        response = table.get_item(Key={'InstanceID': get_latest_scan_id(project_name)}, ConsistentRead=True)
+    except Exception as e:
+        print(f"Error reading the latest scan of {project_name}: {str(e)}")
+        return {}
+    item = response.get('Item', {})
+    # Pointers written before the scan status was added are complete
+    if item.get('scanStatus') == SCAN_PENDING:
+        print(f"The latest scan of {project_name} did not complete, processing all files")
+        return {}
+    return item.get('files', {})
+
+def put_latest_scan(table_name, project_name, scan_timestamp, files, scan_status=SCAN_COMPLETE):
+    """
+    Points the project at its latest scan: the findings of each FVDL file in `files` are
+    the items of the project written at the file's scanTimestamp, with the file's fvdlPath.
+    A pending scan, whose findings are still being written, is not queried.
+    """
+    table = boto3.resource('dynamodb').Table(table_name)
+    table.put_item(Item={
+        'InstanceID': get_latest_scan_id(project_name),
+        'recordType': LATEST_SCAN_RECORD_TYPE,
+        'projectName': project_name,
+        'scanTimestamp': scan_timestamp,
+        'scanStatus': scan_status,
+        'files': files
+    })
+
+def get_latest_scan_id(project_name):
+    return f"{LATEST_SCAN_PREFIX}{project_name}"
+
+def parse_fvdl(file_path, build_info, base_path=''):
+    """
+    Yields the vulnerabilities of the FVDL file one at a time, with their git relative paths.
+    `build_info` is filled in with the Build information before the first vulnerability.
+    """
+    relative_dir = None
+
+    def get_file_name_from_path(path):
+        """Extract just the file name from a path."""
+        return os.path.basename(path) if path else ""
+
+    for vuln_data in iter_vulnerabilities(file_path, build_info):
+        if relative_dir is None:
+            relative_dir = get_relative_dir(build_info.get('SourceBasePath', ''), base_path)
+
+        # Add git relative paths - simply join relative dir with filename
+        for field in ['SourceFile', 'PrimaryFile']:
+            if field in vuln_data:
+                file_name = get_file_name_from_path(vuln_data[field])
+                vuln_data[f'{field}Relative'] = os.path.join(relative_dir, file_name) if relative_dir else file_name
+
+        yield vuln_data
+
+def get_relative_dir(source_base_path, base_path):
+    """
+    Calculate the relative directory by removing base_path from source_base_path
     """
-    # Parse the XML
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
-    # Check for namespace
-    namespace = ''
-    if '}' in root.tag:
-        namespace = '{' + root.tag.split('}')[0].strip('{') + '}'
-    
-    # Extract build information
-    build_info = {}
-    build_elem = root.find(f'.//{namespace}Build')
-    if build_elem is not None:
-        build_id_elem = build_elem.find(f'./{namespace}BuildID')
-        if build_id_elem is not None and build_id_elem.text:
-            build_info['BuildID'] = build_id_elem.text
-            
-        num_files_elem = build_elem.find(f'./{namespace}NumberFiles')
-        if num_files_elem is not None and num_files_elem.text:
-            build_info['NumberFiles'] = int(num_files_elem.text)
-            
-        source_base_elem = build_elem.find(f'./{namespace}SourceBasePath')
-        if source_base_elem is not None and source_base_elem.text:
-            build_info['SourceBasePath'] = source_base_elem.text
-            
-        # Extract scan time if available
-        scan_time_elem = build_elem.find(f'./{namespace}ScanTime')
-        if scan_time_elem is not None and scan_time_elem.get('value'):
-            build_info['ScanTime'] = scan_time_elem.get('value')
-    
-    # Get the source base path from build info
-    source_base_path = build_info.get('SourceBasePath', '')
     print(f"Source base path from FVDL: '{source_base_path}'")
     print(f"Git base path from event: '{base_path}'")
-    
-    # Calculate the relative directory by removing base_path from source_base_path
+
     relative_dir = ""
     if base_path and source_base_path and source_base_path.startswith(base_path):
         relative_dir = source_base_path[len(base_path):]
@@ -186,116 +257,7 @@ def parse_fvdl(file_path, base_path=''):
         print(f"Calculated relative directory: '{relative_dir}'")
     else:
         print(f"Warning: source_base_path does not start with base_path")
-        
-    def get_file_name_from_path(path):
-        """Extract just the file name from a path."""
-        return os.path.basename(path) if path else ""
-    
-    # Extract vulnerabilities
-    vulnerabilities = []
-    vuln_elems = root.findall(f'.//{namespace}Vulnerabilities/{namespace}Vulnerability')
-    
-    for vuln_elem in vuln_elems:
-        vuln_data = {}
-        
-        # Extract ClassInfo
-        class_info = vuln_elem.find(f'./{namespace}ClassInfo')
-        if class_info is not None:
-            class_id_elem = class_info.find(f'./{namespace}ClassID')
-            if class_id_elem is not None and class_id_elem.text:
-                vuln_data['ClassID'] = class_id_elem.text
-                
-            kingdom_elem = class_info.find(f'./{namespace}Kingdom')
-            if kingdom_elem is not None and kingdom_elem.text:
-                vuln_data['Kingdom'] = kingdom_elem.text
-                
-            type_elem = class_info.find(f'./{namespace}Type')
-            if type_elem is not None and type_elem.text:
-                vuln_data['Type'] = type_elem.text
-                
-            subtype_elem = class_info.find(f'./{namespace}Subtype')
-            if subtype_elem is not None and subtype_elem.text:
-                vuln_data['Subtype'] = subtype_elem.text
-                
-            severity_elem = class_info.find(f'./{namespace}DefaultSeverity')
-            if severity_elem is not None and severity_elem.text:
-                try:
-                    # Store as string to avoid float issues with DynamoDB
-                    vuln_data['DefaultSeverity'] = severity_elem.text
-                except ValueError:
-                    pass
-        
-        # Extract InstanceInfo
-        instance_info = vuln_elem.find(f'./{namespace}InstanceInfo')
-        if instance_info is not None:
-            instance_id_elem = instance_info.find(f'./{namespace}InstanceID')
-            if instance_id_elem is not None and instance_id_elem.text:
-                vuln_data['InstanceID'] = instance_id_elem.text
-                
-            severity_elem = instance_info.find(f'./{namespace}InstanceSeverity')
-            if severity_elem is not None and severity_elem.text:
-                try:
-                    # Store as string to avoid float issues with DynamoDB
-                    vuln_data['InstanceSeverity'] = severity_elem.text
-                except ValueError:
-                    pass
-                
-            confidence_elem = instance_info.find(f'./{namespace}Confidence')
-            if confidence_elem is not None and confidence_elem.text:
-                try:
-                    # Store as string to avoid float issues with DynamoDB
-                    vuln_data['Confidence'] = confidence_elem.text
-                except ValueError:
-                    pass
-        
-        # Extract relevant AnalysisInfo details
-        analysis_info = vuln_elem.find(f'./{namespace}AnalysisInfo')
-        if analysis_info is not None:
-            unified = analysis_info.find(f'./{namespace}Unified')
-            if unified is not None:
-                # Get function information
-                context = unified.find(f'./{namespace}Context')
-                if context is not None:
-                    function_elem = context.find(f'./{namespace}Function')
-                    if function_elem is not None and function_elem.get('name'):
-                        vuln_data['Function'] = function_elem.get('name')
-                    
-                    # Get source location
-                    src_loc = context.find(f'./{namespace}FunctionDeclarationSourceLocation') 
-                    if src_loc is not None:
-                        if src_loc.get('path'):
-                            source_file = src_loc.get('path')
-                            vuln_data['SourceFile'] = source_file
-                            # Add git relative path - simply join relative dir with filename
-                            file_name = get_file_name_from_path(source_file)
-                            vuln_data['SourceFileRelative'] = os.path.join(relative_dir, file_name) if relative_dir else file_name
-                        if src_loc.get('line'):
-                            try:
-                                vuln_data['Line'] = int(src_loc.get('line'))
-                            except ValueError:
-                                pass
-                
-                # Get primary location from ReplacementDefinitions
-                repl_defs = unified.find(f'./{namespace}ReplacementDefinitions')
-                if repl_defs is not None:
-                    for def_elem in repl_defs.findall(f'./{namespace}Def'):
-                        if def_elem.get('key') == 'PrimaryLocation.file':
-                            primary_file = def_elem.get('value')
-                            vuln_data['PrimaryFile'] = primary_file
-                            # Add git relative path - simply join relative dir with filename
-                            file_name = get_file_name_from_path(primary_file)
-                            vuln_data['PrimaryFileRelative'] = os.path.join(relative_dir, file_name) if relative_dir else file_name
-                        elif def_elem.get('key') == 'PrimaryLocation.line':
-                            try:
-                                vuln_data['PrimaryLine'] = int(def_elem.get('value'))
-                            except ValueError:
-                                pass
-                        elif def_elem.get('key') == 'PrimaryCall.name':
-                            vuln_data['PrimaryCall'] = def_elem.get('value')
-        
-        vulnerabilities.append(vuln_data)
-    
-    return vulnerabilities, build_info
+    return relative_dir
 
 def float_to_decimal(obj):
     """Helper function to convert float values to Decimal for DynamoDB compatibility"""
@@ -314,60 +276,120 @@ def float_to_decimal(obj):
     else:
         return obj
 
-def save_to_dynamodb(vulnerabilities, build_info, table_name, project_name, scan_timestamp=None):
-    """Save vulnerability data to DynamoDB."""
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(table_name)
-    
+def get_write_workers(dynamodb_client, table_name):
+    """
+    Returns the number of threads writing batches to the table: one per 25 write capacity
+    units of a provisioned table, as a batch of small items uses 25, up to MAX_WRITE_WORKERS.
+    """
+    try:
+        table = dynamodb_client.describe_table(TableName=table_name)['Table']
+    except Exception as e:
+        print(f"Error describing table {table_name}, writing with 1 thread: {str(e)}")
+        return 1
+
+    billing_mode = table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED')
+    if billing_mode == 'PAY_PER_REQUEST':
+        return MAX_WRITE_WORKERS
+    write_capacity = table.get('ProvisionedThroughput', {}).get('WriteCapacityUnits', 0)
+    return max(1, min(MAX_WRITE_WORKERS, write_capacity // BATCH_SIZE))
+
+def batch_write(dynamodb_client, table_name, items):
+    """
+    Writes up to 25 items with BatchWriteItem, retrying the unprocessed items with
+    exponential backoff and full jitter. Returns the number of items.
+    """
+    put_requests = [{'PutRequest': {'Item': item}} for item in items]
+    for attempt in range(MAX_BATCH_ATTEMPTS):
+        response = dynamodb_client.batch_write_item(RequestItems={table_name: put_requests})
+        put_requests = response.get('UnprocessedItems', {}).get(table_name)
+        if not put_requests:
+            return len(items)
+        time.sleep(random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)))  # nosec B311
+
+    raise Exception(f"{len(put_requests)} item(s) still unprocessed after {MAX_BATCH_ATTEMPTS} attempts")
+
+def create_item(vuln, item_build_info, project_name, scan_timestamp, fvdl_path=None):
+    item = {
+        'projectName': project_name,
+        'scanTimestamp': scan_timestamp,
+        'InstanceID': vuln.get('InstanceID'),  # Keep the original attribute name
+        # Sort key of the project scan index, which queries the findings of one scan
+        'scanKey': f"{scan_timestamp}#{vuln.get('InstanceID')}"
+    }
+    if fvdl_path:
+        item['fvdlPath'] = fvdl_path
+
+    # Add build info
+    item.update(item_build_info)
+
+    for src_field, dest_field in FIELDS_TO_COPY:
+        if src_field in vuln and vuln[src_field]:
+            # Convert any float values to Decimal
+            item[dest_field] = float_to_decimal(vuln[src_field])
+
+    return item
+
+def save_to_dynamodb(vulnerabilities, build_info, table_name, project_name, scan_timestamp=None, seen_ids=None, workers=None, fvdl_path=None):
+    """
+    Save vulnerability data to DynamoDB with BatchWriteItem, spreading the batches over `workers` threads.
+    `vulnerabilities` may be a generator that fills in `build_info` as it goes: at most two batches
+    per thread are held in memory. `seen_ids` are the InstanceIDs already saved in this run, which
+    are skipped, as a batch cannot hold two items with the same key. `fvdl_path` is the path of the
+    FVDL file in the scan results repository.
+    Returns the numbers of vulnerabilities, items written and duplicates skipped.
+    """
+    dynamodb_client = boto3.resource('dynamodb').meta.client
+
     # Generate timestamp if not provided
     if scan_timestamp is None:
         scan_timestamp = datetime.now().isoformat()
-    
-    # Convert build_info numbers to Decimal
-    build_info = float_to_decimal(build_info)
-    
-    for vuln in vulnerabilities:
-        # Check if the vulnerability has an InstanceID
-        if 'InstanceID' not in vuln:
-            print(f"Skipping vulnerability without InstanceID: {vuln}")
-            continue
-            
-        item = {
-            'projectName': project_name,
-            'scanTimestamp': scan_timestamp,
-            'InstanceID': vuln.get('InstanceID')  # Keep the original attribute name
-        }
-        
-        # Add build info
-        for key, value in build_info.items():
-            item[key] = value
-        
-        # Add vulnerability fields - extended to include relative paths
-        fields_to_copy = [
-            ('ClassID', 'classID'), 
-            ('Kingdom', 'kingdom'), 
-            ('Type', 'type'), 
-            ('Subtype', 'subtype'), 
-            ('DefaultSeverity', 'defaultSeverity'),
-            ('InstanceSeverity', 'severity'), 
-            ('Confidence', 'confidence'), 
-            ('Function', 'function'),
-            ('SourceFile', 'sourceFile'), 
-            ('SourceFileRelative', 'sourceFileRelative'),  # Added relative path
-            ('Line', 'line'),
-            ('PrimaryFile', 'primaryFile'), 
-            ('PrimaryFileRelative', 'primaryFileRelative'),  # Added relative path
-            ('PrimaryLine', 'primaryLine'),
-            ('PrimaryCall', 'primaryCall')
-        ]
-        
-        for src_field, dest_field in fields_to_copy:
-            if src_field in vuln and vuln[src_field]:
-                # Convert any float values to Decimal
-                item[dest_field] = float_to_decimal(vuln[src_field])
-        
-        # Write to DynamoDB
-        table.put_item(Item=item)
+    if seen_ids is None:
+        seen_ids = set()
+    if workers is None:
+        workers = get_write_workers(dynamodb_client, table_name)
+
+    stats = {'vulnerabilities': 0, 'written': 0, 'duplicates': 0}
+    item_build_info = None
+    batch = []
+    pending = set()
+
+    def submit(executor, batch):
+        # Wait for a thread to be free, which bounds the memory used
+        while len(pending) >= workers * 2:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                stats['written'] += future.result()
+        pending.add(executor.submit(batch_write, dynamodb_client, table_name, batch))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for vuln in vulnerabilities:
+            stats['vulnerabilities'] += 1
+            if item_build_info is None:
+                # Convert build_info numbers to Decimal
+                item_build_info = float_to_decimal(build_info)
+
+            # Check if the vulnerability has an InstanceID
+            instance_id = vuln.get('InstanceID')
+            if not instance_id:
+                print(f"Skipping vulnerability without InstanceID: {vuln}")
+                continue
+            if instance_id in seen_ids:
+                stats['duplicates'] += 1
+                continue
+            seen_ids.add(instance_id)
+
+            batch.append(create_item(vuln, item_build_info, project_name, scan_timestamp, fvdl_path))
+            if len(batch) == BATCH_SIZE:
+                submit(executor, batch)
+                batch = []
+
+        if batch:
+            submit(executor, batch)
+        for future in pending:
+            stats['written'] += future.result()
+
+    return stats
 
 def lambda_handler(event, context):
     try:
@@ -390,13 +412,18 @@ def lambda_handler(event, context):
                 'body': json.dumps('Missing required parameters in event')
             }
         
+        # The files are not downloaded again if none changed since the latest scan of the project
+        latest_files = get_latest_scan(table_name, project_name)
+        processed_blobs = {path: file['sha'] for path, file in latest_files.items()}
+
         # Download files from Gitea repository
         print(f"Downloading FVDL files from repository: {scan_results_repo}")
-        fvdl_files = download_files_from_gitea(scan_results_repo, main_branch, secret_name)
+        fvdl_files, skipped_paths = download_files_from_gitea(scan_results_repo, main_branch, secret_name, processed_blobs)
+        files_skipped = len(skipped_paths)
         
-        print(f"Found {len(fvdl_files)} FVDL files")
+        print(f"Found {len(fvdl_files)} FVDL files, skipped {files_skipped} unchanged files")
         
-        if not fvdl_files:
+        if not fvdl_files and not files_skipped:
             return {
                 'statusCode': 404,
                 'body': json.dumps('No FVDL files found in the repository')
@@ -405,18 +432,37 @@ def lambda_handler(event, context):
         # Generate a single timestamp for all vulnerabilities in this run
         scan_timestamp = datetime.now().isoformat()
         
+        workers = get_write_workers(boto3.client('dynamodb'), table_name)
+        print(f"Writing to {table_name} with {workers} thread(s)")
+
+        # Until all the findings are written, the project's findings are scanned rather than queried
+        files = {fvdl_file['path']: {'sha': fvdl_file['sha'], 'scanTimestamp': scan_timestamp} for fvdl_file in fvdl_files}
+        if files:
+            put_latest_scan(table_name, project_name, scan_timestamp, files, SCAN_PENDING)
+
         # Process all FVDL files found
         total_vulnerabilities = 0
+        items_written = 0
+        duplicates_skipped = 0
+        seen_ids = set()
+        started = time.monotonic()
         for fvdl_file in fvdl_files:
-            print(f"Processing file: {fvdl_file}")
-            vulnerabilities, build_info = parse_fvdl(fvdl_file, base_path)
-            print(f"Found {len(vulnerabilities)} vulnerabilities")
-            
-            save_to_dynamodb(vulnerabilities, build_info, table_name, project_name, scan_timestamp)
-            total_vulnerabilities += len(vulnerabilities)
+            print(f"Processing file: {fvdl_file['path']}")
+            # Vulnerabilities are saved as they are parsed, rather than held in memory
+            build_info = {}
+            vulnerabilities = parse_fvdl(fvdl_file['file'], build_info, base_path)
+            stats = save_to_dynamodb(vulnerabilities, build_info, table_name, project_name, scan_timestamp, seen_ids, workers, fvdl_file['path'])
+            print(f"Found {stats['vulnerabilities']} vulnerabilities, wrote {stats['written']} items, skipped {stats['duplicates']} duplicates")
+            total_vulnerabilities += stats['vulnerabilities']
+            items_written += stats['written']
+            duplicates_skipped += stats['duplicates']
             
             # Clean up the temporary file
-            os.remove(fvdl_file)
+            os.remove(fvdl_file['file'])
+        elapsed = time.monotonic() - started
+        
+        if files:
+            put_latest_scan(table_name, project_name, scan_timestamp, files)
         
         return {
             'statusCode': 200,
@@ -424,7 +470,11 @@ def lambda_handler(event, context):
                 'message': 'Successfully processed vulnerability data',
                 'projectName': project_name,
                 'totalVulnerabilities': total_vulnerabilities,
+                'itemsWritten': items_written,
+                'duplicatesSkipped': duplicates_skipped,
+                'itemsPerSecond': round(items_written / elapsed, 1) if elapsed else None,
                 'filesProcessed': len(fvdl_files),
+                'filesSkipped': files_skipped,
                 'scanTimestamp': scan_timestamp
             })
         }
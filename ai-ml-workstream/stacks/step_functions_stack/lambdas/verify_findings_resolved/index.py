@@ -1,7 +1,16 @@
+import io
 import json
-import defusedxml.ElementTree as ET
 from datetime import datetime
 import traceback
+from fvdl_parser import ParseError as FvdlParseError
+from fvdl_parser import iter_vulnerabilities
+import claim_check
+
+# Fields of the new findings, from the FVDL content
+VERIFIED_FIELDS = [
+    'InstanceID', 'ClassID', 'Kingdom', 'Type', 'DefaultSeverity',
+    'InstanceSeverity', 'Confidence', 'PrimaryFile', 'PrimaryLine'
+]
 
 # Custom exceptions for step function error handling
 class FortifyVerificationError(Exception):
@@ -27,83 +36,23 @@ def parse_fvdl_content(fvdl_content):
     Returns list of vulnerabilities with InstanceID as key.
     """
     try:
-        # Parse the XML content
-        root = ET.fromstring(fvdl_content)
-        
-        # Check for namespace
-        namespace = ''
-        if '}' in root.tag:
-            namespace = '{' + root.tag.split('}')[0].strip('{') + '}'
-        
-        # Extract vulnerabilities
+        # The content is parsed incrementally, without building the whole tree
         vulnerabilities = {}
-        vuln_elems = root.findall(f'.//{namespace}Vulnerabilities/{namespace}Vulnerability')
-        
-        for vuln_elem in vuln_elems:
-            vuln_data = {}
-            
-            # Extract InstanceID (required)
-            instance_info = vuln_elem.find(f'./{namespace}InstanceInfo')
-            if instance_info is not None:
-                instance_id_elem = instance_info.find(f'./{namespace}InstanceID')
-                if instance_id_elem is not None and instance_id_elem.text:
-                    instance_id = instance_id_elem.text
-                    vuln_data['InstanceID'] = instance_id
-                else:
-                    continue  # Skip vulnerabilities without InstanceID
-            else:
-                continue  # Skip vulnerabilities without InstanceInfo
-            
-            # Extract ClassInfo
-            class_info = vuln_elem.find(f'./{namespace}ClassInfo')
-            if class_info is not None:
-                class_id_elem = class_info.find(f'./{namespace}ClassID')
-                if class_id_elem is not None and class_id_elem.text:
-                    vuln_data['ClassID'] = class_id_elem.text
-                    
-                kingdom_elem = class_info.find(f'./{namespace}Kingdom')
-                if kingdom_elem is not None and kingdom_elem.text:
-                    vuln_data['Kingdom'] = kingdom_elem.text
-                    
-                type_elem = class_info.find(f'./{namespace}Type')
-                if type_elem is not None and type_elem.text:
-                    vuln_data['Type'] = type_elem.text
-                    
-                severity_elem = class_info.find(f'./{namespace}DefaultSeverity')
-                if severity_elem is not None and severity_elem.text:
-                    vuln_data['DefaultSeverity'] = severity_elem.text
-            
-            # Extract additional InstanceInfo
-            if instance_info is not None:
-                severity_elem = instance_info.find(f'./{namespace}InstanceSeverity')
-                if severity_elem is not None and severity_elem.text:
-                    vuln_data['InstanceSeverity'] = severity_elem.text
-                    
-                confidence_elem = instance_info.find(f'./{namespace}Confidence')
-                if confidence_elem is not None and confidence_elem.text:
-                    vuln_data['Confidence'] = confidence_elem.text
-            
-            # Extract file and line information
-            analysis_info = vuln_elem.find(f'./{namespace}AnalysisInfo')
-            if analysis_info is not None:
-                unified = analysis_info.find(f'./{namespace}Unified')
-                if unified is not None:
-                    repl_defs = unified.find(f'./{namespace}ReplacementDefinitions')
-                    if repl_defs is not None:
-                        for def_elem in repl_defs.findall(f'./{namespace}Def'):
-                            if def_elem.get('key') == 'PrimaryLocation.file':
-                                vuln_data['PrimaryFile'] = def_elem.get('value')
-                            elif def_elem.get('key') == 'PrimaryLocation.line':
-                                try:
-                                    vuln_data['PrimaryLine'] = int(def_elem.get('value'))
-                                except ValueError:
-                                    pass
-            
-            vulnerabilities[instance_id] = vuln_data
-        
+        for vuln_data in iter_vulnerabilities(io.StringIO(fvdl_content)):
+            instance_id = vuln_data.get('InstanceID')
+            if not instance_id:
+                continue  # Skip vulnerabilities without InstanceID
+
+            # Only the fields that findings are compared on
+            vulnerabilities[instance_id] = {
+                field: vuln_data[field]
+                for field in VERIFIED_FIELDS
+                if field in vuln_data
+            }
+
         return vulnerabilities
         
-    except ET.ParseError as e:
+    except FvdlParseError as e:
         raise ParseError(f"Failed to parse FVDL XML content: {str(e)}")
     except Exception as e:
         raise ParseError(f"Unexpected error parsing FVDL content: {str(e)}")
@@ -242,6 +191,11 @@ def compare_findings(new_findings, existing_findings, target_instance_id=None):
     
     return results
 
+@claim_check.handler(offload=[
+    'comparison_results.resolved_findings',
+    'comparison_results.new_findings',
+    'comparison_results.persistent_findings'
+])
 def lambda_handler(event, context):
     """
     Main lambda handler for verifying Fortify findings.
@@ -335,33 +289,10 @@ def lambda_handler(event, context):
             }
         }
         
-        # Limit the number of findings included in the response to prevent truncation
-        max_findings = 10  # Adjust this number as needed
-        
-        # Add limited number of findings to the response
-        if comparison_results['resolved_findings']:
-            response['comparison_results']['resolved_findings'] = comparison_results['resolved_findings'][:max_findings]
-            if len(comparison_results['resolved_findings']) > max_findings:
-                response['comparison_results']['resolved_findings_truncated'] = True
-                response['comparison_results']['total_resolved_findings'] = len(comparison_results['resolved_findings'])
-        else:
-            response['comparison_results']['resolved_findings'] = []
-            
-        if comparison_results['new_findings']:
-            response['comparison_results']['new_findings'] = comparison_results['new_findings'][:max_findings]
-            if len(comparison_results['new_findings']) > max_findings:
-                response['comparison_results']['new_findings_truncated'] = True
-                response['comparison_results']['total_new_findings'] = len(comparison_results['new_findings'])
-        else:
-            response['comparison_results']['new_findings'] = []
-            
-        if comparison_results['persistent_findings']:
-            response['comparison_results']['persistent_findings'] = comparison_results['persistent_findings'][:max_findings]
-            if len(comparison_results['persistent_findings']) > max_findings:
-                response['comparison_results']['persistent_findings_truncated'] = True
-                response['comparison_results']['total_persistent_findings'] = len(comparison_results['persistent_findings'])
-        else:
-            response['comparison_results']['persistent_findings'] = []
+        # The findings lists are returned in full: the claim-check offloads them to S3
+        # when they would not fit in the state of the state machine
+        for key in ('resolved_findings', 'new_findings', 'persistent_findings'):
+            response['comparison_results'][key] = comparison_results[key] or []
         
         print(f"Verification completed successfully")
         print(f"Summary: {comparison_results['summary']}")
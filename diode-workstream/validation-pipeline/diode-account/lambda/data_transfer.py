@@ -1,6 +1,10 @@
 import json
 import logging
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from urllib.parse import unquote_plus
 
 import boto3  # type: ignore
@@ -15,12 +19,19 @@ os.environ["AWS_DATA_PATH"] = "./models"
 TRANSFER_BUCKET_OWNER = os.environ["TRANSFER_BUCKET_OWNER"]
 TRANSFER_RESULT_QUEUE_URL = os.environ["TRANSFER_RESULT_QUEUE_URL"]
 DATA_TRANSFER_QUEUE_URL = os.environ["DATA_TRANSFER_QUEUE_URL"]
-TRANSFER_STATUS_QUEUE_URL = os.environ["TRANSFER_STATUS_QUEUE_URL"]
 USE_DIODE_SIMULATOR = os.environ["USE_DIODE_SIMULATOR"]
 DIODE_SIMULATOR_ENDPOINT = os.environ["DIODE_SIMULATOR_ENDPOINT"]
 AWS_REGION = os.environ["AWS_REGION"]
-
-config = Config(retries={"max_attempts": 3, "mode": "standard"})
+TRANSFER_ENVELOPE_TABLE_NAME = os.environ["TRANSFER_ENVELOPE_TABLE_NAME"]
+# S3 events for objects uploaded by the validation poller are skipped,
+# as the poller requests the transfer by sending the pipeline envelope
+VALIDATION_POLLER_ROLE_ID = os.environ["VALIDATION_POLLER_ROLE_ID"]
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))
+
+config = Config(
+    retries={"max_attempts": 3, "mode": "standard"},
+    max_pool_connections=MAX_WORKERS,
+)
 diode_endpoint_url = f"https://diode.{AWS_REGION}.amazonaws.com"
 if USE_DIODE_SIMULATOR == "True":
     diode_endpoint_url = DIODE_SIMULATOR_ENDPOINT
@@ -30,6 +41,7 @@ DIODE_CLIENT = boto3.client(
     config=config,
     endpoint_url=diode_endpoint_url,
 )
+DDB_CLIENT = boto3.client("dynamodb", config=config)
 S3_CLIENT = boto3.client("s3", config=config)
 SQS_CLIENT = boto3.client("sqs", config=config)
 
@@ -68,46 +80,133 @@ RETRYABLE_STATUS_CODES = [500, 502, 503, 504]
 
 NO_MAPPING_ID = "None"
 
+# SendMessageBatch accepts up to 10 entries per request
+MAX_BATCH_SIZE = 10
+MAX_SEND_ATTEMPTS = 4
 
-# NOTE: Lambda deletes the message from SQS queue if no error is raised
-def lambda_handler(event, context):
-    logger.info(f"Event: {json.dumps(event, default=str)}")
-
-    message_body: dict = json.loads(event["Records"][0]["body"])
-    records = message_body.get("Records")
+ENVELOPE_KEY = "PipelineEnvelope"
+# Envelopes are only needed until the transfer status event is processed
+ENVELOPE_TTL_SECONDS = 7 * 24 * 60 * 60
+# BatchGetItem accepts up to 100 keys per call
+MAX_BATCH_GET_SIZE = 100
+MAX_BATCH_GET_ATTEMPTS = 5
 
-    if records:  # event_source == "aws:s3"
-        handle_create_transfer(event["Records"][0], records[0]["s3"])
-    else:  # event_source == "aws:sqs"
-        handle_transfer_status_event(
-            message_body["detail"],
-            event["Records"][0]["receiptHandle"],
-        )
 
+# NOTE: Lambda deletes the messages not reported in `batchItemFailures` from SQS queue
+def lambda_handler(event, context):
+    logger.info(f"Event: {json.dumps(event, default=str)}")
 
-def handle_create_transfer(message: dict, s3: dict):
+    messages: list[dict] = event["Records"]
+    logger.info(f"Processing {len(messages)} message(s)")
+
+    create_transfer_requests: list[tuple[dict, dict]] = []
+    transfer_status_events: list[tuple[dict, dict]] = []
+    # Malformed messages are retried, then dead-lettered, without failing the batch
+    failed_message_ids: set[str] = set()
+    for message in messages:
+        try:
+            message_body: dict = json.loads(message["body"])
+            records = message_body.get("Records")
+
+            if ENVELOPE_KEY in message_body:  # Sent by the validation poller
+                envelope = message_body[ENVELOPE_KEY]
+                create_transfer_requests.append((message, envelope))
+            elif records:  # event_source == "aws:s3"
+                if is_uploaded_by_poller(records[0]):
+                    logger.info(
+                        "Skipping the S3 event; the envelope requests the transfer",
+                    )
+                    continue
+                envelope = s3_to_envelope(records[0]["s3"])
+                create_transfer_requests.append((message, envelope))
+            else:  # event_source == "aws:sqs"
+                transfer_status_events.append((message, message_body["detail"]))
+        except Exception:
+            logger.exception(f"Failed to classify message {message['messageId']}")
+            failed_message_ids.add(message["messageId"])
+
+    # (message ID, params for the transfer result message)
+    results, create_failed_ids = handle_create_transfers(create_transfer_requests)
+    status_results, status_failed_ids = handle_transfer_status_events(
+        transfer_status_events,
+    )
+    results += status_results
+    failed_message_ids |= create_failed_ids | status_failed_ids
+
+    failed_message_ids |= send_msgs_to_transfer_result_queue(results)
+
+    processed_count = len(messages) - len(failed_message_ids)
+    logger.info(f"Processed {processed_count}/{len(messages)} message(s)")
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in failed_message_ids
+        ],
+    }
+
+
+def handle_create_transfers(
+    requests: list[tuple[dict, dict]],
+) -> tuple[list[tuple[str, dict]], set[str]]:
+    """
+    Processes the CreateTransfer requests concurrently.\n
+    Returns the transfer results to report and the IDs of the messages to retry.
+    """
+    results: list[tuple[str, dict]] = []
+    failed_message_ids: set[str] = set()
+    if not requests:
+        return results, failed_message_ids
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(handle_create_transfer, message, envelope): message[
+                "messageId"
+            ]
+            for message, envelope in requests
+        }
+        for future in as_completed(futures):
+            message_id = futures[future]
+            try:
+                params = future.result()
+            except Exception:
+                logger.exception(f"Failed to process message {message_id}")
+                failed_message_ids.add(message_id)
+                continue
+
+            if params:
+                results.append((message_id, params))
+
+    return results, failed_message_ids
+
+
+def handle_create_transfer(message: dict, envelope: dict) -> dict | None:
+    """
+    Creates a transfer request for the object described by `envelope`.\n
+    Returns the params for the transfer result message if the request failed
+    with a non-retryable error; raises the error if it is retryable.
+    """
     logger.info("Processing a CreateTransfer request")
 
-    receipt_handle = message["receiptHandle"]
     approx_rec_count = int(message["attributes"]["ApproximateReceiveCount"])
     logger.info(f"Approximate Receive Count: {approx_rec_count}")
 
-    bucket = s3["bucket"]["name"]
-    # unquote_plus for handling any whitespaces in the key name
-    key = unquote_plus(s3["object"]["key"])
+    bucket = envelope["bucket"]
+    key = envelope["key"]
     logger.info(f"Bucket: {bucket}, Key: {key}")
 
     # Mapping ID cannot be an empty string, as it can cause an error in DDB
     mapping_id = NO_MAPPING_ID
     try:
-        mapping_id = get_mapping_id(bucket, key)
+        # Legacy S3 events do not carry the mapping ID
+        mapping_id = envelope.get("mappingId") or get_mapping_id(bucket, key)
         if mapping_id == NO_MAPPING_ID:
             raise NoMappingIdTagError
 
         logger.info(f"Mapping ID: {mapping_id}")
 
-        create_transfer(mapping_id, bucket, key)
-        delete_sqs_message(DATA_TRANSFER_QUEUE_URL, receipt_handle)
+        transfer = create_transfer(mapping_id, bucket, key)
+        if "envelopeVersion" in envelope:
+            put_envelope(transfer["transferId"], envelope)
+        return None
 
     except (ClientError, NoMappingIdTagError) as e:
         params = dict(
@@ -117,6 +216,8 @@ def handle_create_transfer(message: dict, s3: dict):
             status=CREATE_TRANSFER_FAILED,
             transfer_id="",
         )
+        if "envelopeVersion" in envelope:
+            params.update({"envelope": envelope})
 
         if isinstance(e, ClientError):
             error_code = e.response["Error"]["Code"]
@@ -145,59 +246,145 @@ def handle_create_transfer(message: dict, s3: dict):
             )
             params.update({"error": "NO_MAPPING_ID_TAG"})
 
-        send_msg_to_transfer_result_queue(**params)
-        delete_sqs_message(DATA_TRANSFER_QUEUE_URL, receipt_handle)
-
+        return params
+
+
+def handle_transfer_status_events(
+    events: list[tuple[dict, dict]],
+) -> tuple[list[tuple[str, dict]], set[str]]:
+    """
+    Returns the transfer results to report for the transfer status events, and the
+    IDs of the messages to retry.\n
+    Transfers that did not succeed are described together to get their error messages.
+    """
+    results: list[tuple[str, dict]] = []
+    failed_message_ids: set[str] = set()
+    for message, event_detail in events:
+        logger.info("Processing a transfer status event")
+
+        try:
+            status = event_detail["status"]
+            logger.info(f"Transfer Status: {status}")
+
+            params = dict(
+                bucket=event_detail["s3Bucket"],
+                key=event_detail["s3Key"],
+                mapping_id=event_detail["mappingId"],
+                status=status,
+                transfer_id=event_detail["transferId"],
+            )
+        except (KeyError, TypeError):
+            logger.exception(
+                f"Malformed transfer status event in message {message['messageId']}",
+            )
+            failed_message_ids.add(message["messageId"])
+            continue
 
-def handle_transfer_status_event(event_detail: dict, receipt_handle: str):
-    logger.info("Processing a transfer status event")
+        logger.info(f"Transfer Detail: {params}")
+        results.append((message["messageId"], params))
 
-    status = event_detail["status"]
-    logger.info(f"Transfer Status: {status}")
+    envelopes = get_envelopes({params["transfer_id"] for _, params in results})
+    for _, params in results:
+        envelope = envelopes.get(params["transfer_id"])
+        if envelope:
+            params.update({"envelope": envelope})
 
-    params = dict(
-        bucket=event_detail["s3Bucket"],
-        key=event_detail["s3Key"],
-        mapping_id=event_detail["mappingId"],
-        status=status,
-        transfer_id=event_detail["transferId"],
-    )
-    logger.info(f"Transfer Detail: {params}")
+    transfer_ids = {
+        params["transfer_id"]
+        for _, params in results
+        if params["status"] != "SUCCEEDED"
+    }
+    transfers = describe_transfers(transfer_ids)
+    for _, params in results:
+        if params["status"] != "SUCCEEDED":
+            transfer = transfers.get(params["transfer_id"], {})
+            params.update({"error": transfer.get("errorMessage", "Unknown")})
 
-    if status == "SUCCEEDED":
-        send_msg_to_transfer_result_queue(**params)
-        delete_sqs_message(TRANSFER_STATUS_QUEUE_URL, receipt_handle)
-        return
+    return results, failed_message_ids
 
-    transfer = describe_transfer(params["transfer_id"])
-    params.update({"error": transfer.get("errorMessage", "Unknown")})
-    send_msg_to_transfer_result_queue(**params)
-    delete_sqs_message(TRANSFER_STATUS_QUEUE_URL, receipt_handle)
 
-
-def send_msg_to_transfer_result_queue(
+def create_transfer_result_message(
     bucket: str,
     key: str,
     mapping_id: str,
     status: str,
     transfer_id: str,
     error="None",
-):
-    logger.info("Sending a message to Transfer Result SQS queue")
-
-    SQS_CLIENT.send_message(
-        QueueUrl=TRANSFER_RESULT_QUEUE_URL,
-        MessageBody=json.dumps(
-            {
-                "bucket": bucket,
-                "key": key,
-                "mappingId": mapping_id,
-                "status": status,
-                "transferId": transfer_id,
-                "error": error,
-            },
-        ),
-    )
+    envelope: dict | None = None,
+) -> str:
+    message = {
+        "bucket": bucket,
+        "key": key,
+        "mappingId": mapping_id,
+        "status": status,
+        "transferId": transfer_id,
+        "error": error,
+    }
+    if envelope:
+        message["envelope"] = envelope
+    return json.dumps(message)
+
+
+def send_msgs_to_transfer_result_queue(results: list[tuple[str, dict]]) -> set[str]:
+    """
+    Sends the transfer results to Transfer Result SQS queue in batches of 10.\n
+    Returns the IDs of the originating messages whose results could not be sent.
+    """
+    failed_message_ids: set[str] = set()
+    for i in range(0, len(results), MAX_BATCH_SIZE):
+        chunk = results[i : i + MAX_BATCH_SIZE]  # noqa E203
+        entries = {
+            str(index): (message_id, create_transfer_result_message(**params))
+            for index, (message_id, params) in enumerate(chunk)
+        }
+        try:
+            failed_entry_ids = send_message_batch(TRANSFER_RESULT_QUEUE_URL, entries)
+        except ClientError:
+            logger.exception("Failed to send messages to Transfer Result SQS queue")
+            failed_entry_ids = [*entries]
+        failed_message_ids.update(entries[entry_id][0] for entry_id in failed_entry_ids)
+    return failed_message_ids
+
+
+def send_message_batch(
+    queue_url: str, entries: dict[str, tuple[str, str]]
+) -> list[str]:
+    """
+    Sends a single batch, retrying only the entries that failed due to a
+    service-side error. Returns the IDs of the entries that could not be sent.
+    """
+    queue_name = queue_url.split("/")[-1]
+    pending = dict(entries)
+    failed_ids: list[str] = []
+    for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+        logger.info(f"Sending {len(pending)} message(s) to {queue_name} queue")
+        response = SQS_CLIENT.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {"Id": entry_id, "MessageBody": body}
+                for entry_id, (_, body) in pending.items()
+            ],
+        )
+        failed: list[dict] = response.get("Failed", [])
+        if not failed:
+            return failed_ids
+
+        for entry in failed:
+            logger.warning(f"Failed to send entry {entry['Id']}: {entry}")
+
+        # Sender faults (e.g. a malformed message) will not succeed on retry
+        failed_ids.extend(entry["Id"] for entry in failed if entry["SenderFault"])
+        retryable_ids = {entry["Id"] for entry in failed if not entry["SenderFault"]}
+        pending = {k: v for k, v in pending.items() if k in retryable_ids}
+        if not pending:
+            return failed_ids
+
+        if attempt < MAX_SEND_ATTEMPTS:
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))  # nosec B311
+
+    logger.error(f"Exhausted retries for entries: {list(pending)}")
+    return failed_ids + list(pending)
 
 
 def change_message_visibility(queue_url: str, receipt_handle: str, timeout: int):
@@ -221,6 +408,23 @@ def change_message_visibility(queue_url: str, receipt_handle: str, timeout: int)
         logger.warning(f"Could not update the visibility timeout: {e}")
 
 
+def is_uploaded_by_poller(record: dict) -> bool:
+    # For an assumed role, the principal ID is in the form of "AWS:<role ID>:<session>"
+    principal_id: str = record.get("userIdentity", {}).get("principalId", "")
+    return principal_id.startswith(f"AWS:{VALIDATION_POLLER_ROLE_ID}:")
+
+
+def s3_to_envelope(s3: dict) -> dict:
+    """
+    Returns the subset of the pipeline envelope that can be derived from an S3 event
+    """
+    return {
+        "bucket": s3["bucket"]["name"],
+        # unquote_plus for handling any whitespaces in the key name
+        "key": unquote_plus(s3["object"]["key"]),
+    }
+
+
 def get_mapping_id(bucket, key):
     tags = get_object_tagging(bucket, key)
     return tags.get("MappingId", NO_MAPPING_ID)
@@ -254,6 +458,88 @@ def create_transfer(mapping_id: str, bucket: str, key: str, include_tags=True):
     )["transfer"]
 
     logger.info(f"Transfer request created: {response}")
+    return response
+
+
+def put_envelope(transfer_id: str, envelope: dict):
+    """
+    Saves the envelope so that it can be looked up when the transfer status
+    event for `transfer_id` arrives
+    """
+    logger.info(f"Saving the envelope for transfer: {transfer_id}")
+    try:
+        DDB_CLIENT.put_item(
+            TableName=TRANSFER_ENVELOPE_TABLE_NAME,
+            Item={
+                "transferId": {"S": transfer_id},
+                "envelope": {"S": json.dumps(envelope)},
+                "expiresAt": {"N": str(int(time.time()) + ENVELOPE_TTL_SECONDS)},
+            },
+        )
+    except ClientError as e:
+        # Not critical; the transfer result falls back to the object tags.
+        # Raising would cause the transfer to be requested again.
+        logger.warning(f"Could not save the envelope: {e}")
+
+
+def get_envelopes(transfer_ids: set[str]) -> dict[str, dict]:
+    """
+    Returns the saved envelopes keyed by transfer ID.\n
+    Transfers without an envelope (or whose lookup failed) are omitted.
+    """
+    envelopes: dict[str, dict] = {}
+    transfer_ids_list = [*transfer_ids]
+    for i in range(0, len(transfer_ids_list), MAX_BATCH_GET_SIZE):
+        chunk = transfer_ids_list[i : i + MAX_BATCH_GET_SIZE]  # noqa E203
+        try:
+            for item in batch_get_envelopes(chunk):
+                envelopes[item["transferId"]["S"]] = json.loads(item["envelope"]["S"])
+        except ClientError as e:
+            logger.warning(f"Could not get the envelopes: {e}")
+
+    logger.info(f"Found envelopes for {len(envelopes)}/{len(transfer_ids)} transfer(s)")
+    return envelopes
+
+
+def batch_get_envelopes(transfer_ids: list[str]) -> list[dict]:
+    """
+    Gets up to 100 items, retrying unprocessed keys with backoff
+    """
+    items: list[dict] = []
+    request = {
+        TRANSFER_ENVELOPE_TABLE_NAME: {
+            "Keys": [
+                {"transferId": {"S": transfer_id}} for transfer_id in transfer_ids
+            ],
+        },
+    }
+    for attempt in range(1, MAX_BATCH_GET_ATTEMPTS + 1):
+        response = DDB_CLIENT.batch_get_item(RequestItems=request)
+        items.extend(response["Responses"].get(TRANSFER_ENVELOPE_TABLE_NAME, []))
+
+        request = response.get("UnprocessedKeys", {})
+        if not request:
+            return items
+
+        logger.warning(f"Unprocessed keys on attempt {attempt}")
+        if attempt < MAX_BATCH_GET_ATTEMPTS:
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, 0.05 * 2**attempt))  # nosec B311
+
+    logger.warning("Exhausted retries for the unprocessed keys")
+    return items
+
+
+def describe_transfers(transfer_ids: set[str]) -> dict[str, dict]:
+    """
+    Describes the transfers concurrently and returns them keyed by transfer ID
+    """
+    if not transfer_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        transfers = executor.map(describe_transfer, transfer_ids)
+        return dict(zip(transfer_ids, transfers))
 
 
 def describe_transfer(transfer_id: str) -> dict:
@@ -268,11 +554,5 @@ def describe_transfer(transfer_id: str) -> dict:
         return {}
 
 
-def delete_sqs_message(queue_url: str, receipt_handle: str):
-    queue_name = queue_url.split("/")[-1]
-    logger.info(f"Deleting message from {queue_name} queue")
-    SQS_CLIENT.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
-
-
 class NoMappingIdTagError(Exception):
     pass
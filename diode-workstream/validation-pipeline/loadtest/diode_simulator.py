@@ -0,0 +1,276 @@
+import heapq
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timezone
+
+from local_aws import client_error
+
+IN_TRANSIT = "IN_TRANSIT"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+REJECTED = "REJECTED"
+
+
+@dataclass
+class DiodeSimulatorConfig:
+    """
+    Behaviour of the simulated Diode service.\n
+    Rates are probabilities between 0 and 1; times are in seconds.
+    """
+
+    # Latency of each API call: uniform between the min and max
+    min_latency: float = 0.02
+    max_latency: float = 0.08
+    # CreateTransfer calls per second above which ThrottlingException is raised
+    max_tps: float = 0
+    # Random injection of ThrottlingException (400) and TransientFailureException (500)
+    throttle_rate: float = 0
+    failure_rate: float = 0
+    # Time from CreateTransfer to the transfer status event: uniform between min and max
+    min_transfer_time: float = 0.5
+    max_transfer_time: float = 2
+    # Share of the transfers that end as FAILED or REJECTED
+    transfer_failure_rate: float = 0
+    rejection_rate: float = 0
+
+
+class TokenBucket:
+    """Allows `rate` calls per second, with bursts of up to `rate` calls"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.rate,
+                self.tokens + (now - self.updated_at) * self.rate,
+            )
+            self.updated_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class DiodeSimulator:
+    """
+    In-process stand-in for the Diode client used by the data transfer Lambda.\n
+    Implements `create_transfer`, `describe_transfer` and `list_account_mappings`
+    with the response shapes of the Diode API model. Each transfer completes
+    after the configured transfer time, and its transfer status event is sent
+    to `status_queue_url` through `sqs_client`, as EventBridge does.
+    """
+
+    def __init__(
+        self,
+        config: DiodeSimulatorConfig,
+        mappings: dict[str, str],
+        sqs_client=None,
+        status_queue_url: str | None = None,
+        region="us-east-1",
+        account_id="111122223333",
+    ):
+        """
+        `mappings` maps the mapping IDs to their destination bucket names
+        """
+        self.config = config
+        self.mappings = mappings
+        self.sqs_client = sqs_client
+        self.status_queue_url = status_queue_url
+        self.region = region
+        self.account_id = account_id
+
+        self.transfers: dict[str, dict] = {}
+        self.stats = {
+            "CreateTransfer": 0,
+            "DescribeTransfer": 0,
+            "ListAccountMappings": 0,
+            "Throttled": 0,
+            "Failed": 0,
+        }
+        self.lock = threading.Lock()
+        self.token_bucket = TokenBucket(config.max_tps) if config.max_tps else None
+
+        # Transfers to complete, as a heap of (completes at, transfer ID)
+        self.pending: list[tuple[float, str]] = []
+        self.pending_changed = threading.Condition(self.lock)
+        self.stopped = False
+        self.completer = threading.Thread(target=self._complete_transfers, daemon=True)
+        self.completer.start()
+
+    def stop(self):
+        with self.pending_changed:
+            self.stopped = True
+            self.pending_changed.notify()
+        self.completer.join()
+
+    def create_transfer(
+        self,
+        mappingId: str,
+        s3Bucket: str,
+        s3Key: str,
+        description: str,
+        includeS3ObjectTags=False,
+        **kwargs,
+    ) -> dict:
+        self._call("CreateTransfer", rate_limited=True)
+        if mappingId not in self.mappings:
+            raise client_error(
+                "ResourceNotFoundException",
+                f"Mapping {mappingId} not found",
+                404,
+                "CreateTransfer",
+            )
+
+        transfer_id = str(uuid.uuid4())
+        transfer = {
+            "transferId": transfer_id,
+            "transferArn": self._arn("transfer", transfer_id),
+            "mappingArn": self._arn("mapping", mappingId),
+            "mappingId": mappingId,
+            "s3Uri": f"s3://{s3Bucket}/{s3Key}",
+            "status": IN_TRANSIT,
+            "dateSent": datetime.now(timezone.utc),
+            "description": description,
+        }
+        completes_at = time.monotonic() + random.uniform(  # nosec B311
+            self.config.min_transfer_time,
+            self.config.max_transfer_time,
+        )
+        with self.pending_changed:
+            self.transfers[transfer_id] = transfer
+            heapq.heappush(self.pending, (completes_at, transfer_id))
+            self.pending_changed.notify()
+        return {"transfer": dict(transfer)}
+
+    def describe_transfer(self, transferId: str) -> dict:
+        self._call("DescribeTransfer")
+        with self.lock:
+            transfer = self.transfers.get(transferId)
+            if transfer is None:
+                raise client_error(
+                    "ResourceNotFoundException",
+                    f"Transfer {transferId} not found",
+                    404,
+                    "DescribeTransfer",
+                )
+            return {"transfer": dict(transfer)}
+
+    def list_account_mappings(self, maxResults=100, nextToken=None, **kwargs) -> dict:
+        self._call("ListAccountMappings")
+        mapping_ids = sorted(self.mappings)
+        start = int(nextToken or 0)
+        page = mapping_ids[start : start + maxResults]  # noqa E203
+        response: dict = {
+            "accountMappingList": [
+                {
+                    "mappingId": mapping_id,
+                    "mappingArn": self._arn("mapping", mapping_id),
+                    "mappingStatus": "ACTIVE",
+                    "sendingRegion": self.region,
+                    "receivingRegion": self.region,
+                    "remoteAccountId": self.account_id,
+                    "deliveryS3BucketName": self.mappings[mapping_id],
+                }
+                for mapping_id in page
+            ],
+        }
+        if start + maxResults < len(mapping_ids):
+            response["nextToken"] = str(start + maxResults)
+        return response
+
+    def _call(self, operation: str, rate_limited=False):
+        """
+        Applies the latency, then raises any injected error
+        """
+        time.sleep(
+            random.uniform(  # nosec B311
+                self.config.min_latency,
+                self.config.max_latency,
+            ),
+        )
+        with self.lock:
+            self.stats[operation] += 1
+
+        throttled = rate_limited and self.token_bucket and not self.token_bucket.take()
+        if throttled or random.random() < self.config.throttle_rate:  # nosec B311
+            with self.lock:
+                self.stats["Throttled"] += 1
+            raise client_error("ThrottlingException", "Rate exceeded", 400, operation)
+
+        if random.random() < self.config.failure_rate:  # nosec B311
+            with self.lock:
+                self.stats["Failed"] += 1
+            raise client_error(
+                "TransientFailureException",
+                "Injected failure",
+                500,
+                operation,
+            )
+
+    def _complete_transfers(self):
+        while True:
+            with self.pending_changed:
+                while not self.stopped and (
+                    not self.pending or self.pending[0][0] > time.monotonic()
+                ):
+                    timeout = (
+                        self.pending[0][0] - time.monotonic() if self.pending else None
+                    )
+                    self.pending_changed.wait(timeout)
+                if self.stopped:
+                    return
+                _, transfer_id = heapq.heappop(self.pending)
+                transfer = self.transfers[transfer_id]
+                self._set_final_status(transfer)
+                event = self._create_status_event(transfer)
+
+            if self.sqs_client and self.status_queue_url:
+                self.sqs_client.send_message(
+                    QueueUrl=self.status_queue_url,
+                    MessageBody=json.dumps(event),
+                )
+
+    def _set_final_status(self, transfer: dict):
+        outcome = random.random()  # nosec B311
+        if outcome < self.config.rejection_rate:
+            transfer["status"] = REJECTED
+            transfer["errorMessage"] = "Rejected by the simulated content filter"
+        elif outcome < self.config.rejection_rate + self.config.transfer_failure_rate:
+            transfer["status"] = FAILED
+            transfer["errorMessage"] = "Injected transfer failure"
+        else:
+            transfer["status"] = SUCCEEDED
+            transfer["dateReceived"] = datetime.now(timezone.utc)
+
+    def _create_status_event(self, transfer: dict) -> dict:
+        """
+        Returns the transfer status event in the form EventBridge delivers it
+        """
+        bucket, key = transfer["s3Uri"].removeprefix("s3://").split("/", 1)
+        return {
+            "source": "aws.diode",
+            "account": self.account_id,
+            "region": self.region,
+            "time": datetime.now(timezone.utc).isoformat(),
+            "detail": {
+                "transferId": transfer["transferId"],
+                "mappingId": transfer["mappingId"],
+                "status": transfer["status"],
+                "s3Bucket": bucket,
+                "s3Key": key,
+            },
+        }
+
+    def _arn(self, resource_type: str, resource_id: str) -> str:
+        return f"arn:aws:diode:{self.region}:{self.account_id}:{resource_type}/{resource_id}"  # noqa: E501
@@ -0,0 +1,373 @@
+import hashlib
+import heapq
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import parse_qsl
+
+from botocore.exceptions import ClientError  # type: ignore
+
+
+def client_error(code: str, message: str, status_code: int, operation: str):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": status_code},
+        },
+        operation,
+    )
+
+
+class FakeS3:
+    """
+    In-memory S3 with the calls made by the validation poller and the data
+    transfer and transfer result Lambdas. Objects keep their body and tags.
+    """
+
+    def __init__(self):
+        self.buckets: dict[str, dict[str, dict]] = {}
+        self.bucket_tags: dict[str, dict[str, str]] = {}
+        self.lock = threading.Lock()
+
+    def put_bucket_tagging(self, Bucket: str, Tagging: dict, **kwargs) -> dict:
+        with self.lock:
+            self.bucket_tags[Bucket] = {
+                tag["Key"]: tag["Value"] for tag in Tagging["TagSet"]
+            }
+        return {}
+
+    def get_bucket_tagging(self, Bucket: str, **kwargs) -> dict:
+        with self.lock:
+            tags = self.bucket_tags.get(Bucket)
+        if tags is None:
+            raise client_error("NoSuchTagSet", "No tags", 404, "GetBucketTagging")
+        return {"TagSet": [{"Key": k, "Value": v} for k, v in tags.items()]}
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body: bytes = b"",
+        Tagging: str = "",
+        **kwargs,
+    ) -> dict:
+        """`Tagging` is URL-encoded, as in the S3 API"""
+        etag = f'"{hashlib.md5(Body, usedforsecurity=False).hexdigest()}"'
+        with self.lock:
+            self.buckets.setdefault(Bucket, {})[Key] = {
+                "body": Body,
+                "etag": etag,
+                "tags": dict(parse_qsl(Tagging)),
+            }
+        return {"ETag": etag}
+
+    def upload_file(
+        self,
+        Filename: str,
+        Bucket: str,
+        Key: str,
+        ExtraArgs: dict | None = None,
+    ):
+        with open(Filename, "rb") as f:
+            body = f.read()
+        self.put_object(Bucket, Key, body, (ExtraArgs or {}).get("Tagging", ""))
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, **kwargs):
+        obj = self._get(Bucket, Key, "HeadObject", not_found_code="404")
+        with open(Filename, "wb") as f:
+            f.write(obj["body"])
+
+    def get_object_tagging(self, Bucket: str, Key: str, **kwargs) -> dict:
+        obj = self._get(Bucket, Key, "GetObjectTagging")
+        return {"TagSet": [{"Key": k, "Value": v} for k, v in obj["tags"].items()]}
+
+    def head_object(self, Bucket: str, Key: str, IfMatch: str = "", **kwargs) -> dict:
+        obj = self._get(Bucket, Key, "HeadObject", not_found_code="404")
+        if IfMatch and IfMatch.strip('"') != obj["etag"].strip('"'):
+            raise client_error("412", "Precondition Failed", 412, "HeadObject")
+        return {"ETag": obj["etag"], "ContentLength": len(obj["body"])}
+
+    def copy_object(self, CopySource: dict, Bucket: str, Key: str, **kwargs) -> dict:
+        obj = self._get(CopySource["Bucket"], CopySource["Key"], "CopyObject")
+        with self.lock:
+            self.buckets.setdefault(Bucket, {})[Key] = dict(obj)
+        return {}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        with self.lock:
+            self.buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+    def count(self, bucket: str) -> int:
+        with self.lock:
+            return len(self.buckets.get(bucket, {}))
+
+    def _get(self, bucket: str, key: str, operation: str, not_found_code="NoSuchKey"):
+        with self.lock:
+            obj = self.buckets.get(bucket, {}).get(key)
+        if obj is None:
+            raise client_error(not_found_code, "Not Found", 404, operation)
+        return obj
+
+
+class FakeSQS:
+    """
+    In-memory SQS with visibility timeouts and a redrive policy.\n
+    `time_scale` shrinks every visibility timeout (e.g. 0.01 turns the 30 second
+    backoff of the data transfer Lambda into 0.3 seconds), so that retries can
+    be exercised in a short run.
+    """
+
+    def __init__(self, time_scale=1.0, visibility_timeout=30, max_receive_count=5):
+        self.time_scale = time_scale
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        # Queue URL -> messages ready to be received
+        self.ready: dict[str, deque] = {}
+        # Receipt handle -> in-flight message
+        self.in_flight: dict[str, dict] = {}
+        # Heap of (visible again at, receipt handle) for the in-flight messages
+        self.timeouts: list[tuple[float, str]] = []
+        # Queue URL -> messages that exceeded the max receive count
+        self.dead_letters: dict[str, list[dict]] = {}
+        self.lock = threading.Condition()
+        self.sequence = itertools.count()
+
+    def create_queue(self, name: str) -> str:
+        queue_url = f"https://sqs.local/000000000000/{name}"
+        with self.lock:
+            self.ready.setdefault(queue_url, deque())
+            self.dead_letters.setdefault(queue_url, [])
+        return queue_url
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> dict:
+        message = {
+            "MessageId": str(uuid.uuid4()),
+            "Body": MessageBody,
+            "SentTimestamp": str(int(time.time() * 1000)),
+            "ReceiveCount": 0,
+            "QueueUrl": QueueUrl,
+        }
+        with self.lock:
+            self.ready[QueueUrl].append(message)
+            self.lock.notify_all()
+        return {"MessageId": message["MessageId"]}
+
+    def send_message_batch(self, QueueUrl: str, Entries: list[dict]) -> dict:
+        successful = []
+        for entry in Entries:
+            response = self.send_message(QueueUrl, entry["MessageBody"])
+            successful.append({"Id": entry["Id"], "MessageId": response["MessageId"]})
+        return {"Successful": successful, "Failed": []}
+
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages=1,
+        WaitTimeSeconds=0,
+        **kwargs,
+    ) -> dict:
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self.lock:
+            while True:
+                self._release_timed_out()
+                queue = self.ready[QueueUrl]
+                if queue or time.monotonic() >= deadline:
+                    break
+                timeout = deadline - time.monotonic()
+                if self.timeouts:
+                    timeout = min(timeout, self.timeouts[0][0] - time.monotonic())
+                self.lock.wait(max(timeout, 0.001))
+
+            messages = []
+            while queue and len(messages) < MaxNumberOfMessages:
+                message = queue.popleft()
+                message["ReceiveCount"] += 1
+                receipt_handle = f"{message['MessageId']}#{next(self.sequence)}"
+                message["ReceiptHandle"] = receipt_handle
+                self.in_flight[receipt_handle] = message
+                self._set_visible_at(message, self.visibility_timeout)
+                messages.append(
+                    {
+                        "MessageId": message["MessageId"],
+                        "ReceiptHandle": receipt_handle,
+                        "Body": message["Body"],
+                        "Attributes": {
+                            "ApproximateReceiveCount": str(message["ReceiveCount"]),
+                            "SentTimestamp": message["SentTimestamp"],
+                        },
+                    },
+                )
+        return {"Messages": messages} if messages else {}
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str, **kwargs) -> dict:
+        with self.lock:
+            self.in_flight.pop(ReceiptHandle, None)
+        return {}
+
+    def change_message_visibility(
+        self,
+        QueueUrl: str,
+        ReceiptHandle: str,
+        VisibilityTimeout: int,
+        **kwargs,
+    ) -> dict:
+        with self.lock:
+            message = self.in_flight.get(ReceiptHandle)
+            if message is None:
+                raise client_error(
+                    "ReceiptHandleIsInvalid",
+                    "The receipt handle is not valid",
+                    400,
+                    "ChangeMessageVisibility",
+                )
+            self._set_visible_at(message, VisibilityTimeout)
+            self.lock.notify_all()
+        return {}
+
+    def depth(self, queue_url: str) -> tuple[int, int]:
+        """Returns the number of visible and in-flight messages in the queue"""
+        with self.lock:
+            in_flight = sum(
+                1 for m in self.in_flight.values() if m["QueueUrl"] == queue_url
+            )
+            return len(self.ready[queue_url]), in_flight
+
+    def _set_visible_at(self, message: dict, visibility_timeout: float):
+        message["VisibleAt"] = time.monotonic() + visibility_timeout * self.time_scale
+        heapq.heappush(self.timeouts, (message["VisibleAt"], message["ReceiptHandle"]))
+
+    def _release_timed_out(self):
+        """
+        Makes the in-flight messages whose visibility timeout has expired visible
+        again, or moves them to the dead letters after the max receive count.
+        Only the latest timeout of a message counts.
+        """
+        now = time.monotonic()
+        while self.timeouts and self.timeouts[0][0] <= now:
+            _, receipt_handle = heapq.heappop(self.timeouts)
+            message = self.in_flight.get(receipt_handle)
+            if message is None or message["VisibleAt"] > now:
+                continue
+            del self.in_flight[receipt_handle]
+            if message["ReceiveCount"] >= self.max_receive_count:
+                self.dead_letters[message["QueueUrl"]].append(message)
+            else:
+                self.ready[message["QueueUrl"]].append(message)
+
+
+class FakeDynamoDB:
+    """
+    In-memory DynamoDB with the item calls made by the data transfer and
+    transfer result Lambdas.\n
+    `unprocessed_rate` is the share of the items that batch calls return as
+    unprocessed, to exercise the retries.
+    """
+
+    def __init__(self, unprocessed_rate=0.0):
+        self.unprocessed_rate = unprocessed_rate
+        # Table name -> (key attribute names, items keyed by their key values)
+        self.tables: dict[str, tuple[list[str], dict[tuple, dict]]] = {}
+        # Table name -> (monotonic time, item) of every write, in order
+        self.writes: dict[str, list[tuple[float, dict]]] = {}
+        self.lock = threading.Lock()
+
+    def create_table(self, name: str, key_names: list[str]):
+        with self.lock:
+            self.tables[name] = (key_names, {})
+            self.writes[name] = []
+
+    def put_item(self, TableName: str, Item: dict, **kwargs) -> dict:
+        with self.lock:
+            self._put(TableName, Item)
+        return {}
+
+    def get_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        with self.lock:
+            item = self._items(TableName).get(self._key(TableName, Key))
+        return {"Item": item} if item else {}
+
+    def batch_write_item(self, RequestItems: dict[str, list[dict]]) -> dict:
+        unprocessed: dict[str, list[dict]] = {}
+        with self.lock:
+            for table_name, requests in RequestItems.items():
+                for request in requests:
+                    if random.random() < self.unprocessed_rate:  # nosec B311
+                        unprocessed.setdefault(table_name, []).append(request)
+                        continue
+                    self._put(table_name, request["PutRequest"]["Item"])
+        return {"UnprocessedItems": unprocessed}
+
+    def batch_get_item(self, RequestItems: dict[str, dict]) -> dict:
+        responses: dict[str, list[dict]] = {}
+        unprocessed: dict[str, dict] = {}
+        with self.lock:
+            for table_name, request in RequestItems.items():
+                responses[table_name] = []
+                for key in request["Keys"]:
+                    if random.random() < self.unprocessed_rate:  # nosec B311
+                        unprocessed.setdefault(table_name, {"Keys": []})
+                        unprocessed[table_name]["Keys"].append(key)
+                        continue
+                    item = self._items(table_name).get(self._key(table_name, key))
+                    if item:
+                        responses[table_name].append(item)
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+    def _put(self, table_name: str, item: dict):
+        self._items(table_name)[self._key(table_name, item)] = item
+        self.writes[table_name].append((time.monotonic(), item))
+
+    def _items(self, table_name: str) -> dict[tuple, dict]:
+        if table_name not in self.tables:
+            raise client_error(
+                "ResourceNotFoundException",
+                f"Table {table_name} not found",
+                400,
+                "DynamoDB",
+            )
+        return self.tables[table_name][1]
+
+    def _key(self, table_name: str, item: dict) -> tuple:
+        key_names = self.tables[table_name][0]
+        return tuple(next(iter(item[name].values())) for name in key_names)
+
+
+class FakeSNS:
+    """In-memory SNS that keeps the published messages"""
+
+    def __init__(self):
+        self.messages: list[dict] = []
+        self.lock = threading.Lock()
+
+    def publish(self, TopicArn: str, Message: str, **kwargs) -> dict:
+        with self.lock:
+            self.messages.append({"TopicArn": TopicArn, "Message": Message, **kwargs})
+        return {"MessageId": str(uuid.uuid4())}
+
+
+class FakeSSM:
+    """In-memory Parameter Store"""
+
+    def __init__(self, parameters: dict[str, str] | None = None):
+        self.parameters = dict(parameters or {})
+
+    def get_parameter(self, Name: str, **kwargs) -> dict:
+        if Name not in self.parameters:
+            raise client_error("ParameterNotFound", Name, 400, "GetParameter")
+        return {"Parameter": {"Name": Name, "Value": self.parameters[Name]}}
+
+    def get_parameters(self, Names: list[str], **kwargs) -> dict:
+        return {
+            "Parameters": [
+                {"Name": name, "Value": self.parameters[name]}
+                for name in Names
+                if name in self.parameters
+            ],
+            "InvalidParameters": [
+                name for name in Names if name not in self.parameters
+            ],
+        }
@@ -0,0 +1,539 @@
+###################################################################################
+#
+# Load-tests the cross-domain transfer path on a laptop: the data transfer Lambda
+# (Diode account) and the transfer result Lambda (validation account) run
+# in-process against an in-process Diode simulator and in-memory S3, SQS,
+# DynamoDB and SNS. Reports the throughput in messages/sec and the tail latency
+# from the pipeline envelope being sent to the transfer result being recorded.
+#
+# 1. Pre-requisites
+#
+# a. Python 3.11 (or higher)
+#
+# b. boto3 library (no AWS credentials or network access are needed)
+#
+# For example:
+# Linux: python3.11 -m pip install boto3
+# Windows: py -3.11 -m pip install boto3
+#
+# 2. Run the following command for help
+#
+# For example:
+# Linux: python3.11 <name_of_script> -h
+# Windows: py -3.11 <name_of_script> -h
+#
+# Examples:
+# 5,000 files, with a Diode rate limit of 50 TPS and 1% injected 500 errors
+#   <name_of_script> --files 5000 --max-tps 50 --failure-rate 0.01
+# Legacy S3 events instead of envelopes, with 5% of the transfers rejected
+#   <name_of_script> --files 1000 --s3-events --rejection-rate 0.05
+#
+###################################################################################
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import quote_plus
+from urllib.parse import unquote_plus
+from urllib.parse import urlencode
+
+from diode_simulator import DiodeSimulator
+from diode_simulator import DiodeSimulatorConfig
+from local_aws import FakeDynamoDB
+from local_aws import FakeS3
+from local_aws import FakeSNS
+from local_aws import FakeSQS
+
+PIPELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_TRANSFER_LAMBDA_DIR = os.path.join(PIPELINE_DIR, "diode-account", "lambda")
+TRANSFER_RESULT_LAMBDA_DIR = os.path.join(PIPELINE_DIR, "validation-account", "lambda")
+
+ACCOUNT_ID = "111122223333"
+REGION = "us-east-1"
+DATA_TRANSFER_BUCKET = "data-transfer-bucket"
+FAILED_TRANSFER_BUCKET = "failed-transfer-bucket"
+TRANSFER_STATUS_TABLE = "TransferStatusTable"
+TRANSFER_ENVELOPE_TABLE = "TransferEnvelopeTable"
+VALIDATION_POLLER_ROLE_ID = "AROAVALIDATIONPOLLER"
+DATA_TAG_KEY = "DataOwner / DataSteward / GovPOC / KeyOwner"
+
+# Batch sizes of the event source mappings in the stacks
+DATA_TRANSFER_BATCH_SIZE = 10
+TRANSFER_RESULT_BATCH_SIZE = 50
+# SQS receive calls return at most 10 messages
+MAX_RECEIVE_SIZE = 10
+
+
+def load_lambda(name: str, directory: str, env: dict[str, str]):
+    """
+    Imports the Lambda function module from `directory` with `env` set,
+    from within the directory, as Lambda does (e.g. for the Diode model path)
+    """
+    os.environ.update(env)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            name,
+            os.path.join(directory, f"{name}.py"),
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+class LambdaPoller:
+    """
+    Polls an SQS queue like a Lambda event source mapping: invokes `handler`
+    with batches from `concurrency` threads, and deletes the messages that are
+    not reported in `batchItemFailures`
+    """
+
+    def __init__(self, sqs, queue_url: str, handler, batch_size: int, concurrency: int):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.handler = handler
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.durations: list[float] = []
+        self.messages = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads: list[threading.Thread] = []
+
+    def start(self):
+        self.threads = [
+            threading.Thread(target=self._poll, daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _poll(self):
+        while not self.stopped.is_set():
+            messages = self._receive_batch()
+            if not messages:
+                continue
+
+            event = {"Records": [to_lambda_record(message) for message in messages]}
+            started = time.perf_counter()
+            try:
+                response = self.handler(event, None)
+                failed_ids = {
+                    failure["itemIdentifier"]
+                    for failure in response.get("batchItemFailures", [])
+                }
+            except Exception:
+                logging.exception("The Lambda function raised an error")
+                failed_ids = {message["MessageId"] for message in messages}
+            duration = time.perf_counter() - started
+
+            for message in messages:
+                if message["MessageId"] not in failed_ids:
+                    self.sqs.delete_message(
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=message["ReceiptHandle"],
+                    )
+            with self.lock:
+                self.durations.append(duration)
+                self.messages += len(messages)
+                self.errors += len(failed_ids)
+
+    def _receive_batch(self) -> list[dict]:
+        messages: list[dict] = []
+        while len(messages) < self.batch_size:
+            response = self.sqs.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=min(
+                    MAX_RECEIVE_SIZE,
+                    self.batch_size - len(messages),
+                ),
+                WaitTimeSeconds=0.05 if not messages else 0,
+            )
+            if not response.get("Messages"):
+                break
+            messages.extend(response["Messages"])
+        return messages
+
+
+def to_lambda_record(message: dict) -> dict:
+    return {
+        "messageId": message["MessageId"],
+        "receiptHandle": message["ReceiptHandle"],
+        "body": message["Body"],
+        "attributes": message["Attributes"],
+        "eventSource": "aws:sqs",
+    }
+
+
+def create_message_body(key: str, mapping_id: str, data_owner: str, s3_event: bool):
+    """
+    Returns the pipeline envelope sent by the validation poller, or the legacy
+    S3 event notification for an object uploaded by another principal
+    """
+    if s3_event:
+        return {
+            "Records": [
+                {
+                    "eventSource": "aws:s3",
+                    "userIdentity": {"principalId": "AWS:AROAOTHERPRINCIPAL:session"},
+                    "s3": {
+                        "bucket": {"name": DATA_TRANSFER_BUCKET},
+                        "object": {"key": quote_plus(key)},
+                    },
+                },
+            ],
+        }
+    return {
+        "PipelineEnvelope": {
+            "envelopeVersion": 1,
+            "bucket": DATA_TRANSFER_BUCKET,
+            "key": key,
+            "etag": uuid.uuid4().hex,
+            "size": 1024,
+            "sha256": uuid.uuid4().hex * 2,
+            "mappingId": mapping_id,
+            "dataTags": {
+                "dataOwner": data_owner,
+                "dataSteward": "Steward",
+                "govPoc": "POC",
+                "keyOwner": "KeyOwner",
+            },
+            "verdict": "CLEAN",
+        },
+    }
+
+
+def percentiles(values: list[float]) -> str:
+    if len(values) < 2:
+        return "n/a"
+    cut_points = statistics.quantiles(values, n=100, method="inclusive")
+    p50, p95, p99 = cut_points[49], cut_points[94], cut_points[98]
+    return (
+        f"p50 {p50 * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  "
+        f"p99 {p99 * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms"
+    )
+
+
+def main(args):
+    logging.basicConfig(level=args.log_level)
+
+    sqs = FakeSQS(time_scale=args.time_scale)
+    s3 = FakeS3()
+    ddb = FakeDynamoDB(unprocessed_rate=args.unprocessed_rate)
+    sns = FakeSNS()
+
+    data_transfer_queue = sqs.create_queue("DataTransferQueue")
+    transfer_status_queue = sqs.create_queue("TransferStatusQueue")
+    transfer_result_queue = sqs.create_queue("TransferResultQueue")
+    ddb.create_table(TRANSFER_ENVELOPE_TABLE, ["transferId"])
+    ddb.create_table(TRANSFER_STATUS_TABLE, ["s3Key", "timestamp"])
+
+    mappings = {str(uuid.uuid4()): f"destination-{i}" for i in range(args.mappings)}
+    simulator = DiodeSimulator(
+        DiodeSimulatorConfig(
+            min_latency=args.min_latency,
+            max_latency=args.max_latency,
+            max_tps=args.max_tps,
+            throttle_rate=args.throttle_rate,
+            failure_rate=args.failure_rate,
+            min_transfer_time=args.min_transfer_time,
+            max_transfer_time=args.max_transfer_time,
+            transfer_failure_rate=args.transfer_failure_rate,
+            rejection_rate=args.rejection_rate,
+        ),
+        mappings,
+        sqs_client=sqs,
+        status_queue_url=transfer_status_queue,
+        region=REGION,
+        account_id=ACCOUNT_ID,
+    )
+
+    # The Diode model is loaded relative to the data transfer Lambda directory,
+    # so it must create the first boto3 session
+    os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+    data_transfer = load_lambda(
+        "data_transfer",
+        DATA_TRANSFER_LAMBDA_DIR,
+        {
+            "AWS_REGION": REGION,
+            "TRANSFER_BUCKET_OWNER": ACCOUNT_ID,
+            "TRANSFER_RESULT_QUEUE_URL": transfer_result_queue,
+            "DATA_TRANSFER_QUEUE_URL": data_transfer_queue,
+            "USE_DIODE_SIMULATOR": "False",
+            "DIODE_SIMULATOR_ENDPOINT": "",
+            "TRANSFER_ENVELOPE_TABLE_NAME": TRANSFER_ENVELOPE_TABLE,
+            "VALIDATION_POLLER_ROLE_ID": VALIDATION_POLLER_ROLE_ID,
+        },
+    )
+    data_transfer.DIODE_CLIENT = simulator
+    data_transfer.DDB_CLIENT = ddb
+    data_transfer.S3_CLIENT = s3
+    data_transfer.SQS_CLIENT = sqs
+
+    transfer_result = load_lambda(
+        "transfer_result",
+        TRANSFER_RESULT_LAMBDA_DIR,
+        {
+            "DATA_TRANSFER_BUCKET": DATA_TRANSFER_BUCKET,
+            "FAILED_TRANSFER_BUCKET": FAILED_TRANSFER_BUCKET,
+            "DYNAMODB_TABLE_NAME": TRANSFER_STATUS_TABLE,
+            "FAILED_TRANSFER_TOPIC_ARN": f"arn:aws:sns:{REGION}:{ACCOUNT_ID}:FailedTransferTopic",  # noqa: E501
+            "ACCOUNT_ID": ACCOUNT_ID,
+        },
+    )
+    transfer_result.DDB_CLIENT = ddb
+    transfer_result.S3_CLIENT = s3
+    transfer_result.SNS_CLIENT = sns
+
+    # The Lambda modules set the root logger to INFO when imported
+    logging.getLogger().setLevel(args.log_level)
+
+    # Seed the data transfer bucket, as the validation poller does
+    sent_at: dict[str, float] = {}
+    bodies = []
+    for i in range(args.files):
+        key = f"loadtest/{i:07d} {uuid.uuid4().hex[:8]}.zip"
+        mapping_id = random.choice([*mappings])  # nosec B311
+        data_owner = f"Owner{i % 7}"
+        s3.put_object(
+            Bucket=DATA_TRANSFER_BUCKET,
+            Key=key,
+            Tagging=urlencode(
+                {
+                    "MappingId": mapping_id,
+                    DATA_TAG_KEY: f"{data_owner} / Steward / POC / KeyOwner",
+                },
+            ),
+        )
+        bodies.append(
+            (key, create_message_body(key, mapping_id, data_owner, args.s3_events)),
+        )
+
+    pollers = {
+        "Data Transfer (requests)": LambdaPoller(
+            sqs,
+            data_transfer_queue,
+            data_transfer.lambda_handler,
+            DATA_TRANSFER_BATCH_SIZE,
+            args.concurrency,
+        ),
+        "Data Transfer (status events)": LambdaPoller(
+            sqs,
+            transfer_status_queue,
+            data_transfer.lambda_handler,
+            DATA_TRANSFER_BATCH_SIZE,
+            args.concurrency,
+        ),
+        "Transfer Result": LambdaPoller(
+            sqs,
+            transfer_result_queue,
+            transfer_result.lambda_handler,
+            TRANSFER_RESULT_BATCH_SIZE,
+            args.concurrency,
+        ),
+    }
+
+    print(
+        f"Sending {args.files} {'S3 event' if args.s3_events else 'envelope'}(s) "
+        f"for {len(mappings)} mapping(s), {args.concurrency} concurrent invocation(s) per function",  # noqa: E501
+    )
+    started = time.monotonic()
+    for poller in pollers.values():
+        poller.start()
+    for key, body in bodies:
+        sent_at[key] = time.monotonic()
+        sqs.send_message(QueueUrl=data_transfer_queue, MessageBody=json.dumps(body))
+        if args.rate:
+            time.sleep(1 / args.rate)
+
+    # Wait until every file has a transfer result or is in a dead-letter queue
+    recorded_at: dict[str, float] = {}
+    dead_lettered: set[str] = set()
+    timed_out = False
+    while len(recorded_at) + len(dead_lettered - recorded_at.keys()) < args.files:
+        if time.monotonic() - started > args.timeout:
+            timed_out = True
+            break
+        time.sleep(0.1)
+        with ddb.lock:
+            writes = list(ddb.writes[TRANSFER_STATUS_TABLE])
+        for written_at, item in writes:
+            recorded_at.setdefault(item["s3Key"]["S"], written_at)
+        with sqs.lock:
+            dead_letters = [m for queue in sqs.dead_letters.values() for m in queue]
+        dead_lettered = {get_key(message["Body"]) for message in dead_letters}
+    elapsed = time.monotonic() - started
+
+    for poller in pollers.values():
+        poller.stop()
+    simulator.stop()
+
+    with ddb.lock:
+        items = [item for _, item in ddb.writes[TRANSFER_STATUS_TABLE]]
+    statuses: dict[str, int] = {}
+    for item in items:
+        statuses[item["status"]["S"]] = statuses.get(item["status"]["S"], 0) + 1
+
+    print(f"\n{'Timed out' if timed_out else 'Completed'} in {elapsed:.2f}s")
+    print(f"Recorded:           {len(recorded_at)}/{args.files} file(s) {statuses}")
+    print(f"Dead-lettered:      {len(dead_lettered - recorded_at.keys())} file(s)")
+    print(f"Throughput:         {len(recorded_at) / elapsed:,.1f} files/sec")
+    latencies = [recorded_at[key] - sent_at[key] for key in recorded_at]
+    print(f"End-to-end latency: {percentiles(latencies)}")
+
+    for name, poller in pollers.items():
+        print(
+            f"\n{name}: {poller.messages} message(s) in {len(poller.durations)} "
+            f"invocation(s), {poller.messages / elapsed:,.1f} messages/sec, "
+            f"{poller.errors} message(s) retried",
+        )
+        print(f"  Invocation duration: {percentiles(poller.durations)}")
+
+    print(f"\nDiode simulator: {simulator.stats}")
+    print(f"Failed transfer notifications: {len(sns.messages)}")
+    print(f"Left in the data transfer bucket: {s3.count(DATA_TRANSFER_BUCKET)}")
+    print(f"In the failed transfer bucket: {s3.count(FAILED_TRANSFER_BUCKET)}")
+
+
+def get_key(body: str) -> str:
+    """Returns the object key of a message on any of the queues"""
+    message = json.loads(body)
+    if "PipelineEnvelope" in message:
+        return message["PipelineEnvelope"]["key"]
+    if "Records" in message:
+        return unquote_plus(message["Records"][0]["s3"]["object"]["key"])
+    if "detail" in message:
+        return message["detail"]["s3Key"]
+    return message["key"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load-tests the data transfer and transfer result Lambdas against a simulated Diode",  # noqa: E501
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=1000,
+        help="(Optional) Specify the number of files to transfer. Defaults to 1000",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="(Optional) Specify the files sent per second. Defaults to all at once",
+    )
+    parser.add_argument(
+        "--mappings",
+        type=int,
+        default=5,
+        help="(Optional) Specify the number of Diode mappings. Defaults to 5",
+    )
+    parser.add_argument(
+        "--s3-events",
+        action="store_true",
+        help="(Optional) Send legacy S3 event notifications instead of envelopes",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=5,
+        help="(Optional) Specify the concurrent invocations per function. Defaults to 5",  # noqa: E501
+    )
+    parser.add_argument(
+        "--min-latency",
+        type=float,
+        default=0.02,
+        help="(Optional) Specify the minimum Diode API latency in seconds. Defaults to 0.02",  # noqa: E501
+    )
+    parser.add_argument(
+        "--max-latency",
+        type=float,
+        default=0.08,
+        help="(Optional) Specify the maximum Diode API latency in seconds. Defaults to 0.08",  # noqa: E501
+    )
+    parser.add_argument(
+        "--max-tps",
+        type=float,
+        default=0,
+        help="(Optional) Specify the CreateTransfer rate limit. Defaults to no limit",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0,
+        help="(Optional) Specify the share of Diode API calls throttled at random",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0,
+        help="(Optional) Specify the share of Diode API calls failed with a 500 error",
+    )
+    parser.add_argument(
+        "--min-transfer-time",
+        type=float,
+        default=0.5,
+        help="(Optional) Specify the minimum transfer time in seconds. Defaults to 0.5",  # noqa: E501
+    )
+    parser.add_argument(
+        "--max-transfer-time",
+        type=float,
+        default=2,
+        help="(Optional) Specify the maximum transfer time in seconds. Defaults to 2",
+    )
+    parser.add_argument(
+        "--transfer-failure-rate",
+        type=float,
+        default=0,
+        help="(Optional) Specify the share of the transfers that fail",
+    )
+    parser.add_argument(
+        "--rejection-rate",
+        type=float,
+        default=0,
+        help="(Optional) Specify the share of the transfers that are rejected",
+    )
+    parser.add_argument(
+        "--unprocessed-rate",
+        type=float,
+        default=0,
+        help="(Optional) Specify the share of DynamoDB batch items left unprocessed",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.01,
+        help="(Optional) Specify the factor applied to SQS visibility timeouts. Defaults to 0.01",  # noqa: E501
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        help="(Optional) Specify the maximum duration of the run in seconds. Defaults to 300",  # noqa: E501
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="ERROR",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="(Optional) Specify the log level of the Lambda functions. Defaults to ERROR",  # noqa: E501
+    )
+
+    main(parser.parse_args())
@@ -0,0 +1,340 @@
+###################################################################################
+#
+# Replays a trace captured by the validation instances (TraceCapture SSM
+# parameter) through the validation poller benchmark. A synthetic file is
+# created for each trace record, with the same extension and size and content
+# that leads to the same verdict, and its S3 event is queued at the original
+# inter-arrival time, divided by --speed. Reports the same results as
+# validation_benchmark.py, including the time the files waited in the queue.
+#
+# 1. Pre-requisites
+#
+# a. Python 3.11 (or higher)
+#
+# b. boto3 and puremagic libraries (as installed on the EC2 instances)
+#
+# c. The trace file(s), copied from /var/log/sqs_poller_trace.jsonl* on the
+#    validation instances
+#
+# 2. Run the following command for help
+#
+# For example:
+# Linux: python3.11 <name_of_script> -h
+# Windows: py -3.11 <name_of_script> -h
+#
+# Examples:
+# Replay at the original speed, then ten times faster with two pollers
+#   <name_of_script> --trace sqs_poller_trace.jsonl*
+#   <name_of_script> --trace sqs_poller_trace.jsonl* --speed 10 --workers 2
+#
+# NOTE: Replayed infected files contain the EICAR test string.
+#
+###################################################################################
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+from validation_benchmark import EXEMPT_FILE_TYPES
+from validation_benchmark import FakeClamd
+from validation_benchmark import create_environment
+from validation_benchmark import print_summary
+from validation_benchmark import run
+from validation_benchmark import submit
+from validation_benchmark import summarize
+from validation_benchmark import use_clamd
+from validation_corpus import CLEAN
+from validation_corpus import HEADERS
+from validation_corpus import INFECTED
+from validation_corpus import INVALID
+from validation_corpus import MIN_SIZE
+from validation_corpus import TEXT_TYPES
+from validation_corpus import create_file
+from validation_corpus import create_zip
+from validation_corpus import sample
+
+# Files whose object was deleted before they were validated end up nowhere
+NOT_FOUND = "NOT_FOUND"
+
+# Validation statuses of invalid ZIP files, and the corpus category producing them
+ZIP_CATEGORIES = {
+    "ZipMaxDepthExceeded": "nested_zip",
+    "InvalidZipFile": "corrupt_zip",
+}
+
+
+def read_trace(paths: list[str]) -> list[dict]:
+    """
+    Returns the records of the trace files in order of arrival. Records of
+    redelivered messages are merged into a single record with the final verdict.
+    """
+    records: dict[tuple, dict] = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record["arrivedAt"] = get_arrival_time(record)
+                key = (record["bucket"], record["key"], record["eventTime"])
+                first = records.get(key)
+                if first is None or first["receiveCount"] < record["receiveCount"]:
+                    if first:
+                        record["arrivedAt"] = min(
+                            first["arrivedAt"],
+                            record["arrivedAt"],
+                        )
+                    records[key] = record
+    return sorted(records.values(), key=lambda record: record["arrivedAt"])
+
+
+def get_arrival_time(record: dict) -> float:
+    """
+    The time of the S3 event, or the time the poller received it
+    """
+    if record.get("eventTime"):
+        return datetime.fromisoformat(record["eventTime"]).timestamp()
+    return record["receivedAt"]
+
+
+def create_replay_file(
+    record: dict,
+    max_size: int,
+    rng: random.Random,
+) -> tuple[str, bytes, str]:
+    """
+    Returns the extension, content and expected outcome of a file standing in
+    for the trace record
+    """
+    extension = record["extension"]
+    size = min(max(record.get("size") or MIN_SIZE, MIN_SIZE), max_size)
+    verdict = record["verdict"]
+    validation = record.get("validation")
+    detected_type = record.get("detectedType")
+
+    if verdict == INFECTED:
+        extension, content = create_file("eicar", size, rng)
+        return extension, content, INFECTED
+
+    if verdict == INVALID:
+        if validation in ZIP_CATEGORIES:
+            extension, content = create_file(ZIP_CATEGORIES[validation], size, rng)
+        elif validation == "ZipFileWithInvalidFile":
+            _, member = create_file("mismatched", size, rng)
+            extension, content = "zip", create_zip({"member.pdf": member})
+        elif detected_type and detected_type != extension:
+            # Not matched: the content of the detected type, with the original
+            # extension. Text types are left out, as puremagic only identifies
+            # them by their extension.
+            if detected_type in HEADERS:
+                content = sample(detected_type, size, rng)
+            elif detected_type == "zip":
+                _, content = create_file("zip", size, rng)
+            elif detected_type == "Unknown" and extension in [*HEADERS, "zip"]:
+                content = rng.randbytes(size)
+            else:
+                extension, content = create_file("mismatched", size, rng)
+        elif extension in HEADERS:
+            # Not approved in production, or traced before the detected type was
+            # recorded: the content of another type, with the original extension
+            file_type = rng.choice([t for t in HEADERS if t != extension])
+            content = sample(file_type, size, rng)
+        else:
+            extension, content = create_file("mismatched", size, rng)
+        return extension, content, INVALID
+
+    # Clean files, and files whose validation failed with an error
+    if extension in HEADERS or extension in TEXT_TYPES:
+        content = sample(extension, size, rng)
+    elif extension == "zip":
+        _, content = create_file("zip", size, rng)
+    else:
+        # Validated by extension only, as it is added to the exempt file types
+        content = rng.randbytes(size)
+    return extension, content, CLEAN
+
+
+def create_replay(
+    records: list[dict],
+    max_size: int,
+    seed: int,
+) -> tuple[list[dict], list[bytes | None]]:
+    """
+    Returns the manifest of the replayed files and their content
+    """
+    rng = random.Random(seed)  # nosec B311
+    manifest = []
+    contents: list[bytes | None] = []
+    for i, record in enumerate(records):
+        if record["verdict"] == NOT_FOUND:
+            extension, content, expected = record["extension"] or "bin", None, "ERROR"
+        else:
+            extension, content, expected = create_replay_file(record, max_size, rng)
+        manifest.append(
+            {
+                "name": f"{i:06d}-replay.{extension}",
+                "size": len(content) if content is not None else 0,
+                "expected": expected,
+                "arrivedAt": record["arrivedAt"],
+            },
+        )
+        contents.append(content)
+    return manifest, contents
+
+
+def get_exempt_file_types(manifest: list[dict]) -> str:
+    """
+    Adds the extensions that the corpus has no content for to the exempt file types
+    """
+    known = {*HEADERS, *TEXT_TYPES, "zip"}
+    extensions = {entry["name"].split(".")[-1] for entry in manifest} - known
+    return ",".join([EXEMPT_FILE_TYPES, *sorted(extensions)])
+
+
+def produce(
+    s3,
+    sqs,
+    queue_url: str,
+    manifest: list[dict],
+    contents: list[bytes | None],
+    speed: float,
+    producing: threading.Event,
+):
+    """
+    Queues the files at their original inter-arrival times divided by `speed`,
+    or all at once if `speed` is 0
+    """
+    try:
+        started = time.monotonic()
+        first_arrival = manifest[0]["arrivedAt"] if manifest else 0
+        for entry, content in zip(manifest, contents):
+            if speed:
+                due = started + (entry["arrivedAt"] - first_arrival) / speed
+                time.sleep(max(due - time.monotonic(), 0))  # nosemgrep arbitrary-sleep
+            submit(s3, sqs, queue_url, entry, content)
+    finally:
+        producing.clear()
+
+
+def main(args):
+    logging.basicConfig(level=args.log_level)
+
+    records = read_trace(args.trace)
+    manifest, contents = create_replay(records, args.max_size, args.seed)
+    if not manifest:
+        print("The trace has no records")
+        return
+    duration = manifest[-1]["arrivedAt"] - manifest[0]["arrivedAt"]
+
+    s3, sqs, av_scan_queue = create_environment(get_exempt_file_types(manifest))
+    clamd = None
+    if args.clamd == "fake":
+        clamd = FakeClamd(args.fake_clamd_overhead, args.fake_clamd_throughput)
+    use_clamd(clamd)
+
+    speed = f"{args.speed:g}x speed" if args.speed else "once"
+    print(
+        f"Replaying {len(manifest)} file(s) over {duration:.0f}s of trace, at {speed}, "
+        f"with {args.workers} poller(s) and {'a fake' if clamd else 'the local'} clamd",
+    )
+    producing = threading.Event()
+    producing.set()
+    producer = threading.Thread(
+        target=produce,
+        args=(s3, sqs, av_scan_queue, manifest, contents, args.speed, producing),
+    )
+    producer.start()
+    results, elapsed = run(sqs, av_scan_queue, args.workers, producing)
+    producer.join()
+
+    summary = summarize(results, manifest, s3, elapsed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote the results to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replays a validation poller trace through the benchmark",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--trace",
+        required=True,
+        nargs="+",
+        type=str,
+        help="Specify the trace file(s), including the rotated ones",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="(Optional) Specify the replay speed as a multiple of the original, or 0 to queue all files at once. Defaults to 1",  # noqa: E501
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="(Optional) Specify the number of concurrent pollers. Defaults to 1",
+    )
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="(Optional) Specify the maximum size in bytes of a replayed file. Defaults to 67108864",  # noqa: E501
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="(Optional) Specify the random seed, for reproducible file contents",
+    )
+    parser.add_argument(
+        "--clamd",
+        choices=["fake", "real"],
+        default="fake",
+        help="(Optional) Use a fake clamd, or the local clamd through clamdscan. Defaults to fake",  # noqa: E501
+    )
+    parser.add_argument(
+        "--fake-clamd-overhead",
+        type=float,
+        default=0.005,
+        help="(Optional) Specify the fake clamd's time per scan in seconds. Defaults to 0.005",  # noqa: E501
+    )
+    parser.add_argument(
+        "--fake-clamd-throughput",
+        type=float,
+        default=100 * 1024 * 1024,
+        help="(Optional) Specify the fake clamd's throughput in bytes/sec. Defaults to 104857600",  # noqa: E501
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="(Optional) Specify the JSON file to write the results to",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="(Optional) Specify the JSON results of a previous run to compare with",
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="CRITICAL",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="(Optional) Specify the log level of the validation poller. Defaults to CRITICAL",  # noqa: E501
+    )
+
+    main(parser.parse_args())
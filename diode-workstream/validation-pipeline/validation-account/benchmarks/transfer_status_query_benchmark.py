@@ -0,0 +1,240 @@
+###################################################################################
+#
+# Benchmarks the transfer status table's timestamp indexes against the filtered
+# Scan they replace, and the parallel-segment export, on a temporary table with
+# the same schema as `TransferStatusTable` in aftac_pipeline_stack.yaml.
+#
+# 1. Pre-requisites
+#
+# a. Python 3.11 (or higher)
+#
+# b. boto3 library
+#
+# c. DynamoDB Local (default) or an AWS account to create the temporary table in
+#
+# For example:
+# docker run -p 8000:8000 amazon/dynamodb-local
+#
+# 2. Run the following command for help
+#
+# For example:
+# Linux: python3.11 <name_of_script> -h
+# Windows: py -3.11 <name_of_script> -h
+#
+###################################################################################
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from transfer_status_query import INDEXES  # noqa: E402
+from transfer_status_query import create_client  # noqa: E402
+from transfer_status_query import query_transfers  # noqa: E402
+from transfer_status_query import scan_transfers  # noqa: E402
+from transfer_status_query import to_iso_utc  # noqa: E402
+
+STATUSES = ["SUCCEEDED"] * 8 + ["FAILED", "REJECTED"]
+# BatchWriteItem accepts up to 25 put requests per call
+MAX_BATCH_WRITE_SIZE = 25
+
+
+def create_table(client, table_name: str):
+    """Creates a table with the key schema and indexes of the transfer status table"""
+    attributes = ["s3Key", "timestamp", *INDEXES]
+    client.create_table(
+        TableName=table_name,
+        BillingMode="PAY_PER_REQUEST",
+        AttributeDefinitions=[
+            {"AttributeName": name, "AttributeType": "S"} for name in attributes
+        ],
+        KeySchema=[
+            {"AttributeName": "s3Key", "KeyType": "HASH"},
+            {"AttributeName": "timestamp", "KeyType": "RANGE"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": index_name,
+                "KeySchema": [
+                    {"AttributeName": attribute, "KeyType": "HASH"},
+                    {"AttributeName": "timestamp", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }
+            for attribute, index_name in INDEXES.items()
+        ],
+    )
+    client.get_waiter("table_exists").wait(TableName=table_name)
+
+
+def seed_table(client, table_name: str, items: int, mappings: int, days: int):
+    """Writes `items` random transfer results spread over the last `days` days"""
+    now = datetime.now(timezone.utc)
+    requests = []
+    for i in range(items):
+        age = random.uniform(0, days * 86400)  # nosec B311
+        timestamp = now - timedelta(seconds=age)
+        item = {
+            "s3Key": {"S": f"benchmark/{uuid.uuid4()}.zip"},
+            "timestamp": {"S": to_iso_utc(timestamp)},
+            "mappingId": {"S": f"mapping-{i % mappings}"},
+            "status": {"S": random.choice(STATUSES)},  # nosec B311
+            "transferId": {"S": str(uuid.uuid4())},
+            "dataOwner": {"S": f"owner-{i % 7}"},
+            "dataSteward": {"S": "Unknown"},
+            "govPoc": {"S": "Unknown"},
+            "keyOwner": {"S": "Unknown"},
+        }
+        requests.append({"PutRequest": {"Item": item}})
+
+    for i in range(0, len(requests), MAX_BATCH_WRITE_SIZE):
+        unprocessed = {table_name: requests[i : i + MAX_BATCH_WRITE_SIZE]}  # noqa E203
+        while unprocessed:
+            response = client.batch_write_item(RequestItems=unprocessed)
+            unprocessed = response.get("UnprocessedItems")
+
+
+def filtered_scan(client, table_name: str, mapping_id: str, start: str, end: str):
+    """The access pattern without the indexes: a Scan filtered by mapping and time"""
+    items = scanned = 0
+    paginator = client.get_paginator("scan")
+    for page in paginator.paginate(
+        TableName=table_name,
+        FilterExpression="#pk = :pk AND #ts BETWEEN :start AND :end",
+        ExpressionAttributeNames={"#pk": "mappingId", "#ts": "timestamp"},
+        ExpressionAttributeValues={
+            ":pk": {"S": mapping_id},
+            ":start": {"S": start},
+            ":end": {"S": end},
+        },
+    ):
+        items += page["Count"]
+        scanned += page["ScannedCount"]
+    return items, scanned
+
+
+def timed(func, runs: int) -> tuple[float, object]:
+    """Returns the median duration of `runs` calls, and the last result"""
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations), result
+
+
+def main(args):
+    client = create_client(args.region, args.endpoint_url, max(10, *args.segments))
+    table_name = f"transfer-status-benchmark-{uuid.uuid4().hex[:8]}"
+
+    print(f"Creating {table_name}")
+    create_table(client, table_name)
+    try:
+        started = time.perf_counter()
+        seed_table(client, table_name, args.items, args.mappings, args.days)
+        print(f"Seeded {args.items} item(s) in {time.perf_counter() - started:.2f}s")
+
+        end = to_iso_utc(datetime.now(timezone.utc))
+        start = to_iso_utc(datetime.now(timezone.utc) - timedelta(days=1))
+
+        duration, (count, scanned) = timed(
+            lambda: filtered_scan(client, table_name, "mapping-0", start, end),
+            args.runs,
+        )
+        print(
+            f"Filtered Scan:     {duration * 1000:9.1f} ms  "
+            f"{count} item(s), {scanned} scanned",
+        )
+
+        duration, items = timed(
+            lambda: list(
+                query_transfers(
+                    client,
+                    table_name,
+                    "mappingId",
+                    "mapping-0",
+                    start=start,
+                    end=end,
+                ),
+            ),
+            args.runs,
+        )
+        print(f"Index Query:       {duration * 1000:9.1f} ms  {len(items)} item(s)")
+
+        for segments in args.segments:
+            duration, items = timed(
+                lambda: list(scan_transfers(client, table_name, segments)),
+                args.runs,
+            )
+            print(
+                f"Export ({segments:2} seg.): {duration * 1000:9.1f} ms  "
+                f"{len(items)} item(s), {len(items) / duration:,.0f} items/s",
+            )
+    finally:
+        if args.keep_table:
+            print(f"Keeping {table_name}")
+        else:
+            client.delete_table(TableName=table_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the transfer status table's indexes and parallel export",  # noqa: E501
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        default="http://localhost:8000",
+        help="(Optional) Specify the DynamoDB endpoint. Defaults to DynamoDB Local",
+    )
+    parser.add_argument(
+        "--region",
+        type=str,
+        default="us-east-1",
+        help="(Optional) Specify the AWS region. Defaults to us-east-1",
+    )
+    parser.add_argument(
+        "--items",
+        type=int,
+        default=10000,
+        help="(Optional) Specify the number of items to seed. Defaults to 10000",
+    )
+    parser.add_argument(
+        "--mappings",
+        type=int,
+        default=20,
+        help="(Optional) Specify the number of mapping IDs. Defaults to 20",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=30,
+        help="(Optional) Specify the number of days the items span. Defaults to 30",
+    )
+    parser.add_argument(
+        "--segments",
+        type=lambda value: [int(segment) for segment in value.split(",")],
+        default=[1, 2, 4, 8],
+        help="(Optional) Specify the comma-separated segment counts to export with. Defaults to 1,2,4,8",  # noqa: E501
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="(Optional) Specify the number of runs per measurement. Defaults to 3",
+    )
+    parser.add_argument(
+        "--keep-table",
+        action="store_true",
+        help="(Optional) Keep the temporary table after the benchmark",
+    )
+
+    main(parser.parse_args())
@@ -0,0 +1,497 @@
+###################################################################################
+#
+# Benchmarks the validation poller (ec2-files) on a corpus generated by
+# validation_corpus.py. Synthetic S3 events are pushed through
+# `validation.validate_file`, with in-memory S3, SQS, SNS and SSM, and either a
+# fake clamd (default) or the local clamd through clamdscan. Reports files/sec,
+# bytes/sec and p50/p95/p99 per stage, and compares them with a previous run.
+#
+# 1. Pre-requisites
+#
+# a. Python 3.11 (or higher)
+#
+# b. boto3 and puremagic libraries (as installed on the EC2 instances)
+#
+# c. (Optional) clamd running locally, and clamdscan, for --clamd real
+#
+# For example:
+# Linux: python3.11 -m pip install boto3 puremagic
+# Windows: py -3.11 -m pip install boto3 puremagic
+#
+# 2. Run the following command for help
+#
+# For example:
+# Linux: python3.11 <name_of_script> -h
+# Windows: py -3.11 <name_of_script> -h
+#
+# Examples:
+# Generate a corpus, record a baseline, then compare a change against it
+#   python3.11 validation_corpus.py --output corpus --files 500
+#   <name_of_script> --corpus corpus --output baseline.json
+#   <name_of_script> --corpus corpus --baseline baseline.json
+#
+###################################################################################
+import argparse
+import importlib.metadata
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from datetime import timezone
+from urllib.parse import quote_plus
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+EC2_FILES_DIR = os.path.join(BENCHMARKS_DIR, "..", "ec2-files")
+LOADTEST_DIR = os.path.join(BENCHMARKS_DIR, "..", "..", "loadtest")
+
+RESOURCE_SUFFIX = "benchmark"
+REGION = "us-east-1"
+ACCOUNT_ID = "111122223333"
+
+# The EC2 files read these when imported
+os.environ.setdefault("region", REGION)
+os.environ["resource_suffix"] = RESOURCE_SUFFIX
+sys.path[:0] = [EC2_FILES_DIR, LOADTEST_DIR]
+
+import clamscan  # noqa: E402
+import config  # noqa: E402
+import trace_capture  # noqa: E402
+import utils  # noqa: E402
+import validation  # noqa: E402
+from local_aws import FakeS3  # noqa: E402
+from local_aws import FakeSNS  # noqa: E402
+from local_aws import FakeSQS  # noqa: E402
+from local_aws import FakeSSM  # noqa: E402
+from validation_corpus import CLEAN  # noqa: E402
+from validation_corpus import EICAR  # noqa: E402
+from validation_corpus import HEADERS  # noqa: E402
+from validation_corpus import INFECTED  # noqa: E402
+from validation_corpus import INVALID  # noqa: E402
+from validation_corpus import TEXT_TYPES  # noqa: E402
+from validation_corpus import create_zip  # noqa: E402
+from validation_corpus import sample  # noqa: E402
+
+INGESTION_BUCKET = "ingestion-bucket"
+BUCKETS = {
+    "DataTransferIngestBucketName": ("data-transfer-bucket", CLEAN),
+    "QuarantineBucketName": ("quarantine-bucket", INFECTED),
+    "InvalidFilesBucketName": ("invalid-files-bucket", INVALID),
+    "DfdlInputBucketName": ("dfdl-input-bucket", CLEAN),
+}
+EXEMPT_FILE_TYPES = "txt,csv"
+DFDL_FILE_TYPES = "dat"
+
+STAGES = ["queue_wait", "download", "file_type", "unzip", "av_scan", "upload", "total"]
+
+
+class FakeClamd:
+    """
+    Stands in for clamdscan: reports the EICAR test file as infected (also
+    inside ZIP files), and takes `overhead` seconds plus the size over
+    `throughput` bytes/sec per scan
+    """
+
+    def __init__(self, overhead: float, throughput: float):
+        self.overhead = overhead
+        self.throughput = throughput
+
+    def scan(self, key: str, file_path: str) -> int:
+        started = time.perf_counter()
+        with open(file_path, "rb") as f:
+            content = f.read()
+        exit_status = 1 if self.is_infected(content) else 0
+
+        scan_time = self.overhead + len(content) / self.throughput
+        time.sleep(max(scan_time - (time.perf_counter() - started), 0))
+        return exit_status
+
+    def is_infected(self, content: bytes) -> bool:
+        if EICAR in content:
+            return True
+        if not zipfile.is_zipfile(io.BytesIO(content)):
+            return False
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+                return any(
+                    self.is_infected(zip_file.read(name))
+                    for name in zip_file.namelist()
+                )
+        except zipfile.BadZipFile:
+            return False
+
+
+def create_environment(exempt_file_types=EXEMPT_FILE_TYPES):
+    """
+    Replaces the AWS clients of the EC2 files with in-memory stand-ins,
+    and returns the S3 and SQS stand-ins and the AV scan queue URL
+    """
+    s3 = FakeS3()
+    sqs = FakeSQS()
+    sns = FakeSNS()
+    av_scan_queue = sqs.create_queue("AvScanQueue")
+    data_transfer_queue = sqs.create_queue("DataTransferQueue")
+
+    params = {
+        f"/pipeline/{name}-{RESOURCE_SUFFIX}": bucket
+        for name, (bucket, _) in BUCKETS.items()
+    }
+    params |= {
+        f"/pipeline/AvScanQueueUrl-{RESOURCE_SUFFIX}": av_scan_queue,
+        f"/pipeline/DataTransferQueueUrl-{RESOURCE_SUFFIX}": data_transfer_queue,
+        f"/pipeline/DfdlApprovedFileTypes-{RESOURCE_SUFFIX}": DFDL_FILE_TYPES,
+        f"/pipeline/ExemptFileTypes-{RESOURCE_SUFFIX}": exempt_file_types,
+        f"/pipeline/QuarantineTopicArn-{RESOURCE_SUFFIX}": f"arn:aws:sns:{REGION}:{ACCOUNT_ID}:QuarantineTopic",  # noqa: E501
+        f"/pipeline/InvalidFilesTopicArn-{RESOURCE_SUFFIX}": f"arn:aws:sns:{REGION}:{ACCOUNT_ID}:InvalidFilesTopic",  # noqa: E501
+    }
+    ssm = FakeSSM(params)
+
+    utils.S3_CLIENT = s3
+    utils.SQS_CLIENT = sqs
+    utils.SNS_CLIENT = sns
+    utils.SSM_CLIENT = ssm
+    utils.get_params_values(config.ssm_params)
+
+    mime_mapping = get_mime_mapping()
+    ssm.parameters |= {
+        f"/{INGESTION_BUCKET}/ApprovedFileTypes-{RESOURCE_SUFFIX}": ",".join(
+            [*mime_mapping],
+        ),
+        f"/{INGESTION_BUCKET}/MimeMapping-{RESOURCE_SUFFIX}": json.dumps(mime_mapping),
+    }
+    s3.put_bucket_tagging(
+        Bucket=INGESTION_BUCKET,
+        Tagging={
+            "TagSet": [
+                {"Key": "DataOwner", "Value": "Owner"},
+                {"Key": "DataSteward", "Value": "Steward"},
+                {"Key": "GovPOC", "Value": "POC"},
+                {"Key": "KeyOwner", "Value": "KeyOwner"},
+                {"Key": "MappingId", "Value": "00000000-0000-0000-0000-000000000000"},
+            ],
+        },
+    )
+    return s3, sqs, av_scan_queue
+
+
+def submit(s3, sqs, queue_url: str, entry: dict, content: bytes | None):
+    """
+    Uploads the file to the ingestion bucket, unless `content` is None,
+    and queues its S3 event
+    """
+    etag = '"00000000000000000000000000000000"'
+    if content is not None:
+        etag = s3.put_object(
+            Bucket=INGESTION_BUCKET,
+            Key=entry["name"],
+            Body=content,
+        )["ETag"]
+    sqs.send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps({"Records": [create_s3_event(entry, etag)]}),
+    )
+
+
+def get_mime_mapping() -> dict[str, list[str]]:
+    """
+    Returns the approved file types of the corpus and their MIME types,
+    as identified by puremagic. Types it cannot identify (e.g. csv) are left
+    to the exempt file types
+    """
+    rng = random.Random(0)  # nosec B311
+    samples = {
+        file_type: sample(file_type, 4096, rng) for file_type in [*HEADERS, *TEXT_TYPES]
+    }
+    samples["zip"] = create_zip({"sample.txt": sample("txt", 4096, rng)})
+
+    mime_mapping: dict[str, list[str]] = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for file_type, content in samples.items():
+            path = os.path.join(tmpdir, f"sample.{file_type}")
+            with open(path, "wb") as f:
+                f.write(content)
+            identified_type, mime_type = utils.get_file_identity(path)
+            if identified_type in (utils.UNKNOWN, utils.ERROR):
+                continue
+            mime_mapping.setdefault(identified_type, []).append(mime_type)
+    return mime_mapping
+
+
+def create_s3_event(entry: dict, etag: str) -> dict:
+    return {
+        "eventSource": "aws:s3",
+        "eventTime": datetime.now(timezone.utc).isoformat(),
+        "eventName": "ObjectCreated:Put",
+        "userIdentity": {"principalId": "AWS:AROABENCHMARK:benchmark"},
+        "requestParameters": {"sourceIPAddress": "127.0.0.1"},
+        "s3": {
+            "bucket": {"name": INGESTION_BUCKET},
+            "object": {
+                "key": quote_plus(entry["name"]),
+                "size": entry["size"],
+                "eTag": etag.strip('"'),
+            },
+        },
+    }
+
+
+def use_clamd(clamd: FakeClamd | None):
+    if clamd:
+        clamscan._run_av_scan = clamd.scan
+
+
+def poll(
+    sqs,
+    queue_url: str,
+    results: list[dict],
+    lock: threading.Lock,
+    producing: threading.Event | None = None,
+):
+    """
+    Validates the files one message at a time, as the SQS poller does,
+    until the queue is empty and no more files are being produced
+    """
+    while True:
+        messages = utils.receive_sqs_message(queue_url)
+        if not messages:
+            if producing and producing.is_set():
+                time.sleep(0.01)  # nosemgrep arbitrary-sleep
+                continue
+            return
+        message = messages[0]
+        s3_event = json.loads(message["Body"])["Records"][0]
+        queue_wait = (
+            time.time()
+            - datetime.fromisoformat(
+                s3_event["eventTime"],
+            ).timestamp()
+        )
+
+        # The stage timings are recorded by the poller's trace hooks
+        trace_capture.start(s3_event, enabled=True)
+        try:
+            validation.validate_file(s3_event, message["ReceiptHandle"])
+        finally:
+            record = trace_capture.finish(write=False)
+
+        # Messages not deleted by the poller are not retried in the benchmark
+        sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"])
+        with lock:
+            results.append(
+                {
+                    "name": s3_event["s3"]["object"]["key"],
+                    "queue_wait": queue_wait,
+                    **record["stages"],
+                },
+            )
+
+
+def run(sqs, queue_url: str, workers: int, producing: threading.Event | None = None):
+    """
+    Runs `workers` pollers until they are done, and returns their results and
+    the elapsed time
+    """
+    results: list[dict] = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=poll, args=(sqs, queue_url, results, lock, producing))
+        for _ in range(workers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def get_outcome(s3, name: str) -> str:
+    for bucket, outcome in BUCKETS.values():
+        if name in s3.buckets.get(bucket, {}):
+            return outcome
+    # Left in the ingestion bucket, i.e. an unexpected error
+    return "ERROR"
+
+
+def percentile_summary(values: list[float]) -> dict[str, float]:
+    if len(values) < 2:
+        value = values[0] if values else 0
+        return {"p50": value, "p95": value, "p99": value}
+    cut_points = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cut_points[49], "p95": cut_points[94], "p99": cut_points[98]}
+
+
+def summarize(results: list[dict], manifest: list[dict], s3, elapsed: float) -> dict:
+    sizes = {entry["name"]: entry["size"] for entry in manifest}
+    total_bytes = sum(sizes[result["name"]] for result in results)
+
+    outcomes: dict[str, int] = {}
+    mismatches = []
+    for entry in manifest:
+        outcome = get_outcome(s3, entry["name"])
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if outcome != entry["expected"]:
+            mismatches.append(
+                f"{entry['name']}: expected {entry['expected']}, got {outcome}",
+            )
+
+    return {
+        "puremagic": importlib.metadata.version("puremagic"),
+        "files": len(results),
+        "bytes": total_bytes,
+        "seconds": elapsed,
+        "filesPerSecond": len(results) / elapsed,
+        "bytesPerSecond": total_bytes / elapsed,
+        "stages": {
+            stage: {
+                "count": len(durations),
+                **percentile_summary(durations),
+            }
+            for stage in STAGES
+            if (durations := [r[stage] for r in results if stage in r])
+        },
+        "outcomes": outcomes,
+        "mismatches": mismatches,
+    }
+
+
+def change(value: float, baseline: float | None, higher_is_better: bool) -> str:
+    if not baseline:
+        return ""
+    delta = (value - baseline) / baseline * 100
+    better = delta > 0 if higher_is_better else delta < 0
+    return f" ({delta:+.1f}% {'better' if better else 'worse'})"
+
+
+def print_summary(summary: dict, baseline: dict | None):
+    baseline = baseline or {}
+    print(
+        f"\n{summary['files']} file(s), {summary['bytes']:,} bytes "
+        f"in {summary['seconds']:.2f}s (puremagic {summary['puremagic']})",
+    )
+    if baseline.get("puremagic", summary["puremagic"]) != summary["puremagic"]:
+        print(f"The baseline was run with puremagic {baseline['puremagic']}")
+    print(
+        f"Files/sec: {summary['filesPerSecond']:,.2f}"
+        f"{change(summary['filesPerSecond'], baseline.get('filesPerSecond'), True)}",
+    )
+    print(
+        f"Bytes/sec: {summary['bytesPerSecond']:,.0f}"
+        f"{change(summary['bytesPerSecond'], baseline.get('bytesPerSecond'), True)}",
+    )
+
+    print(f"\n{'Stage':<10} {'Count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, stats in summary["stages"].items():
+        baseline_stats = baseline.get("stages", {}).get(stage, {})
+        print(
+            f"{stage:<10} {stats['count']:>6} "
+            + " ".join(f"{stats[p] * 1000:>10.1f}" for p in ("p50", "p95", "p99"))
+            + change(stats["p95"], baseline_stats.get("p95"), False).replace(
+                "(",
+                "(p95 ",
+            ),
+        )
+
+    print(f"\nOutcomes: {summary['outcomes']}")
+    for mismatch in summary["mismatches"]:
+        print(f"  Unexpected outcome: {mismatch}")
+
+
+def main(args):
+    logging.basicConfig(level=args.log_level)
+
+    with open(os.path.join(args.corpus, "manifest.jsonl")) as f:
+        manifest = [json.loads(line) for line in f]
+
+    s3, sqs, av_scan_queue = create_environment()
+    for entry in manifest:
+        with open(os.path.join(args.corpus, entry["name"]), "rb") as f:
+            submit(s3, sqs, av_scan_queue, entry, f.read())
+
+    clamd = None
+    if args.clamd == "fake":
+        clamd = FakeClamd(args.fake_clamd_overhead, args.fake_clamd_throughput)
+    use_clamd(clamd)
+
+    print(
+        f"Validating {len(manifest)} file(s) with {args.workers} poller(s) "
+        f"and {'a fake' if clamd else 'the local'} clamd",
+    )
+    results, elapsed = run(sqs, av_scan_queue, args.workers)
+
+    summary = summarize(results, manifest, s3, elapsed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote the results to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the validation poller on a synthetic corpus",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--corpus",
+        required=True,
+        type=str,
+        help="Specify the corpus directory generated by validation_corpus.py",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="(Optional) Specify the number of concurrent pollers. Defaults to 1",
+    )
+    parser.add_argument(
+        "--clamd",
+        choices=["fake", "real"],
+        default="fake",
+        help="(Optional) Use a fake clamd, or the local clamd through clamdscan. Defaults to fake",  # noqa: E501
+    )
+    parser.add_argument(
+        "--fake-clamd-overhead",
+        type=float,
+        default=0.005,
+        help="(Optional) Specify the fake clamd's time per scan in seconds. Defaults to 0.005",  # noqa: E501
+    )
+    parser.add_argument(
+        "--fake-clamd-throughput",
+        type=float,
+        default=100 * 1024 * 1024,
+        help="(Optional) Specify the fake clamd's throughput in bytes/sec. Defaults to 104857600",  # noqa: E501
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="(Optional) Specify the JSON file to write the results to",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="(Optional) Specify the JSON results of a previous run to compare with",
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="CRITICAL",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="(Optional) Specify the log level of the validation poller. Defaults to CRITICAL",  # noqa: E501
+    )
+
+    main(parser.parse_args())
@@ -0,0 +1,248 @@
+###################################################################################
+#
+# Generates a synthetic corpus for the validation pipeline benchmark: files of
+# mixed types and sizes, ZIP files, nested ZIP files, files whose extension does
+# not match their content, corrupt ZIP files and the EICAR anti-virus test file.
+# A manifest.jsonl lists each file with its category and expected outcome.
+#
+# 1. Pre-requisites
+#
+# a. Python 3.11 (or higher)
+#
+# 2. Run the following command for help
+#
+# For example:
+# Linux: python3.11 <name_of_script> -h
+# Windows: py -3.11 <name_of_script> -h
+#
+# Example:
+#   <name_of_script> --output corpus --files 500 --median-size 262144 --seed 1
+#
+# NOTE: Files containing the EICAR test string are flagged by anti-virus
+# software; generate the corpus in a directory excluded from real-time scanning.
+#
+###################################################################################
+import argparse
+import io
+import json
+import math
+import os
+import random
+import zipfile
+
+# Outcomes, as recorded by the validation poller
+CLEAN = "CLEAN"
+INFECTED = "INFECTED"
+INVALID = "INVALID"
+
+# Assembled at runtime so that this file itself is not flagged
+EICAR = b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$" + b"EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+
+# Leading bytes that identify each file type
+HEADERS = {
+    "pdf": b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n",
+    "png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+    "jpg": b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01",
+    "gif": b"GIF89a",
+}
+# Types without a signature, which are validated by extension only
+TEXT_TYPES = ["txt", "csv"]
+
+# Share of the corpus for each category
+DEFAULT_MIX = {
+    "clean": 70,
+    "zip": 10,
+    "nested_zip": 5,
+    "mismatched": 5,
+    "corrupt_zip": 5,
+    "eicar": 5,
+}
+EXPECTED = {
+    "clean": CLEAN,
+    "zip": CLEAN,
+    "nested_zip": INVALID,
+    "mismatched": INVALID,
+    "corrupt_zip": INVALID,
+    "eicar": INFECTED,
+}
+
+MIN_SIZE = 1024
+
+
+def sample(file_type: str, size: int, rng: random.Random) -> bytes:
+    """
+    Returns `size` bytes of content of `file_type`
+    """
+    if file_type in TEXT_TYPES:
+        line = b"id,name,value,timestamp\n" if file_type == "csv" else b""
+        words = [b"alpha", b"bravo", b"charlie", b"delta", b"echo", b"foxtrot"]
+        content = bytearray(line)
+        while len(content) < size:
+            content += b" ".join(rng.choices(words, k=12)) + b"\n"
+        return bytes(content[:size])
+
+    header = HEADERS[file_type]
+    return header + rng.randbytes(max(size - len(header), 0))
+
+
+def create_zip(members: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+def create_file(category: str, size: int, rng: random.Random) -> tuple[str, bytes]:
+    """
+    Returns the extension and content of a file of `category`, of about `size` bytes
+    """
+    file_types = [*HEADERS, *TEXT_TYPES]
+
+    if category == "clean":
+        file_type = rng.choice(file_types)
+        return file_type, sample(file_type, size, rng)
+
+    if category == "zip":
+        count = rng.randint(2, 5)
+        members = {}
+        for i in range(count):
+            file_type = rng.choice(file_types)
+            members[f"member-{i}.{file_type}"] = sample(file_type, size // count, rng)
+        return "zip", create_zip(members)
+
+    if category == "nested_zip":
+        inner = create_zip({"inner.txt": sample("txt", size // 2, rng)})
+        return "zip", create_zip(
+            {"readme.txt": sample("txt", size // 2, rng), "inner.zip": inner},
+        )
+
+    if category == "mismatched":
+        # The content of one type with the extension of another
+        file_type, extension = rng.sample([*HEADERS], 2)
+        return extension, sample(file_type, size, rng)
+
+    if category == "corrupt_zip":
+        return "zip", b"PK\x03\x04" + rng.randbytes(max(size - 4, 0))
+
+    if category == "eicar":
+        # The standard test file, on its own or inside a ZIP file
+        if rng.random() < 0.5:
+            return "txt", EICAR
+        return "zip", create_zip({"eicar.txt": EICAR})
+
+    raise ValueError(f"Unknown category: {category}")
+
+
+def get_size(rng: random.Random, median_size: int, max_size: int) -> int:
+    """
+    Returns a size from a log-normal distribution: mostly small files,
+    with a long tail of large ones
+    """
+    size = int(rng.lognormvariate(math.log(median_size), 1.5))
+    return min(max(size, MIN_SIZE), max_size)
+
+
+def generate(
+    output_dir: str,
+    files: int,
+    mix: dict[str, int],
+    median_size: int,
+    max_size: int,
+    seed: int,
+) -> list[dict]:
+    """
+    Writes the corpus and its manifest to `output_dir`, and returns the manifest
+    """
+    rng = random.Random(seed)  # nosec B311
+    os.makedirs(output_dir, exist_ok=True)
+
+    categories = rng.choices([*mix], weights=[*mix.values()], k=files)
+    manifest = []
+    for i, category in enumerate(categories):
+        size = get_size(rng, median_size, max_size)
+        extension, content = create_file(category, size, rng)
+        name = f"{i:06d}-{category}.{extension}"
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(content)
+        manifest.append(
+            {
+                "name": name,
+                "category": category,
+                "size": len(content),
+                "expected": EXPECTED[category],
+            },
+        )
+
+    with open(os.path.join(output_dir, "manifest.jsonl"), "w") as f:
+        for entry in manifest:
+            f.write(json.dumps(entry) + "\n")
+    return manifest
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """
+    Parses e.g. "clean=70,zip=10,eicar=20"
+    """
+    mix = {}
+    for part in value.split(","):
+        category, weight = part.split("=")
+        if category not in EXPECTED:
+            raise argparse.ArgumentTypeError(f"Unknown category: {category}")
+        mix[category] = int(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generates a synthetic corpus for the validation pipeline benchmark",  # noqa: E501
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        type=str,
+        help="Specify the directory to write the corpus to",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=500,
+        help="(Optional) Specify the number of files. Defaults to 500",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help=f"(Optional) Specify the share of each category. Defaults to {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())}",  # noqa: E501
+    )
+    parser.add_argument(
+        "--median-size",
+        type=int,
+        default=256 * 1024,
+        help="(Optional) Specify the median file size in bytes. Defaults to 262144",
+    )
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="(Optional) Specify the maximum file size in bytes. Defaults to 67108864",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="(Optional) Specify the random seed, for a reproducible corpus",
+    )
+    args = parser.parse_args()
+
+    manifest = generate(
+        args.output,
+        args.files,
+        args.mix,
+        args.median_size,
+        args.max_size,
+        args.seed,
+    )
+    total_size = sum(entry["size"] for entry in manifest)
+    print(f"Wrote {len(manifest)} file(s), {total_size:,} bytes to {args.output}")
@@ -2,12 +2,16 @@ import logging
 import subprocess  # nosec B404
 from urllib.parse import urlencode
 
+import trace_capture
 from config import instance_info
 from config import resource_suffix
 from config import ssm_params
+from envelope import create_envelope
+from envelope import send_envelope
 from utils import create_tags_for_av_scan
 from utils import delete_av_scan_message
 from utils import delete_object
+from utils import get_object_sha256
 from utils import get_origin_tags
 from utils import get_scan_status
 from utils import get_ttl
@@ -26,7 +30,8 @@ def scan(s3_event: dict, file_path: str, tags: dict, receipt_handle: str):
     # 2 : An error occurred.
     try:
         key = s3_event["s3"]["object"]["key"]
-        exit_status = _run_av_scan(key, file_path)
+        with trace_capture.stage("av_scan"):
+            exit_status = _run_av_scan(key, file_path)
         _process_file(s3_event, file_path, tags, exit_status, receipt_handle)
     except Exception:
         logger.exception("Exception occurred scanning file")
@@ -64,6 +69,7 @@ def _process_file(
 
     scan_status = get_scan_status(exit_status)
     logger.info(f"{key} is {scan_status}")
+    trace_capture.set_fields(verdict=scan_status)
 
     user_tags = get_user_tags_from_bucket(bucket, get_ttl())
     origin_tags = get_origin_tags(s3_event)
@@ -80,24 +86,37 @@ def _process_file(
     ]
     dfdl_input_bucket = ssm_params[f"/pipeline/DfdlInputBucketName-{resource_suffix}"]
 
-    if exit_status == 0:
-        destination_bucket = user_tags.get("DestinationBucket")
-        dfdl_bound = user_tags.get("DfdlBound")
-        if destination_bucket:
-            logger.info(f"Uploading {key} file to {destination_bucket}")
-            upload_file(destination_bucket, key, file_path, url_encoded_tags)
-        elif dfdl_bound == "Yes":
-            logger.info(f"Uploading {key} file to {dfdl_input_bucket}")
-            upload_file(dfdl_input_bucket, key, file_path, url_encoded_tags)
+    with trace_capture.stage("upload"):
+        if exit_status == 0:
+            destination_bucket = user_tags.get("DestinationBucket")
+            dfdl_bound = user_tags.get("DfdlBound")
+            if destination_bucket:
+                logger.info(f"Uploading {key} file to {destination_bucket}")
+                upload_file(destination_bucket, key, file_path, url_encoded_tags)
+            elif dfdl_bound == "Yes":
+                logger.info(f"Uploading {key} file to {dfdl_input_bucket}")
+                upload_file(dfdl_input_bucket, key, file_path, url_encoded_tags)
+            else:
+                logger.info(f"Uploading {key} file to Data Transfer bucket")
+                upload_file(data_transfer_bucket, key, file_path, url_encoded_tags)
+                # The transfer is requested by the envelope rather than the S3 event
+                envelope = create_envelope(
+                    data_transfer_bucket,
+                    key,
+                    etag,
+                    file_path,
+                    user_tags,
+                    scan_status,
+                    # Verified by S3 on upload, which saves hashing the file
+                    get_object_sha256(bucket, key, etag),
+                )
+                send_envelope(envelope)
+        elif exit_status == 1:
+            logger.info(f"Uploading {key} file to Quarantine bucket")
+            upload_file(quarantine_bucket, key, file_path, url_encoded_tags)
         else:
-            logger.info(f"Uploading {key} file to Data Transfer bucket")
-            upload_file(data_transfer_bucket, key, file_path, url_encoded_tags)
-    elif exit_status == 1:
-        logger.info(f"Uploading {key} file to Quarantine bucket")
-        upload_file(quarantine_bucket, key, file_path, url_encoded_tags)
-    else:
-        logger.info(f"Uploading {key} file to Invalid Files bucket")
-        upload_file(invalid_files_bucket, key, file_path, url_encoded_tags)
+            logger.info(f"Uploading {key} file to Invalid Files bucket")
+            upload_file(invalid_files_bucket, key, file_path, url_encoded_tags)
 
     # Delete the object only if it is the same object
     if head_object(bucket, key, etag):
@@ -10,15 +10,24 @@ file_handler_config = {
     "backupCount": 7,
 }
 
+# Trace of the received messages, written while TraceCapture is "true"
+trace_file_handler_config = {
+    "filename": "/var/log/sqs_poller_trace.jsonl",
+    "maxBytes": 50 * 1024 * 1024,
+    "backupCount": 20,
+}
+
 # Populated and updated in the main function
 ssm_params = {
     f"/pipeline/DataTransferIngestBucketName-{resource_suffix}": "",
     f"/pipeline/QuarantineBucketName-{resource_suffix}": "",
     f"/pipeline/InvalidFilesBucketName-{resource_suffix}": "",
     f"/pipeline/DfdlInputBucketName-{resource_suffix}": "",
+    f"/pipeline/DataTransferQueueUrl-{resource_suffix}": "",
     f"/pipeline/AvScanQueueUrl-{resource_suffix}": "",
     f"/pipeline/DfdlApprovedFileTypes-{resource_suffix}": "",
     f"/pipeline/ExemptFileTypes-{resource_suffix}": "",
     f"/pipeline/QuarantineTopicArn-{resource_suffix}": "",
     f"/pipeline/InvalidFilesTopicArn-{resource_suffix}": "",
+    f"/pipeline/TraceCapture-{resource_suffix}": "",
 }
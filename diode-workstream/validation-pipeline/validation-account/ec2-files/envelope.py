@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import os
+
+from config import resource_suffix
+from config import ssm_params
+from utils import send_sqs_message
+
+logger = logging.getLogger()
+
+# Increment when making a breaking change to the envelope
+ENVELOPE_VERSION = 1
+# Consumers look for this key in the message body
+ENVELOPE_KEY = "PipelineEnvelope"
+
+DATA_TAG_KEY = "DataOwner / DataSteward / GovPOC / KeyOwner"
+DATA_TAG_NAMES = ["dataOwner", "dataSteward", "govPoc", "keyOwner"]
+UNKNOWN = "Unknown"
+NO_MAPPING_ID = "None"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def create_envelope(
+    bucket: str,
+    key: str,
+    etag: str,
+    file_path: str,
+    user_tags: dict[str, str],
+    verdict: str,
+    sha256: str | None = None,
+) -> dict:
+    """
+    Returns the pipeline envelope for the object at `bucket`/`key`, which carries
+    the facts established by the poller to the downstream consumers.\n
+    `etag` is the ETag of the object in the ingestion bucket.\n
+    `sha256` is the hex digest of the file, if known, or it is hashed.
+    """
+    return {
+        "envelopeVersion": ENVELOPE_VERSION,
+        "bucket": bucket,
+        "key": key,
+        "etag": etag,
+        "size": os.path.getsize(file_path),
+        "sha256": sha256 or get_sha256(file_path),
+        "mappingId": user_tags.get("MappingId", NO_MAPPING_ID),
+        "dataTags": get_data_tags(user_tags),
+        "verdict": verdict,
+    }
+
+
+def get_sha256(file_path: str) -> str:
+    """
+    Returns the hex digest of the SHA-256 hash of the file
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_data_tags(user_tags: dict[str, str]) -> dict[str, str]:
+    """
+    Splits the value of `DataOwner / DataSteward / GovPOC / KeyOwner` tag into
+    individual values.\n
+    If the tag is not set, all values are "Unknown".
+    """
+    data_tag_value = user_tags.get(DATA_TAG_KEY)
+    if data_tag_value is None:
+        logger.warning(f"The bucket did not have {DATA_TAG_KEY} tag key")
+        return {name: UNKNOWN for name in DATA_TAG_NAMES}
+
+    values = [value.strip() for value in data_tag_value.split("/")]
+    return dict(zip(DATA_TAG_NAMES, values))
+
+
+def send_envelope(envelope: dict):
+    """
+    Sends the envelope to the Data Transfer queue, which requests the transfer
+    """
+    logger.info(f"Sending the pipeline envelope for {envelope['key']}")
+    queue_url = ssm_params[f"/pipeline/DataTransferQueueUrl-{resource_suffix}"]
+    send_sqs_message(queue_url, json.dumps({ENVELOPE_KEY: envelope}))
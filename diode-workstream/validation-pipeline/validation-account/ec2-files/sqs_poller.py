@@ -4,6 +4,7 @@ import logging
 import time
 from logging.handlers import TimedRotatingFileHandler
 
+import trace_capture
 from config import file_handler_config
 from config import instance_info
 from config import resource_suffix
@@ -70,7 +71,11 @@ def main():
 
             message_body: dict = json.loads(message["Body"])
             s3_event: dict = message_body["Records"][0]
-            validate_file(s3_event, receipt_handle)
+            trace_capture.start(s3_event, receive_count)
+            try:
+                validate_file(s3_event, receipt_handle)
+            finally:
+                trace_capture.finish()
 
             logger.info("-" * 100)
 
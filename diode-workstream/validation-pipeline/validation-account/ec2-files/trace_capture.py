@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from config import resource_suffix
+from config import ssm_params
+from config import trace_file_handler_config
+
+logger = logging.getLogger()
+
+# Increment when making a breaking change to the trace records
+TRACE_VERSION = 1
+
+# Keys and bucket names are replaced by a keyed hash, which is stable for the
+# lifetime of the process (or across processes if `trace_salt` is set)
+SALT = (os.getenv("trace_salt") or os.urandom(16).hex()).encode()
+
+# The trace record of the message being processed by the current thread
+_current = threading.local()
+
+_trace_logger = logging.getLogger("sqs_poller_trace")
+_trace_logger.propagate = False
+_trace_logger.setLevel(logging.INFO)
+
+
+def is_capture_enabled() -> bool:
+    """
+    Capture is turned on and off at runtime with the TraceCapture SSM parameter
+    """
+    value = ssm_params.get(f"/pipeline/TraceCapture-{resource_suffix}", "")
+    return value.strip().lower() == "true"
+
+
+def anonymize(value: str) -> str:
+    return hmac.new(SALT, value.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def start(s3_event: dict, receive_count=1, enabled: bool | None = None):
+    """
+    Starts the trace record for the S3 event, if capture is enabled
+    """
+    if enabled is None:
+        enabled = is_capture_enabled()
+    if not enabled:
+        _current.record = None
+        return
+
+    s3_object = s3_event["s3"]["object"]
+    key: str = s3_object["key"]
+    _current.started = time.perf_counter()
+    _current.record = {
+        "version": TRACE_VERSION,
+        "receivedAt": time.time(),
+        "eventTime": s3_event.get("eventTime"),
+        "bucket": anonymize(s3_event["s3"]["bucket"]["name"]),
+        "key": anonymize(key),
+        "extension": key.lower().split(".")[-1] if "." in key else "",
+        "size": s3_object.get("size"),
+        "receiveCount": receive_count,
+        "validation": None,
+        "detectedType": None,
+        "mimeType": None,
+        "verdict": None,
+        "stages": {},
+    }
+
+
+def set_fields(**fields):
+    record = getattr(_current, "record", None)
+    if record is not None:
+        record.update(fields)
+
+
+def set_validation(tags: dict):
+    """
+    Records the validation status, detected file type and MIME type of the file
+    type tags, e.g. "FileTypeNotMatched / pdf / application/pdf"
+    """
+    key, value = next(iter(tags.items()), ("", ""))
+    parts = dict(zip(key.split(" / "), value.split(" / ")))
+    set_fields(
+        validation=parts.get("ValidationError") or None,
+        detectedType=parts.get("FileType") or None,
+        mimeType=parts.get("MimeType") or None,
+    )
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Adds the time spent in the block to the stage of the current record
+    """
+    record = getattr(_current, "record", None)
+    if record is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = record["stages"]
+        stages[name] = stages.get(name, 0) + time.perf_counter() - started
+
+
+def finish(write=True) -> dict | None:
+    """
+    Completes the current record, writes it to the trace file and returns it
+    """
+    record = getattr(_current, "record", None)
+    if record is None:
+        return None
+    _current.record = None
+
+    record["stages"]["total"] = time.perf_counter() - _current.started
+    record["verdict"] = record["verdict"] or "ERROR"
+    if write:
+        try:
+            _get_trace_logger().info(json.dumps(record))
+        except Exception as e:
+            # Not critical; the trace must not affect the validation
+            logger.warning(f"Could not write the trace record: {e}")
+    return record
+
+
+def _get_trace_logger() -> logging.Logger:
+    """
+    The trace file is only created once capture is enabled
+    """
+    if not _trace_logger.handlers:
+        handler = RotatingFileHandler(**trace_file_handler_config)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _trace_logger.addHandler(handler)
+    return _trace_logger
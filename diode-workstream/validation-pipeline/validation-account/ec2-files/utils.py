@@ -1,3 +1,4 @@
+import base64
 import json
 import logging
 import os
@@ -53,6 +54,30 @@ def head_object(bucket: str, key: str, etag: str, bucket_owner: str | None = Non
             raise e
 
 
+def get_object_sha256(bucket: str, key: str, etag: str) -> str | None:
+    """
+    Returns the hex digest of the SHA-256 checksum that S3 verified when the
+    object was uploaded, or None if the object has no full object SHA-256 checksum.\n
+    Multipart uploads have a checksum of the part checksums instead.
+    """
+    try:
+        response = S3_CLIENT.head_object(
+            Bucket=bucket,
+            Key=key,
+            IfMatch=etag,
+            ChecksumMode="ENABLED",
+        )
+    except ClientError:
+        logger.warning(f"Failed to get the checksum of {bucket}/{key}", exc_info=True)
+        return None
+
+    checksum = response.get("ChecksumSHA256")
+    # Composite checksums have a -<part count> suffix
+    if not checksum or "-" in checksum:
+        return None
+    return base64.b64decode(checksum).hex()
+
+
 def delete_object(
     bucket: str,
     key: str,
@@ -149,6 +174,8 @@ def download_file(
     params: dict[str, str | dict] = dict(Bucket=bucket, Key=key, Filename=file_path)
     if bucket_owner:
         params["ExtraArgs"] = {"ExpectedBucketOwner": bucket_owner}
+    # Verifies the content against the checksum that the object was uploaded with
+    params.setdefault("ExtraArgs", {})["ChecksumMode"] = "ENABLED"  # type: ignore
 
     try:
         S3_CLIENT.download_file(**params)
@@ -212,6 +239,17 @@ def delete_sqs_message(queue_url: str, receipt_handle: str):
     logger.info("Successfully deleted the message")
 
 
+def send_sqs_message(queue_url: str, message: str, delay_seconds: int | None = None):
+    queue_name = queue_url.split("/")[-1]
+    logger.info(f"Sending a message to {queue_name} SQS queue")
+    params: dict[str, str | int] = dict(QueueUrl=queue_url, MessageBody=message)
+    if delay_seconds is not None:
+        params["DelaySeconds"] = delay_seconds
+
+    SQS_CLIENT.send_message(**params)
+    logger.info("Successfully sent the message")
+
+
 def change_message_visibility(queue_url: str, receipt_handle: str, timeout: int):
     # Unlike with a queue, when you change the visibility timeout for a specific
     # message, the timeout value is applied immediately but isn’t saved in memory
@@ -627,17 +665,6 @@ def add_tags(
     logger.info("Successfully added the new tags")
 
 
-def send_sqs_message(queue_url: str, message: str, delay_seconds: int | None = None):
-    queue_name = queue_url.split("/")[-1]
-    logger.info(f"Sending a message to {queue_name} SQS queue")
-    params: dict[str, str | int] = dict(QueueUrl=queue_url, MessageBody=message)
-    if delay_seconds is not None:
-        params["DelaySeconds"] = delay_seconds
-
-    SQS_CLIENT.send_message(**params)
-    logger.info("Successfully sent the message")
-
-
 def empty_dir(dir: str):
     """
     Deletes all files and subdirectories in the given directory.\n
@@ -5,6 +5,7 @@ from urllib.parse import unquote_plus
 from urllib.parse import urlencode
 
 import clamscan
+import trace_capture
 from config import instance_info
 from config import resource_suffix
 from config import ssm_params
@@ -37,9 +38,11 @@ def validate_file(s3_event: dict, receipt_handle: str):
     with tempfile.TemporaryDirectory() as tmpdir:
         # If key includes prefixes, split it and take the last element
         file_path = f'{tmpdir}/{key.split("/")[-1]}'
-        downloaded = download_file(bucket, key, file_path)
+        with trace_capture.stage("download"):
+            downloaded = download_file(bucket, key, file_path)
         # If the object does not exist or is not a valid file path
         if not downloaded:
+            trace_capture.set_fields(verdict="NOT_FOUND")
             delete_av_scan_message(receipt_handle)
             return
 
@@ -51,7 +54,9 @@ def validate_file(s3_event: dict, receipt_handle: str):
 def _validate_file(s3_event: dict, file_path: str, receipt_handle: str):
     try:
         file_ext = get_file_ext(file_path)
-        valid, tags = validate_file_type(s3_event, file_path, file_ext)
+        with trace_capture.stage("file_type"):
+            valid, tags = validate_file_type(s3_event, file_path, file_ext)
+        trace_capture.set_validation(tags)
 
         if not valid:
             _process_invalid_file(s3_event, file_path, tags, receipt_handle)
@@ -60,6 +65,7 @@ def _validate_file(s3_event: dict, file_path: str, receipt_handle: str):
         if file_ext == "zip":
             _valid, _tags = _validate_zip_file(s3_event, file_path)
             if not _valid:
+                trace_capture.set_validation(_tags)
                 _process_invalid_file(s3_event, file_path, _tags, receipt_handle)
                 return False, {}
 
@@ -87,7 +93,9 @@ def _validate_zip_file(s3_event: dict, file_path: str, depth=0):
         return False, error_tags
 
     with tempfile.TemporaryDirectory() as tmpdir:
-        if not extract_zipfile(file_path, tmpdir):
+        with trace_capture.stage("unzip"):
+            extracted = extract_zipfile(file_path, tmpdir)
+        if not extracted:
             error_tags = create_tags_for_file_validation(
                 "InvalidZipFile",
                 "zip",
@@ -108,7 +116,7 @@ def _validate_zip_file(s3_event: dict, file_path: str, depth=0):
                 return False, error_tags
 
             if _file_ext == "zip":
-                return _validate_zip_file(_file_path, depth + 1)
+                return _validate_zip_file(s3_event, _file_path, depth + 1)
 
     return True, None
 
@@ -136,7 +144,9 @@ def _process_invalid_file(
         f"/pipeline/InvalidFilesBucketName-{resource_suffix}"
     ]
     logger.info(f"Uploading {key} file to Invalid Files bucket")
-    upload_file(invalid_files_bucket, key, file_path, url_encoded_tags)
+    trace_capture.set_fields(verdict="INVALID")
+    with trace_capture.stage("upload"):
+        upload_file(invalid_files_bucket, key, file_path, url_encoded_tags)
     if head_object(bucket, key, etag):
         delete_object(bucket, key)  # Delete it from the ingestion bucket
     delete_av_scan_message(receipt_handle)
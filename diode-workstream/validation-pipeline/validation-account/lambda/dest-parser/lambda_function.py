@@ -1,60 +1,34 @@
 import logging
-import time
+from urllib.parse import unquote_plus
 
+import ledger
 import utils
-from botocore.exceptions import ClientError  # type: ignore
+from retry import Deadline
+from retry import get_breaker
+from retry import retry_with_backoff
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Non-retryable error codes
-NON_RETRYABLE_ERRORS = {
-    "AccessDenied",
-    "Forbidden",
-    "InvalidAccessKeyId",
-    "SignatureDoesNotMatch",
-    "TokenRefreshRequired",
-    "NoSuchBucket",
-    "NoSuchKey",
-    "ParameterNotFound",
-}
-
-
-def retry_with_backoff(func, max_retries=3, base_delay=1):
-    """Retry function with exponential backoff for retryable errors"""
-    for attempt in range(max_retries + 1):
-        try:
-            return func()
-        except ClientError as e:
-            error_code = e.response["Error"]["Code"]
-
-            if error_code in NON_RETRYABLE_ERRORS or attempt == max_retries:
-                logger.error(
-                    f"Non-retryable error or max retries reached: {error_code}",
-                )
-                raise
-
-            delay = base_delay * (2**attempt)
-            logger.warning(
-                f"Retryable error {error_code}, attempt {attempt + 1}/{max_retries + 1}, retrying in {delay}s",  # noqa: E501
-            )
-            time.sleep(delay)
-        except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            raise
+# Reused across warm invocations
+LEDGER = ledger.create_ledger()
 
 
 def lambda_handler(event, context):
+    # Retries stop short of the Lambda timeout
+    deadline = Deadline(context)
     try:
 
         bucket = event["Records"][0]["s3"]["bucket"]["name"]
-        key = event["Records"][0]["s3"]["object"]["key"]
+        # Keys in S3 event notifications are URL-encoded
+        key = unquote_plus(event["Records"][0]["s3"]["object"]["key"])
 
         logger.info(f"Processing file {key} from bucket {bucket}")
 
         # Get destination mapping key with retry
         destination_map_key = retry_with_backoff(
             lambda: utils.get_dest_tag(bucket, key),
+            deadline,
         )
 
         if not destination_map_key:
@@ -64,6 +38,7 @@ def lambda_handler(event, context):
         # Get bucket mappings with retry
         buckets = retry_with_backoff(
             lambda: utils.get_key_mappings(destination_map_key),
+            deadline,
         )
 
         if not buckets:
@@ -74,30 +49,61 @@ def lambda_handler(event, context):
 
         logger.info(f"Found {len(buckets)} destination buckets: {buckets}")
 
-        # Copy files with individual error handling
-        success_count = 0
-        failed_buckets = []
+        source = retry_with_backoff(
+            lambda: utils.get_source_object(bucket, key),
+            deadline,
+        )
 
-        for dest_bucket in buckets:
-            try:
-                retry_with_backoff(
-                    lambda: utils.copy_single_file(bucket, key, dest_bucket),
-                )
-                success_count += 1
-                logger.info(f"Successfully copied {key} to {dest_bucket}")
-            except Exception as e:
-                logger.error(f"Failed to copy {key} to {dest_bucket}: {str(e)}")
-                failed_buckets.append(dest_bucket)
+        # Skip the destinations completed by a previous attempt
+        completed = retry_with_backoff(
+            lambda: LEDGER.get_completed(bucket, key, source["etag"]),
+            deadline,
+        )
+        outstanding = [
+            dest_bucket for dest_bucket in buckets if dest_bucket not in completed
+        ]
+        logger.info(
+            f"{len(buckets) - len(outstanding)} destination(s) already completed; "
+            f"copying to {len(outstanding)}: {outstanding}",
+        )
+
+        # Copy to the outstanding destinations concurrently, server-side
+        results = {
+            dest_bucket: {"status": utils.SUCCEEDED, "error": None}
+            for dest_bucket in buckets
+            if dest_bucket in completed
+        }
+        results.update(
+            utils.fan_out(
+                outstanding,
+                lambda dest_bucket: copy_and_record(source, dest_bucket, deadline),
+            ),
+        )
+        success_count = sum(
+            1 for result in results.values() if result["status"] == utils.SUCCEEDED
+        )
+        failed_buckets = [
+            dest_bucket
+            for dest_bucket, result in results.items()
+            if result["status"] != utils.SUCCEEDED
+        ]
 
         # Log summary
         logger.info(
-            f"Copy operation completed: {success_count}/{len(buckets)} successful",
+            f"Copy operation completed: {success_count}/{len(results)} successful",
         )
 
-        if success_count == len(buckets):
-            # All transfers successful - delete original file
+        completed = retry_with_backoff(
+            lambda: LEDGER.get_completed(bucket, key, source["etag"]),
+            deadline,
+        )
+        if set(buckets) <= completed:
+            # The ledger shows all transfers successful - delete original file
             try:
-                retry_with_backoff(lambda: utils.delete_source_file(bucket, key))
+                retry_with_backoff(
+                    lambda: utils.delete_source_file(bucket, key),
+                    deadline,
+                )
                 logger.info(f"Successfully deleted source file {key} from {bucket}")
             except Exception as e:
                 logger.error(f"Failed to delete source file {key}: {str(e)}")
@@ -107,22 +113,40 @@ def lambda_handler(event, context):
             logger.error(f"Failed to copy to buckets: {failed_buckets}")
             try:
                 retry_with_backoff(
-                    lambda: utils.send_failure_notification(
-                        bucket,
-                        key,
-                        failed_buckets,
-                        success_count,
-                        len(buckets),
-                    ),
+                    lambda: utils.send_failure_notification(bucket, key, results),
+                    deadline,
                 )
             except Exception as e:
                 logger.error(f"Failed to send SNS notification: {str(e)}")
 
-            if success_count == 0:
-                raise RuntimeError("Failed to copy file to any destination bucket")
+            # Signal to Lambda to retry; only the outstanding destinations are copied
+            raise RuntimeError(
+                f"Failed to copy file to {len(failed_buckets)} destination bucket(s)",
+            )
 
     except Exception as e:
         logger.error(
             f"Error processing file {event.get('Records', [{}])[0].get('s3', {}).get('object', {}).get('key', 'unknown')}: {str(e)}",  # noqa: E501
         )
         raise
+
+
+def copy_and_record(source, dest_bucket, deadline):
+    """
+    Copy the source object to dest_bucket and record it in the ledger.\n
+    A destination bucket that keeps failing is skipped by its circuit breaker.
+    """
+    retry_with_backoff(
+        lambda: utils.copy_to_destination(source, dest_bucket),
+        deadline,
+        breaker=get_breaker(dest_bucket),
+    )
+    retry_with_backoff(
+        lambda: LEDGER.mark_completed(
+            source["bucket"],
+            source["key"],
+            source["etag"],
+            dest_bucket,
+        ),
+        deadline,
+    )
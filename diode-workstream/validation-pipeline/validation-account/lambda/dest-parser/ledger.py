@@ -0,0 +1,86 @@
+import logging
+import os
+import threading
+import time
+
+import boto3  # type: ignore
+from botocore.exceptions import ClientError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Ledger entries are only needed while a fan-out is being retried
+LEDGER_TTL_SECONDS = int(os.getenv("LEDGER_TTL_SECONDS", str(14 * 24 * 60 * 60)))
+
+
+class DynamoDBLedger:
+    """
+    Records the destinations a source object (bucket, key, ETag) has been
+    copied to, so that retries only copy to the outstanding destinations
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+
+    def get_completed(self, bucket, key, etag):
+        """Return the set of destination buckets already copied to"""
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key=self._key(bucket, key, etag),
+            ProjectionExpression="completed",
+            ConsistentRead=True,
+        )
+        return set(response.get("Item", {}).get("completed", {}).get("SS", []))
+
+    def mark_completed(self, bucket, key, etag, dest_bucket):
+        """Record that the copy to dest_bucket has completed"""
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key=self._key(bucket, key, etag),
+                UpdateExpression="ADD completed :dest SET expiresAt = :expires_at",
+                # Only write when the destination is not recorded yet
+                ConditionExpression="NOT contains(completed, :dest_bucket)",
+                ExpressionAttributeValues={
+                    ":dest": {"SS": [dest_bucket]},
+                    ":dest_bucket": {"S": dest_bucket},
+                    ":expires_at": {"N": str(int(time.time()) + LEDGER_TTL_SECONDS)},
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            logger.info(f"{dest_bucket} was already recorded as completed")
+
+    @staticmethod
+    def _key(bucket, key, etag):
+        return {"source": {"S": f"{bucket}/{key}"}, "etag": {"S": etag}}
+
+
+class InMemoryLedger:
+    """In-memory stand-in for DynamoDBLedger, e.g. for tests"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_completed(self, bucket, key, etag):
+        with self.lock:
+            return set(self.entries.get((bucket, key, etag), set()))
+
+    def mark_completed(self, bucket, key, etag, dest_bucket):
+        with self.lock:
+            self.entries.setdefault((bucket, key, etag), set()).add(dest_bucket)
+
+
+def create_ledger():
+    """
+    Return a DynamoDB-backed ledger if FANOUT_LEDGER_TABLE_NAME is set;
+    otherwise, an in-memory one that only lasts as long as the container
+    """
+    table_name = os.getenv("FANOUT_LEDGER_TABLE_NAME")
+    if table_name:
+        return DynamoDBLedger(table_name)
+
+    logger.warning("FANOUT_LEDGER_TABLE_NAME is not set; using an in-memory ledger")
+    return InMemoryLedger()
@@ -0,0 +1,165 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Non-retryable error codes
+NON_RETRYABLE_ERRORS = {
+    "AccessDenied",
+    "Forbidden",
+    "InvalidAccessKeyId",
+    "SignatureDoesNotMatch",
+    "TokenRefreshRequired",
+    "NoSuchBucket",
+    "NoSuchKey",
+    "ParameterNotFound",
+}
+
+# Time kept in reserve at the end of the invocation for notifications and logging
+SAFETY_MARGIN_SECONDS = float(os.getenv("RETRY_SAFETY_MARGIN_SECONDS", "10"))
+
+# Consecutive failures after which a destination bucket is no longer called
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+# How long a tripped breaker stays open before a single trial call is allowed
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+class Deadline:
+    """Time budget for the invocation, derived from the Lambda context"""
+
+    def __init__(self, context=None, safety_margin=SAFETY_MARGIN_SECONDS):
+        self.expires_at = None
+        if context is not None:
+            remaining = context.get_remaining_time_in_millis() / 1000
+            self.expires_at = time.monotonic() + remaining - safety_margin
+
+    def remaining(self):
+        """Seconds left in the budget (infinite without a Lambda context)"""
+        if self.expires_at is None:
+            return float("inf")
+        return self.expires_at - time.monotonic()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a destination that keeps failing. After the cooldown,
+    a single trial call is let through; its outcome closes or re-opens it.
+    """
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        cooldown=BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if (
+                time.monotonic() - self.opened_at < self.cooldown
+                or self.trial_in_progress
+            ):
+                raise CircuitOpenError(f"Circuit open for {self.name}")
+            logger.info(f"Letting a trial call through to {self.name}")
+            self.trial_in_progress = True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Closing the circuit for {self.name}")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                logger.warning(
+                    f"Opening the circuit for {self.name} after {self.failures} failure(s)",  # noqa: E501
+                )
+                self.opened_at = time.monotonic()
+
+
+# Breakers outlive the invocation, so a broken bucket stays skipped while warm
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def retry_with_backoff(
+    func,
+    deadline=None,
+    breaker=None,
+    max_retries=3,
+    base_delay=0.5,
+    max_delay=8,
+):
+    """
+    Retry function with decorrelated jitter backoff for retryable errors.\n
+    Gives up early if the next delay would run past `deadline`, or if
+    `breaker` is (or becomes) open.
+    """
+    delay = base_delay
+    for attempt in range(max_retries + 1):
+        if breaker:
+            breaker.before_call()
+        try:
+            result = func()
+        except ClientError as e:
+            if breaker:
+                breaker.record_failure()
+
+            error_code = e.response["Error"]["Code"]
+            if error_code in NON_RETRYABLE_ERRORS or attempt == max_retries:
+                logger.error(
+                    f"Non-retryable error or max retries reached: {error_code}",
+                )
+                raise
+
+            # Decorrelated jitter: grows with the previous delay, randomized
+            delay = min(max_delay, random.uniform(base_delay, delay * 3))  # nosec B311
+            if deadline and delay > deadline.remaining():
+                logger.error(
+                    f"Retryable error {error_code}, but no time left to retry",
+                )
+                raise
+
+            logger.warning(
+                f"Retryable error {error_code}, attempt {attempt + 1}/{max_retries + 1}, retrying in {delay:.2f}s",  # noqa: E501
+            )
+            time.sleep(delay)
+        except Exception as e:
+            if breaker:
+                breaker.record_failure()
+            logger.error(f"Unexpected error: {str(e)}")
+            raise
+        else:
+            if breaker:
+                breaker.record_success()
+            return result
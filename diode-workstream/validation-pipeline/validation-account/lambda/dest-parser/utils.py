@@ -1,15 +1,56 @@
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from urllib.parse import urlencode
 
 import boto3  # type: ignore
+from botocore.config import Config  # type: ignore
 from botocore.exceptions import ClientError  # type: ignore
 
 logger = logging.getLogger(__name__)
 
-s3_client = boto3.client("s3")
+# Number of destinations copied to concurrently
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+# Number of parts copied concurrently within a single multipart copy
+MAX_PART_WORKERS = int(os.getenv("MAX_PART_WORKERS", "4"))
+
+# CopyObject is limited to objects up to 5 GiB; larger ones need UploadPartCopy
+MULTIPART_THRESHOLD = 5 * 1024**3
+PART_SIZE = 512 * 1024**2
+MAX_PARTS = 10000
+
+PARAMETER_PREFIX = "/pipeline/destination"
+# GetParameters accepts up to 10 names per call
+MAX_PARAMETERS = 10
+# How long the prefetched mappings are used before being reloaded
+MAPPING_CACHE_TTL = int(os.getenv("MAPPING_CACHE_TTL", "300"))
+
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+# Metadata returned by HeadObject that is carried over to a multipart copy
+COPIED_HEADERS = [
+    "CacheControl",
+    "ContentDisposition",
+    "ContentEncoding",
+    "ContentLanguage",
+    "ContentType",
+    "Expires",
+    "Metadata",
+]
+
+s3_client = boto3.client(
+    "s3",
+    config=Config(max_pool_connections=MAX_WORKERS * MAX_PART_WORKERS),
+)
 ssm_client = boto3.client("ssm")
 sns_client = boto3.client("sns")
 
+# Reused across warm invocations
+_mapping_cache = {"expires_at": 0, "mappings": {}}
+
 
 def get_dest_tag(bucket, key):
     """Get DestinationMappingKey tag from S3 object"""
@@ -31,50 +72,163 @@ def get_dest_tag(bucket, key):
 
 
 def get_key_mappings(destination_map_key):
-    """Get destination bucket mappings from Parameter Store"""
+    """Get destination bucket mappings from Parameter Store (cached)"""
     logger.info(f"Looking up mappings for keys: {destination_map_key}")
 
-    parameter_prefix = "/pipeline/destination"
-    bucket_list = []
+    mappings = resolve_mappings(destination_map_key)
 
+    bucket_list = []
     for key in destination_map_key:
-        try:
-            parameter_name = f"{parameter_prefix}/{key}"
-            logger.debug(f"Getting parameter: {parameter_name}")
+        buckets = mappings[key]
+        logger.info(f"Found {len(buckets)} buckets for key '{key}': {buckets}")
+        bucket_list.extend(buckets)
 
-            response = ssm_client.get_parameter(Name=parameter_name)
-            buckets = response["Parameter"]["Value"].replace(" ", "").split(",")
-            bucket_list.extend([bucket for bucket in buckets if bucket])
-
-            logger.info(f"Found {len(buckets)} buckets for key '{key}': {buckets}")
-
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "ParameterNotFound":
-                logger.error(f"Parameter not found: {parameter_name}")
-                raise ValueError(f"No mapping found for key: {key}")
-            else:
-                logger.error(f"Error getting parameter {parameter_name}: {e}")
-                raise
+    # The same bucket can be listed under more than one mapping key
+    bucket_list = list(dict.fromkeys(bucket_list))
 
     logger.info(f"Total destination buckets found: {len(bucket_list)}")
     return bucket_list
 
 
-def copy_single_file(source_bucket, key, dest_bucket):
-    """Copy a single file using download/upload to ensure completion"""
-    logger.debug(f"Copying {key} from {source_bucket} to {dest_bucket}")
+def resolve_mappings(mapping_keys):
+    """
+    Return {mapping_key: [buckets]} for the mapping keys, served from a cache
+    that lives as long as the warm Lambda container
+    """
+    if time.monotonic() >= _mapping_cache["expires_at"]:
+        prefetch_mappings()
+
+    mappings = _mapping_cache["mappings"]
+    misses = [key for key in dict.fromkeys(mapping_keys) if key not in mappings]
+    if misses:
+        logger.info(f"Mapping cache misses: {misses}")
+        mappings.update(fetch_mappings(misses))
+
+    for key in mapping_keys:
+        if key not in mappings:
+            logger.error(f"Parameter not found: {PARAMETER_PREFIX}/{key}")
+            raise ValueError(f"No mapping found for key: {key}")
+
+    return {key: mappings[key] for key in mapping_keys}
 
-    import tempfile
 
+def prefetch_mappings():
+    """Load all the mappings under the parameter prefix into the cache"""
+    logger.info(f"Prefetching mappings under {PARAMETER_PREFIX}")
+
+    mappings = {}
     try:
-        # Download to temporary file
-        with tempfile.NamedTemporaryFile() as temp_file:
-            s3_client.download_file(source_bucket, key, temp_file.name)
+        paginator = ssm_client.get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(Path=PARAMETER_PREFIX, Recursive=True):
+            for parameter in page["Parameters"]:
+                key = parameter["Name"][len(PARAMETER_PREFIX) + 1 :]  # noqa E203
+                mappings[key] = parse_buckets(parameter["Value"])
+    except ClientError as e:
+        # Misses are still fetched individually, so this is not fatal. The prefetch
+        # is retried sooner, but not on every invocation while SSM is throttling.
+        logger.warning(f"Failed to prefetch mappings: {e}")
+        _mapping_cache["expires_at"] = time.monotonic() + MAPPING_CACHE_TTL / 10
+        return
 
-            # Upload to destination
-            s3_client.upload_file(temp_file.name, dest_bucket, key)
+    logger.info(f"Prefetched {len(mappings)} mappings")
+    _mapping_cache["mappings"] = mappings
+    _mapping_cache["expires_at"] = time.monotonic() + MAPPING_CACHE_TTL
+
+
+def fetch_mappings(mapping_keys):
+    """
+    Fetch the mappings with GetParameters in groups of 10.
+    Mapping keys without a parameter are left out.
+    """
+    mappings = {}
+    for i in range(0, len(mapping_keys), MAX_PARAMETERS):
+        chunk = mapping_keys[i : i + MAX_PARAMETERS]  # noqa E203
+        names = [f"{PARAMETER_PREFIX}/{key}" for key in chunk]
+        logger.debug(f"Getting parameters: {names}")
+
+        response = ssm_client.get_parameters(Names=names)
+        for parameter in response["Parameters"]:
+            key = parameter["Name"][len(PARAMETER_PREFIX) + 1 :]  # noqa E203
+            mappings[key] = parse_buckets(parameter["Value"])
+
+        if response["InvalidParameters"]:
+            logger.warning(f"Invalid parameters: {response['InvalidParameters']}")
+
+    return mappings
+
+
+def parse_buckets(value):
+    """Parse the comma-separated list of buckets in a mapping parameter"""
+    buckets = [bucket for bucket in value.replace(" ", "").split(",") if bucket]
+    return list(dict.fromkeys(buckets))
+
+
+def get_source_object(bucket, key):
+    """Get the details of the source object needed to copy it"""
+    logger.info(f"Getting details for object {key} in bucket {bucket}")
+
+    response = s3_client.head_object(Bucket=bucket, Key=key)
+    source = {
+        "bucket": bucket,
+        "key": key,
+        "etag": response["ETag"],
+        "size": response["ContentLength"],
+        "headers": {
+            header: response[header] for header in COPIED_HEADERS if header in response
+        },
+        "tagging": "",
+    }
+
+    # CopyObject copies the tags itself; a multipart copy needs them up front
+    if source["size"] > MULTIPART_THRESHOLD:
+        tagset = s3_client.get_object_tagging(Bucket=bucket, Key=key)["TagSet"]
+        source["tagging"] = urlencode({tag["Key"]: tag["Value"] for tag in tagset})
+
+    logger.info(f"Source object is {source['size']} bytes (ETag: {source['etag']})")
+    return source
+
+
+def fan_out(dest_buckets, copy_func):
+    """
+    Call copy_func for each destination bucket concurrently and return
+    a result map of {dest_bucket: {"status": ..., "error": ...}}
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(copy_func, dest_bucket): dest_bucket
+            for dest_bucket in dest_buckets
+        }
+        for future in as_completed(futures):
+            dest_bucket = futures[future]
+            try:
+                future.result()
+                results[dest_bucket] = {"status": SUCCEEDED, "error": None}
+            except Exception as e:
+                logger.error(f"Failed to copy to {dest_bucket}: {str(e)}")
+                results[dest_bucket] = {"status": FAILED, "error": str(e)}
+
+    return results
+
+
+def copy_to_destination(source, dest_bucket):
+    """Copy the source object to the destination bucket server-side"""
+    key = source["key"]
+    logger.info(f"Copying {key} from {source['bucket']} to {dest_bucket}")
 
-        logger.debug(f"Successfully copied {key} to {dest_bucket}")
+    try:
+        if source["size"] > MULTIPART_THRESHOLD:
+            multipart_copy(source, dest_bucket)
+        else:
+            s3_client.copy_object(
+                CopySource={"Bucket": source["bucket"], "Key": key},
+                CopySourceIfMatch=source["etag"],
+                Bucket=dest_bucket,
+                Key=key,
+                MetadataDirective="COPY",
+                TaggingDirective="COPY",
+            )
+        logger.info(f"Successfully copied {key} to {dest_bucket}")
 
     except ClientError as e:
         error_code = e.response["Error"]["Code"]
@@ -84,6 +238,64 @@ def copy_single_file(source_bucket, key, dest_bucket):
         raise
 
 
+def multipart_copy(source, dest_bucket):
+    """Copy the source object in parts with UploadPartCopy"""
+    key = source["key"]
+    size = source["size"]
+    # Grow the part size if needed to stay within the maximum number of parts
+    part_size = max(PART_SIZE, -(-size // MAX_PARTS))
+    ranges = [
+        (start, min(start + part_size, size) - 1) for start in range(0, size, part_size)
+    ]
+    logger.info(f"Copying {key} to {dest_bucket} in {len(ranges)} parts")
+
+    params = dict(Bucket=dest_bucket, Key=key, **source["headers"])
+    if source["tagging"]:
+        params["Tagging"] = source["tagging"]
+    upload_id = s3_client.create_multipart_upload(**params)["UploadId"]
+
+    def copy_part(part_number, byte_range):
+        response = s3_client.upload_part_copy(
+            Bucket=dest_bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource={"Bucket": source["bucket"], "Key": key},
+            CopySourceIfMatch=source["etag"],
+            CopySourceRange=f"bytes={byte_range[0]}-{byte_range[1]}",
+        )
+        return {"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]}
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_PART_WORKERS) as executor:
+            parts = list(
+                executor.map(copy_part, range(1, len(ranges) + 1), ranges),
+            )
+
+        s3_client.complete_multipart_upload(
+            Bucket=dest_bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except Exception:
+        # Do not leave the copied parts behind in the destination bucket
+        try:
+            s3_client.abort_multipart_upload(
+                Bucket=dest_bucket,
+                Key=key,
+                UploadId=upload_id,
+            )
+        except ClientError as e:
+            logger.warning(f"Failed to abort the multipart upload: {e}")
+        raise
+
+
+def copy_single_file(source_bucket, key, dest_bucket):
+    """Copy a single file server-side"""
+    copy_to_destination(get_source_object(source_bucket, key), dest_bucket)
+
+
 def delete_source_file(bucket, key):
     """Delete the source file after successful transfer"""
     logger.info(f"Deleting source file {key} from bucket {bucket}")
@@ -96,18 +308,29 @@ def delete_source_file(bucket, key):
         raise
 
 
-def send_failure_notification(bucket, key, failed_buckets, success_count, total_count):
+def send_failure_notification(bucket, key, results):
     """Send SNS notification for transfer failures"""
     topic_arn = os.environ.get("SNS_TOPIC_ARN")
     if not topic_arn:
         logger.error("SNS_TOPIC_ARN environment variable not set")
         return
 
+    failed = {
+        dest_bucket: result["error"]
+        for dest_bucket, result in results.items()
+        if result["status"] != SUCCEEDED
+    }
+    success_count = len(results) - len(failed)
+    failure_details = "\n".join(
+        f"  {dest_bucket}: {error}" for dest_bucket, error in failed.items()
+    )
+
     subject = f"One-to-Many Transfer Failure: {key}"
     message = f"""Transfer failure for file: {key}
 Source bucket: {bucket}
-Successful transfers: {success_count}/{total_count}
-Failed destination buckets: {', '.join(failed_buckets)}
+Successful transfers: {success_count}/{len(results)}
+Failed destination buckets:
+{failure_details}
 
 Please investigate and retry the transfer manually if needed."""
 
@@ -1,6 +1,9 @@
 import json
 import logging
 import os
+import random
+import time
+from urllib.parse import quote_plus
 
 import boto3  # type: ignore
 from botocore.config import Config  # type: ignore
@@ -14,16 +17,177 @@ AV_SCAN_QUEUE_URL = os.environ["AV_SCAN_QUEUE_URL"]
 config = Config(retries={"max_attempts": 5, "mode": "standard"})
 SQS_CLIENT = boto3.client("sqs", config=config)
 
+# SendMessageBatch accepts up to 10 entries per request
+MAX_BATCH_SIZE = 10
+MAX_SEND_ATTEMPTS = 4
+
 
 def lambda_handler(event, context):
+    """
+    Accepts S3 events in any of the following shapes and forwards each S3 record
+    as its own (stripped-down) message to the AV Scan queue:\n
+    - S3 event notification invoking the function directly
+    - SQS batch whose messages are S3 event notifications (buffer queue)
+    - SQS batch whose messages are EventBridge "Object Created" events
+    - EventBridge "Object Created" event invoking the function directly
+    """
     logger.info(f"Event: {json.dumps(event, default=str)}")
-    send_to_sqs(event)
+
+    # (message ID of the originating SQS message or None, stripped S3 record)
+    records = list(get_s3_records(event))
+    logger.info(f"Number of S3 records to forward: {len(records)}")
+
+    failed_message_ids = send_to_sqs(records)
+
+    if is_sqs_event(event):
+        # Only the SQS messages whose records could not be forwarded are retried
+        return {
+            "batchItemFailures": [
+                {"itemIdentifier": message_id} for message_id in failed_message_ids
+            ],
+        }
+
+    if failed_message_ids:
+        # Signal to Lambda to retry the asynchronous invocation
+        raise RuntimeError("Failed to forward one or more S3 records")
+
     logger.info("SUCCESS")
 
 
-def send_to_sqs(event: dict):
-    logger.info("Sending a message to the SQS queue")
-    SQS_CLIENT.send_message(
-        QueueUrl=AV_SCAN_QUEUE_URL,
-        MessageBody=json.dumps(event),
-    )
+def is_sqs_event(event: dict) -> bool:
+    records = event.get("Records") or [{}]
+    return records[0].get("eventSource") == "aws:sqs"
+
+
+def get_s3_records(event: dict):
+    """
+    Yields (message_id, s3_record) for every S3 record found in `event`.\n
+    `message_id` is None unless the record arrived in an SQS message.
+    """
+    if event.get("source") == "aws.s3":
+        yield None, convert_eventbridge_event(event)
+        return
+
+    for record in event.get("Records", []):
+        if record.get("eventSource") != "aws:sqs":
+            yield None, strip_s3_record(record)
+            continue
+
+        message_id = record["messageId"]
+        body: dict = json.loads(record["body"])
+
+        if body.get("source") == "aws.s3":
+            yield message_id, convert_eventbridge_event(body)
+            continue
+
+        # s3:TestEvent is sent when the bucket notification is first configured
+        if body.get("Event") == "s3:TestEvent":
+            logger.info("Skipping s3:TestEvent message")
+            continue
+
+        for s3_record in body.get("Records", []):
+            yield message_id, strip_s3_record(s3_record)
+
+
+def strip_s3_record(record: dict) -> dict:
+    """
+    Returns a copy of the S3 event record with only the fields the AV scan poller uses
+    """
+    s3: dict = record["s3"]
+    return {
+        "eventTime": record["eventTime"],
+        "eventName": record.get("eventName", ""),
+        "userIdentity": {"principalId": record["userIdentity"]["principalId"]},
+        "requestParameters": {
+            "sourceIPAddress": record["requestParameters"]["sourceIPAddress"],
+        },
+        "s3": {
+            "bucket": {"name": s3["bucket"]["name"]},
+            "object": {
+                "key": s3["object"]["key"],
+                "size": s3["object"].get("size", 0),
+                "eTag": s3["object"].get("eTag", ""),
+                "sequencer": s3["object"].get("sequencer", ""),
+            },
+        },
+    }
+
+
+def convert_eventbridge_event(event: dict) -> dict:
+    """
+    Converts an EventBridge "Object Created" event into the stripped S3 event record
+    """
+    detail: dict = event["detail"]
+    return {
+        "eventTime": event["time"],
+        "eventName": detail.get("reason", ""),
+        "userIdentity": {"principalId": detail.get("requester", "")},
+        "requestParameters": {"sourceIPAddress": detail.get("source-ip-address", "")},
+        "s3": {
+            "bucket": {"name": detail["bucket"]["name"]},
+            "object": {
+                # S3 event notifications URL-encode the key; EventBridge does not
+                "key": quote_plus(detail["object"]["key"], safe="/"),
+                "size": detail["object"].get("size", 0),
+                "eTag": detail["object"].get("etag", ""),
+                "sequencer": detail["object"].get("sequencer", ""),
+            },
+        },
+    }
+
+
+def send_to_sqs(records: list[tuple[str | None, dict]]) -> set[str | None]:
+    """
+    Sends the records to the AV Scan queue in batches of 10, one record per message.\n
+    Returns the message IDs of the records that could not be sent.
+    """
+    failed_message_ids = set()
+    for i in range(0, len(records), MAX_BATCH_SIZE):
+        chunk = records[i : i + MAX_BATCH_SIZE]  # noqa E203
+        entries = {
+            str(index): (message_id, json.dumps({"Records": [s3_record]}))
+            for index, (message_id, s3_record) in enumerate(chunk)
+        }
+        failed_entry_ids = send_message_batch(entries)
+        failed_message_ids.update(entries[entry_id][0] for entry_id in failed_entry_ids)
+    return failed_message_ids
+
+
+def send_message_batch(entries: dict[str, tuple[str | None, str]]) -> list[str]:
+    """
+    Sends a single batch, retrying only the entries that failed due to a
+    service-side error. Returns the IDs of the entries that could not be sent.
+    """
+    pending = dict(entries)
+    failed_ids: list[str] = []
+    for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+        logger.info(
+            f"Sending {len(pending)} message(s) to the SQS queue (attempt {attempt})",
+        )
+        response = SQS_CLIENT.send_message_batch(
+            QueueUrl=AV_SCAN_QUEUE_URL,
+            Entries=[
+                {"Id": entry_id, "MessageBody": body}
+                for entry_id, (_, body) in pending.items()
+            ],
+        )
+        failed: list[dict] = response.get("Failed", [])
+        if not failed:
+            return failed_ids
+
+        for entry in failed:
+            logger.warning(f"Failed to send entry {entry['Id']}: {entry}")
+
+        # Sender faults (e.g. a malformed message) will not succeed on retry
+        failed_ids.extend(entry["Id"] for entry in failed if entry["SenderFault"])
+        retryable_ids = {entry["Id"] for entry in failed if not entry["SenderFault"]}
+        pending = {k: v for k, v in pending.items() if k in retryable_ids}
+        if not pending:
+            return failed_ids
+
+        if attempt < MAX_SEND_ATTEMPTS:
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))  # nosec B311
+
+    logger.error(f"Exhausted retries for entries: {list(pending)}")
+    return failed_ids + list(pending)
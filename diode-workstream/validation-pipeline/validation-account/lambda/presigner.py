@@ -1,8 +1,12 @@
+import base64
+import binascii
 import json
 import logging
+import os
 
 import boto3  # type: ignore
 from botocore.config import Config  # type: ignore
+from botocore.exceptions import ClientError  # type: ignore
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -13,13 +17,64 @@ config = Config(
 )
 S3_CLIENT = boto3.client("s3", config=config)
 
+# The ingestion buckets deny requests whose signature is more than 5 minutes old
+PART_URL_EXPIRATION = 300
+DEFAULT_PART_COUNT = 10
+MAX_PART_COUNT = 100
+MAX_PART_NUMBER = 10000
+# Whether uploads must carry a SHA-256 checksum, which S3 verifies
+REQUIRE_CHECKSUM = os.getenv("REQUIRE_CHECKSUM", "false").lower() == "true"
+
+# Presigned POSTs per request, with batch=true and repeated key parameters
+MAX_BATCH_SIZE = 50
+
 
 def lambda_handler(event, context):
     logger.info(f"Event: {json.dumps(event, default=str)}")
 
-    bucket = event["queryStringParameters"]["bucket"]
-    key = event["queryStringParameters"]["key"]
-    kms_key_id = event["queryStringParameters"]["kms_key_id"]
+    params = event.get("queryStringParameters") or {}
+    # Repeated parameters: key (batch) and checksum_sha256 (batch and parts)
+    multi_params = event.get("multiValueQueryStringParameters") or {}
+    checksums = multi_params.get("checksum_sha256") or []
+    # Set for the multipart endpoints: /upload/multipart/{action}
+    action = (event.get("pathParameters") or {}).get("action")
+
+    try:
+        if action is None and params.get("batch") == "true":
+            body = create_presigned_posts(
+                params,
+                multi_params.get("key") or [],
+                checksums,
+            )
+        elif action is None:
+            body = create_presigned_post(params)
+        elif action == "parts":
+            body = presign_parts(params, checksums)
+        elif action in MULTIPART_ACTIONS:
+            body = MULTIPART_ACTIONS[action](params)
+        else:
+            return create_response(404, {"message": f"Unknown action: {action}"})
+    except KeyError as e:
+        return create_response(400, {"message": f"Missing parameter: {e}"})
+    except ValueError as e:
+        return create_response(400, {"message": str(e)})
+    except ClientError as e:
+        logger.exception(f"Failed to {action or 'presign'} {params.get('key')}")
+        return create_response(
+            e.response["ResponseMetadata"]["HTTPStatusCode"],
+            {
+                "code": e.response["Error"]["Code"],
+                "message": e.response["Error"]["Message"],
+            },
+        )
+
+    return create_response(200, body)
+
+
+def create_presigned_post(params: dict) -> dict:
+    bucket = params["bucket"]
+    key = params["key"]
+    kms_key_id = params["kms_key_id"]
 
     logger.info(f"Bucket: {bucket}")
     logger.info(f"Key: {key}")
@@ -29,21 +84,203 @@ def lambda_handler(event, context):
         "x-amz-server-side-encryption": "aws:kms",
         "x-amz-server-side-encryption-aws-kms-key-id": kms_key_id,
     }
+    # S3 rejects the upload if the content does not match the checksum
+    checksum = params.get("checksum_sha256")
+    if checksum:
+        fields["x-amz-checksum-algorithm"] = "SHA256"
+        fields["x-amz-checksum-sha256"] = validate_checksum(checksum)
+    elif REQUIRE_CHECKSUM:
+        raise ValueError("checksum_sha256 is required")
 
-    params = dict(
+    return S3_CLIENT.generate_presigned_post(
         Bucket=bucket,
         Key=key,
         Fields=fields,
         Conditions=[{k: v} for k, v in fields.items()],
     )
-    response = S3_CLIENT.generate_presigned_post(**params)
 
-    logger.info(f"Response Body: {response}")
 
-    response = {
-        "statusCode": 200,
-        "body": json.dumps(response),
+def create_presigned_posts(params: dict, keys: list[str], checksums: list[str]) -> dict:
+    """
+    Returns a presigned POST for each key, in the same order.\n
+    `checksums`, if any, are the SHA-256 checksums of the files, in the same order.
+    """
+    if not 1 <= len(keys) <= MAX_BATCH_SIZE:
+        raise ValueError(f"Specify between 1 and {MAX_BATCH_SIZE} keys")
+    if checksums and len(checksums) != len(keys):
+        raise ValueError("Specify a checksum_sha256 for each key")
+
+    posts = []
+    for i, key in enumerate(keys):
+        post_params = params | {"key": key}
+        if checksums:
+            post_params["checksum_sha256"] = checksums[i]
+        posts.append(create_presigned_post(post_params))
+    return {"posts": posts}
+
+
+def create_multipart_upload(params: dict) -> dict:
+    """
+    Starts a multipart upload, encrypted with the KMS key.\n
+    The parts inherit the encryption of the upload. With checksum_algorithm=SHA256,
+    each part must carry its SHA-256 checksum.
+    """
+    kwargs = {}
+    if params.get("checksum_algorithm", "").upper() == "SHA256":
+        kwargs["ChecksumAlgorithm"] = "SHA256"
+    elif REQUIRE_CHECKSUM:
+        raise ValueError("checksum_algorithm=SHA256 is required")
+
+    response = S3_CLIENT.create_multipart_upload(
+        Bucket=params["bucket"],
+        Key=params["key"],
+        ServerSideEncryption="aws:kms",
+        SSEKMSKeyId=params["kms_key_id"],
+        **kwargs,
+    )
+    logger.info(f"Created multipart upload {response['UploadId']} for {params['key']}")
+    return {
+        "bucket": response["Bucket"],
+        "key": response["Key"],
+        "uploadId": response["UploadId"],
+    }
+
+
+def presign_parts(params: dict, checksums: list[str]) -> dict:
+    """
+    Returns presigned UploadPart URLs for `count` parts from `part_number`.\n
+    The URLs expire after 5 minutes, so clients request them in batches as
+    they upload. `checksums`, if any, are the SHA-256 checksums of the parts,
+    which are signed into the URLs: the headers returned with each URL must be
+    sent with the part.
+    """
+    first_part = int(params.get("part_number", 1))
+    count = int(params.get("count", DEFAULT_PART_COUNT))
+    if not 1 <= count <= MAX_PART_COUNT:
+        raise ValueError(f"count must be between 1 and {MAX_PART_COUNT}")
+    last_part = min(first_part + count - 1, MAX_PART_NUMBER)
+    if not 1 <= first_part <= last_part:
+        raise ValueError(f"part_number must be between 1 and {MAX_PART_NUMBER}")
+    if checksums and len(checksums) != last_part - first_part + 1:
+        raise ValueError("Specify a checksum_sha256 for each part")
+
+    parts = []
+    for i, part_number in enumerate(range(first_part, last_part + 1)):
+        part_params = {
+            "Bucket": params["bucket"],
+            "Key": params["key"],
+            "UploadId": params["upload_id"],
+            "PartNumber": part_number,
+        }
+        headers = {}
+        if checksums:
+            part_params["ChecksumSHA256"] = validate_checksum(checksums[i])
+            headers["x-amz-checksum-sha256"] = checksums[i]
+        url = S3_CLIENT.generate_presigned_url(
+            "upload_part",
+            Params=part_params,
+            ExpiresIn=PART_URL_EXPIRATION,
+        )
+        parts.append({"partNumber": part_number, "url": url, "headers": headers})
+    return {"parts": parts, "expiresIn": PART_URL_EXPIRATION}
+
+
+def list_parts(params: dict) -> dict:
+    """
+    Returns the parts uploaded so far, for a client to resume the upload
+    """
+    return {"parts": get_uploaded_parts(params)}
+
+
+def complete_multipart_upload(params: dict) -> dict:
+    """
+    Completes the upload with the parts that S3 has, after checking that
+    `parts` parts, numbered from 1, were uploaded
+    """
+    expected = int(params["parts"])
+    parts = get_uploaded_parts(params)
+    part_numbers = [part["partNumber"] for part in parts]
+    if part_numbers != list(range(1, expected + 1)):
+        missing = sorted({*range(1, expected + 1)} - {*part_numbers})
+        raise ValueError(f"Expected {expected} part(s), missing: {missing[:20]}")
+
+    completed_parts = []
+    for part in parts:
+        completed_part = {"PartNumber": part["partNumber"], "ETag": part["eTag"]}
+        # Set if the upload was created with checksum_algorithm=SHA256
+        if part["checksumSha256"]:
+            completed_part["ChecksumSHA256"] = part["checksumSha256"]
+        completed_parts.append(completed_part)
+
+    response = S3_CLIENT.complete_multipart_upload(
+        Bucket=params["bucket"],
+        Key=params["key"],
+        UploadId=params["upload_id"],
+        MultipartUpload={"Parts": completed_parts},
+    )
+    logger.info(f"Completed multipart upload {params['upload_id']} of {params['key']}")
+    return {
+        "bucket": response["Bucket"],
+        "key": response["Key"],
+        "eTag": response["ETag"],
+    }
+
+
+def abort_multipart_upload(params: dict) -> dict:
+    S3_CLIENT.abort_multipart_upload(
+        Bucket=params["bucket"],
+        Key=params["key"],
+        UploadId=params["upload_id"],
+    )
+    logger.info(f"Aborted multipart upload {params['upload_id']} of {params['key']}")
+    return {"aborted": True}
+
+
+def get_uploaded_parts(params: dict) -> list[dict]:
+    parts = []
+    paginator = S3_CLIENT.get_paginator("list_parts")
+    for page in paginator.paginate(
+        Bucket=params["bucket"],
+        Key=params["key"],
+        UploadId=params["upload_id"],
+    ):
+        for part in page.get("Parts", []):
+            parts.append(
+                {
+                    "partNumber": part["PartNumber"],
+                    "eTag": part["ETag"],
+                    "size": part["Size"],
+                    "checksumSha256": part.get("ChecksumSHA256"),
+                },
+            )
+    return parts
+
+
+def validate_checksum(checksum: str) -> str:
+    """
+    Returns the checksum if it is a base64-encoded SHA-256 digest
+    """
+    try:
+        digest = base64.b64decode(checksum, validate=True)
+    except binascii.Error:
+        digest = b""
+    if len(digest) != 32:
+        raise ValueError("checksum_sha256 must be a base64-encoded SHA-256 digest")
+    return checksum
+
+
+def create_response(status_code: int, body: dict) -> dict:
+    logger.info(f"Response Body: {body}")
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(body),
         "isBase64Encoded": False,
     }
 
-    return response
+
+MULTIPART_ACTIONS = {
+    "create": create_multipart_upload,
+    "list": list_parts,
+    "complete": complete_multipart_upload,
+    "abort": abort_multipart_upload,
+}
@@ -1,50 +1,125 @@
 import json
 import logging
 import os
-import zoneinfo
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from datetime import datetime
+from datetime import timezone
 
 import boto3  # type: ignore
 from botocore.config import Config  # type: ignore
 from botocore.exceptions import ClientError  # type: ignore
 
-QUEUE_URL = os.environ["QUEUE_URL"]
-
 DATA_TRANSFER_BUCKET = os.environ["DATA_TRANSFER_BUCKET"]
 FAILED_TRANSFER_BUCKET = os.environ["FAILED_TRANSFER_BUCKET"]
 
 DDB_TABLE_NAME = os.environ["DYNAMODB_TABLE_NAME"]
 FAILED_TRANSFER_TOPIC_ARN = os.environ["FAILED_TRANSFER_TOPIC_ARN"]
 ACCOUNT_ID = os.environ["ACCOUNT_ID"]
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "10"))
 
 SUCCEEDED = "SUCCEEDED"
 DATA_TAG_KEY = "DataOwner / DataSteward / GovPOC / KeyOwner"
 UNKNOWNS = ["Unknown"] * 4
+# Keys of the data tags in the pipeline envelope
+DATA_TAG_NAMES = ["dataOwner", "dataSteward", "govPoc", "keyOwner"]
+
+# BatchWriteItem accepts up to 25 put requests per call
+MAX_BATCH_WRITE_SIZE = 25
+MAX_BATCH_WRITE_ATTEMPTS = 5
 
-config = Config(retries={"max_attempts": 5, "mode": "standard"})
+config = Config(
+    retries={"max_attempts": 5, "mode": "standard"},
+    max_pool_connections=MAX_WORKERS,
+)
 DDB_CLIENT = boto3.client("dynamodb", config=config)
 S3_CLIENT = boto3.client("s3", config=config)
 SNS_CLIENT = boto3.client("sns", config=config)
-SQS_CLIENT = boto3.client("sqs", config=config)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+# NOTE: Messages not reported in `batchItemFailures` are deleted from the queue
+# by Lambda
 def lambda_handler(event, context):
     logger.info(f"Event: {json.dumps(event, default=str)}")
 
-    message = event["Records"][0]
+    messages: list[dict] = event["Records"]
+    logger.info(f"Processing {len(messages)} message(s)")
+
+    # Step 1: Build the DynamoDB items, looking up the data tags concurrently
+    items, failed_message_ids = run_concurrently(build_ddb_item, messages)
+    # Objects that no longer exist have nothing to record
+    items = {message_id: item for message_id, item in items.items() if item}
+
+    # Step 2: Record the transfer results in batches
+    failed_message_ids |= put_items_in_ddb(items)
+
+    # Step 3: Handle failed transfers and clean up the transfer bucket concurrently
+    recorded = [
+        message
+        for message in messages
+        if message["messageId"] in items
+        and message["messageId"] not in failed_message_ids
+    ]
+    _, cleanup_failed_message_ids = run_concurrently(finalize_transfer, recorded)
+    failed_message_ids |= cleanup_failed_message_ids
+
+    processed_count = len(messages) - len(failed_message_ids)
+    logger.info(f"Processed {processed_count}/{len(messages)} message(s)")
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in failed_message_ids
+        ],
+    }
+
+
+def run_concurrently(func, messages: list[dict]) -> tuple[dict[str, object], set[str]]:
+    """
+    Calls `func` on each message on a thread pool.\n
+    Returns the results keyed by message ID and the IDs of the messages that failed.
+    """
+    results: dict[str, object] = {}
+    failed_message_ids: set[str] = set()
+    if not messages:
+        return results, failed_message_ids
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(func, message): message["messageId"] for message in messages
+        }
+        for future in as_completed(futures):
+            message_id = futures[future]
+            try:
+                results[message_id] = future.result()
+            except Exception:
+                logger.exception(f"Failed to process message {message_id}")
+                failed_message_ids.add(message_id)
+
+    return results, failed_message_ids
+
+
+def build_ddb_item(message: dict) -> dict | None:
+    """
+    Returns the DynamoDB item for the transfer result in `message`, or None
+    if the object no longer exists in the transfer bucket.\n
+    The object tags are only looked up if the message has no pipeline envelope.
+    """
     # SentTimestamp is in the epoch time in milliseconds
     timestamp = int(message["attributes"]["SentTimestamp"]) / 1000
-    receipt_handle = message["receiptHandle"]
     data = json.loads(message["body"])
-    # bucket = data["bucket"]
     key = data["key"]
-    status = data["status"]
+
+    # The pipeline envelope carries the data tags set by the validation poller
+    envelope: dict | None = data.get("envelope")
+    if envelope:
+        data_tag_values = [envelope["dataTags"][name] for name in DATA_TAG_NAMES]
+        return create_ddb_item(timestamp, data, *data_tag_values)
 
     try:
-        # TODO: Get the tags passed from the message
         data_tag_values = get_data_tag_values(key)
     except ClientError as e:
         error_code = e.response["Error"]["Code"]
@@ -53,13 +128,17 @@ def lambda_handler(event, context):
             error_code == "MethodNotAllowed" and not object_exists(key)
         ):
             logger.warning(f"{key} not found")
-            delete_sqs_message(receipt_handle)
-            return
+            return None
         raise
 
-    put_item_in_ddb(timestamp, data, *data_tag_values)
+    return create_ddb_item(timestamp, data, *data_tag_values)
+
 
-    if status != SUCCEEDED:
+def finalize_transfer(message: dict):
+    data = json.loads(message["body"])
+    key = data["key"]
+
+    if data["status"] != SUCCEEDED:
         logger.warning(f"Data transfer failed for {key}")
         copy_object_to_failed_transfer_bucket(key)
         send_sns_notification_on_failed_transfer(key)
@@ -67,8 +146,6 @@ def lambda_handler(event, context):
     # Delete it from the transfer bucket whether the transfer was successful or not
     delete_object_from_transfer_bucket(key)
 
-    delete_sqs_message(receipt_handle)
-
 
 def copy_object_to_failed_transfer_bucket(key: str):
     logger.info(
@@ -168,41 +245,108 @@ def object_exists(key: str) -> bool:
         raise
 
 
-def delete_sqs_message(receipt_handle: str):
-    logger.info("Deleting message from the queue")
-    SQS_CLIENT.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
-
-
-def put_item_in_ddb(
+def create_ddb_item(
     timestamp: float,
     data: dict,
     data_owner: str,
     data_steward: str,
     gov_poc: str,
     key_owner: str,
-):
-    s3_key = data["key"]
-    logger.info(f"Adding an entry into DynamoDB on the transfer status of {s3_key}")
-    DDB_CLIENT.put_item(
-        TableName=DDB_TABLE_NAME,
-        Item={
-            "s3Key": {"S": s3_key},  # partition key
-            "timestamp": {
-                "S": str(
-                    datetime.fromtimestamp(
-                        timestamp,
-                        zoneinfo.ZoneInfo("America/New_York"),  # sort key
-                    ),
-                ),
-            },
-            "mappingId": {"S": data["mappingId"]},
-            "status": {"S": data["status"]},
-            "transferId": {"S": data["transferId"]},
-            "error": {"S": data["error"]},
-            "dataOwner": {"S": data_owner},
-            "dataSteward": {"S": data_steward},
-            "govPoc": {"S": gov_poc},
-            "keyOwner": {"S": key_owner},
-        },
+) -> dict:
+    return {
+        "s3Key": {"S": data["key"]},  # partition key
+        "timestamp": {"S": to_iso_utc(timestamp)},  # sort key
+        "mappingId": {"S": data["mappingId"]},
+        "status": {"S": data["status"]},
+        "transferId": {"S": data["transferId"]},
+        "error": {"S": data["error"]},
+        "dataOwner": {"S": data_owner},
+        "dataSteward": {"S": data_steward},
+        "govPoc": {"S": gov_poc},
+        "keyOwner": {"S": key_owner},
+    }
+
+
+def to_iso_utc(timestamp: float) -> str:
+    """
+    Returns the epoch time as an ISO 8601 UTC string with milliseconds,
+    e.g. 2024-01-31T17:05:09.123Z, which sorts chronologically as a string
+    """
+    return (
+        datetime.fromtimestamp(timestamp, timezone.utc)
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
     )
-    logger.info("Successfully added the entry")
+
+
+def put_items_in_ddb(items: dict[str, dict]) -> set[str]:
+    """
+    Writes the items (keyed by message ID) with BatchWriteItem, retrying any
+    unprocessed items.\n
+    Returns the IDs of the messages whose items could not be written.
+    """
+    # A batch cannot contain two requests for the same primary key
+    message_ids_by_key: dict[tuple[str, str], list[str]] = {}
+    unique_items: dict[tuple[str, str], dict] = {}
+    for message_id, item in items.items():
+        item_key = (item["s3Key"]["S"], item["timestamp"]["S"])
+        message_ids_by_key.setdefault(item_key, []).append(message_id)
+        unique_items[item_key] = item
+
+    logger.info(f"Adding {len(unique_items)} entries into DynamoDB")
+
+    failed_message_ids: set[str] = set()
+    item_keys = [*unique_items]
+    for i in range(0, len(item_keys), MAX_BATCH_WRITE_SIZE):
+        chunk = {
+            item_key: unique_items[item_key]
+            for item_key in item_keys[i : i + MAX_BATCH_WRITE_SIZE]  # noqa E203
+        }
+        try:
+            unprocessed_keys = batch_write_items(chunk)
+        except ClientError:
+            logger.exception("Failed to add the entries")
+            unprocessed_keys = [*chunk]
+
+        for item_key in unprocessed_keys:
+            failed_message_ids.update(message_ids_by_key[item_key])
+
+    logger.info(
+        f"Successfully added {len(items) - len(failed_message_ids)}/{len(items)} entries",  # noqa: E501
+    )
+    return failed_message_ids
+
+
+def batch_write_items(items: dict[tuple[str, str], dict]) -> list[tuple[str, str]]:
+    """
+    Writes up to 25 items, retrying unprocessed items with backoff.\n
+    Returns the keys of the items that remained unprocessed.
+    """
+    pending = dict(items)
+    for attempt in range(1, MAX_BATCH_WRITE_ATTEMPTS + 1):
+        response = DDB_CLIENT.batch_write_item(
+            RequestItems={
+                DDB_TABLE_NAME: [
+                    {"PutRequest": {"Item": item}} for item in pending.values()
+                ],
+            },
+        )
+        unprocessed: list[dict] = response.get("UnprocessedItems", {}).get(
+            DDB_TABLE_NAME,
+            [],
+        )
+        if not unprocessed:
+            return []
+
+        unprocessed_keys = {
+            (item["s3Key"]["S"], item["timestamp"]["S"])
+            for item in (request["PutRequest"]["Item"] for request in unprocessed)
+        }
+        pending = {k: v for k, v in pending.items() if k in unprocessed_keys}
+        logger.warning(f"{len(pending)} unprocessed item(s) on attempt {attempt}")
+
+        if attempt < MAX_BATCH_WRITE_ATTEMPTS:
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, 0.05 * 2**attempt))  # nosec B311
+
+    return [*pending]
@@ -0,0 +1,332 @@
+###################################################################################
+#
+# Queries the transfer status DynamoDB table (the `TransferStatusTableName` output
+# of the pipeline stack) through its global secondary indexes, or exports the
+# whole table with a parallel scan. Results are written as JSON lines.
+#
+# 1. Pre-requisites
+#
+# a. Python 3.11 (or higher)
+#
+# b. boto3 library
+#
+# For example:
+# Linux: python3.11 -m pip install boto3
+# Windows: py -3.11 -m pip install boto3
+#
+# 2. Set the AWS credentials and region as environment variables (or use a profile)
+#
+# 3. Run the following command for help
+#
+# For example:
+# Linux: python3.11 <name_of_script> -h
+# Windows: py -3.11 <name_of_script> -h
+#
+# Examples:
+# What did mapping X transfer in the last day?
+#   <name_of_script> --table <table> query --by mappingId --value X --since 1d
+# All failures for data owner Y in January
+#   <name_of_script> --table <table> query --by dataOwner --value Y \
+#     --status FAILED --since 2024-01-01 --until 2024-02-01
+# Export the table with 8 parallel scan segments
+#   <name_of_script> --table <table> --output export.jsonl export --segments 8
+#
+###################################################################################
+import argparse
+import json
+import queue
+import re
+import sys
+import threading
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import boto3  # type: ignore
+from boto3.dynamodb.types import TypeDeserializer  # type: ignore
+from botocore.config import Config  # type: ignore
+
+# Index for each attribute that can be queried; all are sorted by `timestamp`
+INDEXES = {
+    "mappingId": "mappingId-timestamp-index",
+    "status": "status-timestamp-index",
+    "dataOwner": "dataOwner-timestamp-index",
+}
+
+# Bounds for the ISO 8601 UTC timestamps when only one end of the range is given
+MIN_TIMESTAMP = "0000-01-01T00:00:00.000Z"
+MAX_TIMESTAMP = "9999-12-31T23:59:59.999Z"
+
+RELATIVE_TIME_PATTERN = re.compile(r"^(\d+)([mhd])$")
+RELATIVE_TIME_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+DESERIALIZER = TypeDeserializer()
+
+
+def to_iso_utc(value: datetime) -> str:
+    """
+    Returns the datetime in the format of the `timestamp` attribute,
+    e.g. 2024-01-31T17:05:09.123Z. A naive datetime is treated as UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (
+        value.astimezone(timezone.utc)
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def parse_time(value: str, now: datetime | None = None) -> str:
+    """
+    Parses an ISO 8601 date/datetime (e.g. 2024-01-31, 2024-01-31T12:00-05:00)
+    or a time relative to now (e.g. 30m, 12h, 7d) into an ISO 8601 UTC timestamp
+    """
+    match = RELATIVE_TIME_PATTERN.match(value)
+    if match:
+        now = now or datetime.now(timezone.utc)
+        delta = timedelta(**{RELATIVE_TIME_UNITS[match[2]]: int(match[1])})
+        return to_iso_utc(now - delta)
+    return to_iso_utc(datetime.fromisoformat(value))
+
+
+def deserialize(item: dict) -> dict:
+    return {key: DESERIALIZER.deserialize(value) for key, value in item.items()}
+
+
+def query_transfers(
+    client,
+    table_name: str,
+    attribute: str,
+    value: str,
+    start: str | None = None,
+    end: str | None = None,
+    status: str | None = None,
+    newest_first=False,
+    page_size: int | None = None,
+):
+    """
+    Yields the transfer results whose `attribute` equals `value`, ordered by
+    `timestamp`, through the attribute's index.\n
+    `start` and `end` are inclusive ISO 8601 UTC timestamps.
+    `status` filters the results of the index query (e.g. by data owner and status).
+    It cannot be combined with queries by status, as DynamoDB does not filter on
+    the partition key of the index.
+    """
+    if status and attribute == "status":
+        raise ValueError("Specify the status with `value` when querying by status")
+
+    key_condition = "#pk = :pk"
+    names = {"#pk": attribute}
+    values = {":pk": {"S": value}}
+    if start or end:
+        key_condition += " AND #ts BETWEEN :start AND :end"
+        names["#ts"] = "timestamp"
+        values[":start"] = {"S": start or MIN_TIMESTAMP}
+        values[":end"] = {"S": end or MAX_TIMESTAMP}
+
+    if status:
+        names["#status"] = "status"
+        values[":status"] = {"S": status}
+
+    params = dict(
+        TableName=table_name,
+        IndexName=INDEXES[attribute],
+        KeyConditionExpression=key_condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ScanIndexForward=not newest_first,
+    )
+    if status:
+        params["FilterExpression"] = "#status = :status"
+    if page_size:
+        params["PaginationConfig"] = {"PageSize": page_size}
+
+    paginator = client.get_paginator("query")
+    for page in paginator.paginate(**params):
+        for item in page["Items"]:
+            yield deserialize(item)
+
+
+def scan_transfers(
+    client,
+    table_name: str,
+    total_segments=4,
+    page_size: int | None = None,
+):
+    """
+    Yields all the transfer results, scanning `total_segments` segments of the
+    table in parallel. Items are yielded as pages arrive, in no particular order.
+    """
+    pages: queue.Queue = queue.Queue(maxsize=total_segments * 2)
+    done = object()
+
+    def scan_segment(segment: int):
+        try:
+            params = dict(
+                TableName=table_name,
+                Segment=segment,
+                TotalSegments=total_segments,
+            )
+            if page_size:
+                params["PaginationConfig"] = {"PageSize": page_size}
+            for page in client.get_paginator("scan").paginate(**params):
+                pages.put(page["Items"])
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(done)
+
+    threads = [
+        threading.Thread(target=scan_segment, args=(segment,), daemon=True)
+        for segment in range(total_segments)
+    ]
+    for thread in threads:
+        thread.start()
+
+    remaining = total_segments
+    while remaining:
+        page = pages.get()
+        if page is done:
+            remaining -= 1
+        elif isinstance(page, Exception):
+            raise page
+        else:
+            for item in page:
+                yield deserialize(item)
+
+
+def create_client(region: str | None, endpoint_url: str | None, max_connections=10):
+    config = Config(
+        retries={"max_attempts": 5, "mode": "standard"},
+        max_pool_connections=max_connections,
+    )
+    return boto3.client(
+        "dynamodb",
+        config=config,
+        region_name=region,
+        endpoint_url=endpoint_url,
+    )
+
+
+def write_items(items, output) -> int:
+    count = 0
+    for item in items:
+        output.write(json.dumps(item, default=str) + "\n")
+        count += 1
+    return count
+
+
+def main(args):
+    segments = getattr(args, "segments", 1)
+    client = create_client(args.region, args.endpoint_url, max(10, segments))
+
+    if args.command == "query":
+        items = query_transfers(
+            client,
+            args.table,
+            args.by,
+            args.value,
+            start=parse_time(args.since) if args.since else None,
+            end=parse_time(args.until) if args.until else None,
+            status=args.status,
+            newest_first=args.newest_first,
+        )
+    else:
+        items = scan_transfers(client, args.table, total_segments=segments)
+
+    if args.output == "-":
+        count = write_items(items, sys.stdout)
+    else:
+        with open(args.output, "w") as output:
+            count = write_items(items, output)
+
+    print(f"{count} item(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Queries or exports the transfer status DynamoDB table as JSON lines",  # noqa: E501
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--table",
+        required=True,
+        type=str,
+        help="Specify the name of the transfer status table",
+    )
+    parser.add_argument(
+        "--region",
+        type=str,
+        default=None,
+        help="(Optional) Specify the AWS region. Defaults to the configured region",
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        type=str,
+        default=None,
+        help="(Optional) Specify the DynamoDB endpoint, e.g. for DynamoDB Local",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="-",
+        help="(Optional) Specify the file to write to. Defaults to stdout",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser(
+        "query",
+        help="Query the transfer results by mapping ID, status or data owner",
+    )
+    query_parser.add_argument(
+        "--by",
+        required=True,
+        choices=[*INDEXES],
+        help="Specify the attribute to query by",
+    )
+    query_parser.add_argument(
+        "--value",
+        required=True,
+        type=str,
+        help="Specify the value of the attribute",
+    )
+    query_parser.add_argument(
+        "--since",
+        type=str,
+        default=None,
+        help="(Optional) Specify the start time: ISO 8601 (e.g. 2024-01-31) or relative (e.g. 12h, 7d)",  # noqa: E501
+    )
+    query_parser.add_argument(
+        "--until",
+        type=str,
+        default=None,
+        help="(Optional) Specify the end time: ISO 8601 (e.g. 2024-02-01) or relative (e.g. 1h)",  # noqa: E501
+    )
+    query_parser.add_argument(
+        "--status",
+        type=str,
+        default=None,
+        help="(Optional) Specify the status to filter the results by, e.g. FAILED. Not with --by status",  # noqa: E501
+    )
+    query_parser.add_argument(
+        "--newest-first",
+        action="store_true",
+        help="(Optional) Return the newest results first",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Export the whole table with a parallel scan",
+    )
+    export_parser.add_argument(
+        "--segments",
+        type=int,
+        default=4,
+        help="(Optional) Specify the number of segments scanned in parallel. Defaults to 4",  # noqa: E501
+    )
+
+    args = parser.parse_args()
+    if args.command == "query" and args.by == "status" and args.status:
+        parser.error("--status cannot be combined with --by status, use --value")
+    main(args)
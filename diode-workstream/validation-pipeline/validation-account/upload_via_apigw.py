@@ -27,17 +27,45 @@
 # Linux: python3.11 <name_of_script> -h
 # Windows: py -3.11 <name_of_script> -h
 #
+# Examples:
+# Upload a file
+#   <name_of_script> --bucket <bucket> --kms-key-id <key-id> --filepath report.pdf
+# Upload a directory, keeping its structure under the prefix, with 8 workers
+#   <name_of_script> --bucket <bucket> --kms-key-id <key-id> --filepath outbox \
+#     --prefix 2024/06 --workers 8
+# Upload the files matching a pattern (quoted, so that the shell does not expand it)
+#   <name_of_script> --bucket <bucket> --kms-key-id <key-id> \
+#     --filepath "outbox/**/*.csv"
+#
+# Uploaded files are recorded in a journal (--journal), so that an interrupted run
+# can be started again and skips the files that were already uploaded. Files above
+# --multipart-threshold are uploaded in parts, and resume from their last part.
+# The SHA-256 checksum of each file (or part) is sent with it, and S3 rejects the
+# upload if the content it receives does not match.
+#
 ###################################################################################
 import argparse
+import base64
+import glob
+import hashlib
+import json
+import math
 import os
+import random
+import secrets
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from dataclasses import dataclass
 from pathlib import Path
 
 import boto3  # type: ignore
 import requests  # type: ignore
 from botocore.auth import SigV4Auth  # type: ignore
 from botocore.awsrequest import AWSRequest  # type: ignore
-
+from requests.adapters import HTTPAdapter  # type: ignore
 
 ###################################################################################
 # -----------------     Set these environment variables     -----------------
@@ -56,24 +84,571 @@ INVOKE_URL = os.getenv("INVOKE_URL")
 
 ###################################################################################
 
+MiB = 1024 * 1024
+# S3 limits for multipart uploads
+MIN_PART_SIZE = 5 * MiB
+MAX_PARTS = 10000
+# The presigner returns at most this many presigned POSTs or part URLs per request
+MAX_PRESIGN_BATCH = 50
+MAX_PART_URL_BATCH = 100
 
-def main(
-    bucket_name: str,
-    key_name: str,
-    kms_key_id: str,
-    prefix: str,
-    filepath: str,
-    credentials,
-):
-    method = "POST"
-    service = "execute-api"
+# Files are streamed in chunks of this size, rather than read into memory
+CHUNK_SIZE = 1 * MiB
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Expired presigned URLs are rejected with 403, and are presigned again on retry.
+# The presigner API fails fast on 403, which is an authentication failure.
+PRESIGNED_URL_RETRYABLE_STATUS_CODES = RETRYABLE_STATUS_CODES | {403}
+MAX_BACKOFF = 20
+
+
+@dataclass
+class FileToUpload:
+    path: str
+    key: str
+    size: int
+    mtime_ns: int
+    # Base64-encoded SHA-256 digest, which S3 verifies on upload
+    sha256: str | None = None
+
+
+class FileChunks:
+    """
+    Iterates over `length` bytes of a file from `offset`, one chunk at a time.\n
+    Has a length, so that requests sends it with a Content-Length header
+    rather than chunked.
+    """
+
+    def __init__(self, path: str, offset: int, length: int, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise OSError(f"{self.path} was truncated during the upload")
+                remaining -= len(chunk)
+                yield chunk
+
+
+class MultipartFormEncoder:
+    """
+    Streams a multipart/form-data body: the form fields, then the file in
+    chunks, then the closing boundary.\n
+    The Content-Length is known up front, and memory use does not depend on
+    the size of the file.
+    """
+
+    def __init__(self, fields: dict[str, str], file_name: str, file: FileChunks):
+        self.boundary = secrets.token_hex(16)
+        self.file = file
+
+        preamble = []
+        for name, value in fields.items():
+            preamble.append(
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n",
+            )
+        # S3 ignores the fields after the file, so it must be the last one
+        file_name = file_name.replace('"', "%22")
+        preamble.append(
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n",
+        )
+        self.preamble = "".join(preamble).encode()
+        self.epilogue = f"\r\n--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.preamble) + len(self.file) + len(self.epilogue)
+
+    def __iter__(self):
+        yield self.preamble
+        yield from self.file
+        yield self.epilogue
+
+
+def get_sha256(path: str, offset: int, length: int) -> str:
+    """
+    Returns the base64-encoded SHA-256 digest of `length` bytes from `offset`, as
+    expected by the x-amz-checksum-sha256 header
+    """
+    sha256 = hashlib.sha256()
+    for chunk in FileChunks(path, offset, length):
+        sha256.update(chunk)
+    return base64.b64encode(sha256.digest()).decode()
+
+
+def with_retries(func, attempts: int, retryable_status_codes=RETRYABLE_STATUS_CODES):
+    """
+    Calls `func` until it succeeds, up to `attempts` times, with exponential
+    backoff and full jitter between the attempts. HTTP errors are retried if
+    their status code is in `retryable_status_codes`.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error: Exception = e
+        except requests.HTTPError as e:
+            if e.response is None or (
+                e.response.status_code not in retryable_status_codes
+            ):
+                raise
+            error = e
+
+        if attempt == attempts:
+            raise error
+        delay = min(MAX_BACKOFF, 2 ** (attempt - 1))
+        time.sleep(random.uniform(0, delay))  # nosec B311
+
+
+class Journal:
+    """
+    Append-only record of the uploads, as JSON lines. The last line for a
+    bucket and key wins.
+    """
+
+    def __init__(self, path: str | None, bucket: str):
+        self.bucket = bucket
+        self.entries: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.file = None
+        if not path:
+            return
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut short by an interrupted run
+                    if entry.get("bucket") == bucket:
+                        self.entries[entry["key"]] = entry
+        self.file = open(path, "a")
+
+    def get(self, file: FileToUpload, status: str) -> dict | None:
+        """
+        Returns the entry for the file, if it has `status` and the file has
+        not changed since
+        """
+        entry = self.entries.get(file.key)
+        if (
+            entry
+            and entry["status"] == status
+            and entry["size"] == file.size
+            and entry["mtimeNs"] == file.mtime_ns
+        ):
+            return entry
+        return None
+
+    def record(self, file: FileToUpload, status: str, **fields):
+        entry = {
+            "bucket": self.bucket,
+            "key": file.key,
+            "path": file.path,
+            "size": file.size,
+            "mtimeNs": file.mtime_ns,
+            "status": status,
+            **fields,
+        }
+        with self.lock:
+            self.entries[file.key] = entry
+            if self.file:
+                self.file.write(json.dumps(entry) + "\n")
+                self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+class Progress:
+    """
+    Prints the files and bytes uploaded, the throughput and the ETA every second
+    """
+
+    def __init__(self, total_files: int, total_bytes: int, skipped: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.skipped = skipped
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.interactive = sys.stderr.isatty()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add_bytes(self, count: int):
+        with self.lock:
+            self.bytes += count
+
+    def file_done(self, succeeded: bool):
+        with self.lock:
+            if succeeded:
+                self.uploaded += 1
+            else:
+                self.failed += 1
+
+    def print(self, message: str):
+        """
+        Prints a message above the progress line
+        """
+        with self.lock:
+            if self.interactive:
+                sys.stderr.write("\r\033[K")
+            print(message, flush=True)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self._print_progress(final=True)
+
+    def _run(self):
+        interval = 1 if self.interactive else 10
+        while not self.stopped.wait(interval):
+            self._print_progress()
+
+    def _print_progress(self, final=False):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            rate = self.bytes / elapsed if elapsed else 0
+            remaining = self.total_bytes - self.bytes
+            eta = (
+                time.strftime("%H:%M:%S", time.gmtime(remaining / rate))
+                if rate
+                else "-"
+            )
+            line = (
+                f"{self.uploaded + self.failed}/{self.total_files} files"
+                f" ({self.failed} failed, {self.skipped} skipped)"
+                f" | {self.bytes / MiB:,.1f}/{self.total_bytes / MiB:,.1f} MiB"
+                f" | {rate / MiB:,.2f} MiB/s"
+                f" | {'elapsed ' + time.strftime('%H:%M:%S', time.gmtime(elapsed)) if final else 'ETA ' + eta}"  # noqa: E501
+            )
+            if self.interactive:
+                sys.stderr.write(f"\r\033[K{line}" + ("\n" if final else ""))
+                sys.stderr.flush()
+            else:
+                print(line, file=sys.stderr, flush=True)
 
-    validate_invoke_url()
-    params = dict(bucket=bucket_name, key=prefix + key_name, kms_key_id=kms_key_id)
-    request = AWSRequest(method, INVOKE_URL, params=params)
-    SigV4Auth(credentials, service, REGION).add_auth(request)
-    presigned_url = get_presigned_post_url(method, request, params)
-    upload_file(presigned_url, filepath, params)
+
+class Uploader:
+    """
+    Uploads files through the presigner API, with a pool of workers sharing
+    one HTTP session
+    """
+
+    def __init__(self, args, credentials, journal: Journal):
+        self.bucket = args.bucket
+        self.kms_key_id = args.kms_key_id
+        self.workers = args.workers
+        self.part_size = args.part_size * MiB
+        self.multipart_threshold = args.multipart_threshold * MiB
+        self.presign_batch = args.presign_batch
+        self.attempts = args.attempts
+        self.verbose = args.verbose
+        self.credentials = credentials
+        self.journal = journal
+        self.progress: Progress
+        self.part_executor = ThreadPoolExecutor(args.workers)
+
+        # Keep-alive connections to API Gateway and S3, for all workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=args.workers * 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def upload(self, files: list[FileToUpload]) -> bool:
+        """
+        Uploads the files, and returns whether all of them were uploaded
+        """
+        pending = [f for f in files if not self.journal.get(f, "uploaded")]
+        skipped = len(files) - len(pending)
+        self.progress = Progress(len(pending), sum(f.size for f in pending), skipped)
+
+        # Small files are presigned in batches; large files are uploaded in parts
+        small = [f for f in pending if f.size < self.multipart_threshold]
+        large = [f for f in pending if f.size >= self.multipart_threshold]
+        batches = [
+            small[i : i + self.presign_batch]  # noqa E203
+            for i in range(0, len(small), self.presign_batch)
+        ]
+
+        try:
+            with ThreadPoolExecutor(self.workers) as executor:
+                futures = [executor.submit(self.upload_batch, b) for b in batches]
+                futures += [executor.submit(self.upload_multipart, f) for f in large]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            self.part_executor.shutdown()
+            self.progress.stop()
+        return self.progress.failed == 0
+
+    def call_api(self, path: str, params) -> dict:
+        """
+        Calls the presigner API with a SigV4-signed request
+        """
+        url = INVOKE_URL.rstrip("/") + path  # type: ignore
+
+        def call():
+            request = AWSRequest("POST", url, params=params)
+            SigV4Auth(self.credentials, "execute-api", REGION).add_auth(request)
+            response = self.session.post(
+                url,
+                headers=dict(request.headers),
+                params=params,
+                timeout=30,
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return with_retries(call, self.attempts)
+
+    def presign_posts(self, files: list[FileToUpload]) -> list[dict]:
+        params = [
+            ("bucket", self.bucket),
+            ("kms_key_id", self.kms_key_id),
+            ("batch", "true"),
+            *[("key", f.key) for f in files],
+            *[("checksum_sha256", f.sha256) for f in files if f.sha256],
+        ]
+        return self.call_api("", params)["posts"]
+
+    def upload_batch(self, files: list[FileToUpload]):
+        try:
+            # The checksum is part of the presigned POST, which precedes the file
+            for file in files:
+                file.sha256 = get_sha256(file.path, 0, file.size)
+            presigned_posts = self.presign_posts(files)
+        except Exception as e:
+            for file in files:
+                self._fail(file, e)
+            return
+
+        for file, presigned_post in zip(files, presigned_posts):
+            try:
+                self.post_file(file, presigned_post)
+            except Exception as e:
+                self._fail(file, e)
+                continue
+            self._succeed(file)
+
+    def post_file(self, file: FileToUpload, presigned_post: dict):
+        posts = [presigned_post]
+
+        def post():
+            # The POST expires with its signature, so retries are presigned again
+            presigned_post = posts.pop() if posts else self.presign_posts([file])[0]
+            body = MultipartFormEncoder(
+                presigned_post["fields"],
+                os.path.basename(file.path),
+                FileChunks(file.path, 0, file.size),
+            )
+            response = self.session.post(  # nosemgrep use-raise-for-status
+                presigned_post["url"],
+                data=body,
+                headers={
+                    "Content-Type": body.content_type,
+                    "x-amz-server-side-encryption": "aws:kms",
+                    "x-amz-server-side-encryption-aws-kms-key-id": self.kms_key_id,
+                },
+                timeout=300,  # Adjust this as necessary
+            )
+            # Successful HTTP status code is 204
+            response.raise_for_status()
+
+        with_retries(post, self.attempts, PRESIGNED_URL_RETRYABLE_STATUS_CODES)
+        self.progress.add_bytes(file.size)
+
+    def upload_multipart(self, file: FileToUpload):
+        try:
+            self._upload_multipart(file)
+        except Exception as e:
+            self._fail(file, e)
+            return
+        self._succeed(file)
+
+    def _upload_multipart(self, file: FileToUpload):
+        params = {"bucket": self.bucket, "key": file.key}
+        entry = self.journal.get(file, "started")
+        upload_id = entry["uploadId"] if entry else None
+        part_size = entry["partSize"] if entry else self.get_part_size(file.size)
+        part_count = max(math.ceil(file.size / part_size), 1)
+        # Uploads started before checksums were sent have none
+        checksums = bool(entry.get("checksumAlgorithm")) if entry else True
+
+        uploaded = set()
+        if upload_id:
+            try:
+                parts = self.call_api(
+                    "/multipart/list",
+                    params | {"upload_id": upload_id},
+                )["parts"]
+                for part in parts:
+                    length = get_part_length(file, part_size, part["partNumber"])
+                    if part["size"] == length:
+                        uploaded.add(part["partNumber"])
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                upload_id = None  # Completed, aborted or expired
+                checksums = True
+
+        if not upload_id:
+            upload_id = self.call_api(
+                "/multipart/create",
+                params
+                | {"kms_key_id": self.kms_key_id, "checksum_algorithm": "SHA256"},
+            )["uploadId"]
+            self.journal.record(
+                file,
+                "started",
+                uploadId=upload_id,
+                partSize=part_size,
+                checksumAlgorithm="SHA256",
+            )
+        else:
+            self.progress.add_bytes(
+                sum(get_part_length(file, part_size, n) for n in uploaded),
+            )
+
+        params |= {"upload_id": upload_id}
+        pending = [n for n in range(1, part_count + 1) if n not in uploaded]
+        # Enough URLs for two parts per worker, as they expire after 5 minutes
+        batch_size = min(self.workers * 2, MAX_PART_URL_BATCH)
+        for i in range(0, len(pending), batch_size):
+            part_numbers = pending[i : i + batch_size]  # noqa E203
+            part_checksums = None
+            if checksums:
+                # The checksums are signed into the URLs, so they come first
+                part_checksums = {
+                    n: get_sha256(
+                        file.path,
+                        (n - 1) * part_size,
+                        get_part_length(file, part_size, n),
+                    )
+                    for n in part_numbers
+                }
+            presigned_parts = self.presign_parts(params, part_numbers, part_checksums)
+            futures = [
+                self.part_executor.submit(
+                    self.put_part,
+                    file,
+                    params,
+                    part_size,
+                    part_number,
+                    presigned_parts[part_number],
+                    part_checksums,
+                )
+                for part_number in part_numbers
+            ]
+            for future in futures:
+                future.result()
+
+        self.call_api("/multipart/complete", params | {"parts": part_count})
+
+    def presign_parts(
+        self,
+        params: dict,
+        part_numbers: list[int],
+        checksums: dict[int, str] | None,
+    ) -> dict[int, dict]:
+        """
+        Returns the presigned URL and headers of each part, with a request per
+        run of consecutive part numbers
+        """
+        runs: list[list[int]] = []
+        for part_number in part_numbers:
+            if runs and runs[-1][-1] == part_number - 1:
+                runs[-1].append(part_number)
+            else:
+                runs.append([part_number])
+
+        presigned_parts = {}
+        for run in runs:
+            run_params = [
+                *params.items(),
+                ("part_number", run[0]),
+                ("count", len(run)),
+                *[("checksum_sha256", checksums[n]) for n in run if checksums],
+            ]
+            response = self.call_api("/multipart/parts", run_params)
+            for part in response["parts"]:
+                presigned_parts[part["partNumber"]] = part
+        return presigned_parts
+
+    def put_part(
+        self,
+        file: FileToUpload,
+        params: dict,
+        part_size: int,
+        part_number: int,
+        presigned_part: dict,
+        checksums: dict[int, str] | None,
+    ):
+        presigned_parts = [presigned_part]
+        length = get_part_length(file, part_size, part_number)
+
+        def put():
+            part = (
+                presigned_parts.pop()
+                if presigned_parts
+                else self.presign_parts(params, [part_number], checksums)[part_number]
+            )
+            data = FileChunks(file.path, (part_number - 1) * part_size, length)
+            response = self.session.put(
+                part["url"],
+                data=data,
+                headers=part.get("headers", {}),
+                timeout=300,
+            )
+            response.raise_for_status()
+
+        with_retries(put, self.attempts, PRESIGNED_URL_RETRYABLE_STATUS_CODES)
+        self.progress.add_bytes(length)
+
+    def get_part_size(self, size: int) -> int:
+        """
+        The configured part size, increased as needed to stay within 10,000 parts
+        """
+        part_size = max(self.part_size, MIN_PART_SIZE)
+        return max(part_size, math.ceil(size / MAX_PARTS / MiB) * MiB)
+
+    def _succeed(self, file: FileToUpload):
+        self.journal.record(file, "uploaded")
+        self.progress.file_done(True)
+        if self.verbose:
+            self.progress.print(
+                f"SUCCESS: {file.path} uploaded to {self.bucket}/{file.key}",
+            )
+
+    def _fail(self, file: FileToUpload, error: Exception):
+        self.progress.file_done(False)
+        self.progress.print(f"ERROR: Could not upload {file.path}: {error}")
+
+
+def get_part_length(file: FileToUpload, part_size: int, part_number: int) -> int:
+    return min(part_size, file.size - (part_number - 1) * part_size)
 
 
 def validate_invoke_url():
@@ -110,42 +685,46 @@ def get_credentials():
     return session.get_credentials()
 
 
-def get_presigned_post_url(method: str, request, params: dict):
-    try:
-        response = requests.request(
-            method,
-            INVOKE_URL,
-            headers=dict(request.headers),
-            params=params,
-            timeout=10,
-        )
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Could not get presigned post url: {e}")
-        raise
-
-
-def upload_file(presigned_url: dict, file_path: str, params: dict):
-    with open(file_path, "rb") as f:
-        files = {"file": (file_path, f)}
-        response = requests.post(  # nosemgrep use-raise-for-status
-            presigned_url["url"],
-            data=presigned_url["fields"],
-            headers={
-                "x-amz-server-side-encryption": "aws:kms",
-                "x-amz-server-side-encryption-aws-kms-key-id": params["kms_key_id"],
-            },
-            files=files,
-            timeout=300,  # Adjust this as necessary
+def find_files(filepath: str, prefix: str) -> list[FileToUpload]:
+    """
+    Returns the file, the files in the directory (recursively) or the files
+    matching the glob pattern. Keys keep the path relative to the directory,
+    or to the directory the pattern starts from.
+    """
+    path = Path(filepath)
+    if path.is_file():
+        matches = [(path, path.name)]
+    elif path.is_dir():
+        matches = [
+            (p, p.relative_to(path).as_posix())
+            for p in sorted(path.rglob("*"))
+            if p.is_file()
+        ]
+    else:
+        base_parts = []
+        for part in path.parts:
+            if any(c in part for c in "*?["):
+                break
+            base_parts.append(part)
+        base = Path(*base_parts) if base_parts else Path(".")
+        matches = [
+            (p, p.relative_to(base).as_posix())
+            for p in map(Path, sorted(glob.glob(filepath, recursive=True)))
+            if p.is_file()
+        ]
+
+    files = []
+    for p, relative_path in matches:
+        stat = p.stat()
+        files.append(
+            FileToUpload(
+                path=get_resolved_file_path(p),
+                key=prefix + relative_path,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+            ),
         )
-
-    try:
-        # Successful HTTP status code is 204
-        response.raise_for_status()
-        print(f"SUCCESS: {file_path} uploaded to {params['bucket']}/{params['key']}")
-    except Exception as e:
-        print(f"Could not upload file: {e}")
+    return files
 
 
 def get_resolved_file_path(path: Path):
@@ -155,9 +734,29 @@ def get_resolved_file_path(path: Path):
     return str(path.resolve())
 
 
+def main(args, credentials) -> bool:
+    validate_invoke_url()
+
+    prefix: str = args.prefix.strip()
+    if prefix:
+        prefix = "/".join([part for part in prefix.split("/") if part]) + "/"
+
+    files = find_files(args.filepath, prefix)
+    if not files:
+        print(f"ERROR: No files found at {args.filepath}")
+        return False
+
+    journal = Journal(args.journal, args.bucket)
+    try:
+        uploader = Uploader(args, credentials, journal)
+        return uploader.upload(files)
+    finally:
+        journal.close()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Gets a pre-signed URL from the specified API Gateway endpoint and uploads a file to a bucket",  # noqa: E501
+        description="Gets pre-signed URLs from the specified API Gateway endpoint and uploads a file, a directory or the files matching a glob pattern to a bucket",  # noqa: E501
         allow_abbrev=False,
     )
 
@@ -165,37 +764,81 @@ if __name__ == "__main__":
         "--bucket",
         required=True,
         type=str,
-        help="Specify the name of a bucket to which you want to upload a file",
+        help="Specify the name of a bucket to which you want to upload files",
     )
 
     parser.add_argument(
         "--filepath",
         required=True,
         type=str,
-        help="Specify the path of a file to upload",
+        help="Specify the path of a file or directory, or a glob pattern, to upload",
     )
 
     parser.add_argument(
         "--kms-key-id",
         required=True,
         type=str,
-        help="Specify the customer-managed KMS key ID to encrypt the file with",  # noqa: E501
+        help="Specify the customer-managed KMS key ID to encrypt the files with",  # noqa: E501
     )
 
     parser.add_argument(
         "--prefix",
         type=str,
         default="",
-        help="(Optional) Specify the prefix to append to the file. Defaults to an empty string",  # noqa: E501
+        help="(Optional) Specify the prefix to append to the files. Defaults to an empty string",  # noqa: E501
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="(Optional) Specify the number of concurrent uploads. Defaults to 4",
+    )
 
-    path = Path(args.filepath)
-    filepath = get_resolved_file_path(path)
-    prefix: str = args.prefix.strip()
-    if prefix:
-        prefix = "/".join([part for part in prefix.split("/") if part]) + "/"
+    parser.add_argument(
+        "--presign-batch",
+        type=int,
+        choices=range(1, MAX_PRESIGN_BATCH + 1),
+        metavar=f"[1-{MAX_PRESIGN_BATCH}]",
+        default=10,
+        help="(Optional) Specify the number of files presigned per API request. Defaults to 10",  # noqa: E501
+    )
+
+    parser.add_argument(
+        "--multipart-threshold",
+        type=int,
+        default=100,
+        help="(Optional) Specify the size in MiB from which files are uploaded in parts. Defaults to 100",  # noqa: E501
+    )
+
+    parser.add_argument(
+        "--part-size",
+        type=int,
+        default=64,
+        help="(Optional) Specify the part size in MiB (at least 5). Defaults to 64",
+    )
+
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=5,
+        help="(Optional) Specify the number of attempts per request. Defaults to 5",
+    )
+
+    parser.add_argument(
+        "--journal",
+        type=str,
+        default="upload_via_apigw_journal.jsonl",
+        help="(Optional) Specify the resume journal, or an empty string for none. Defaults to upload_via_apigw_journal.jsonl",  # noqa: E501
+    )
+
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="(Optional) Print a line for each uploaded file",
+    )
+
+    args = parser.parse_args()
 
     try:
         credentials = get_credentials()
@@ -203,11 +846,5 @@ if __name__ == "__main__":
         print(f"ERROR: {e}")
         sys.exit(1)
 
-    main(
-        bucket_name=args.bucket,
-        key_name=path.name,
-        kms_key_id=args.kms_key_id,
-        prefix=prefix,
-        filepath=filepath,
-        credentials=credentials,
-    )
+    if not main(args, credentials):
+        sys.exit(1)